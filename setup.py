@@ -17,16 +17,6 @@ if [int(dgt) for dgt in requests.__version__.split('.')[:2]] < [2, 0]:
     sys.stderr.write('DomainMapper requires requests v2.0 or later, you can find it at: https://docs.python-requests.org/en/latest/ \n')
     sys.exit()
 
-try:
-    import scipy
-except ImportError:
-    sys.stderr.write('SciPy is not installed, you can find it at: https://scipy.org/ \n')
-    sys.exit()
-
-if [int(dgt) for dgt in scipy.__version__.split('.')[:2]] < [1, 6]:
-    sys.stderr.write('DomainMapper requires scipy v1.6 or later, you can find it at: https://scipy.org/ \n')
-    sys.exit()
-
 try:
     import Bio
 except ImportError:
@@ -37,16 +27,6 @@ if [int(dgt) for dgt in Bio.__version__.split('.')[:2]] < [1, 6]:
     sys.stderr.write('DomainMapper requires BioPython v1.6 or later, you can find it at: https://biopython.org/ \n')
     sys.exit()
 
-try:
-    import numpy
-except ImportError:
-    sys.stderr.write('numpy is not installed, you can find it at: https://numpy.org/ \n')
-    sys.exit()
-
-if [int(dgt) for dgt in numpy.__version__.split('.')[:2]] < [1, 17]:
-    sys.stderr.write('DomainMapper requires numpy v1.17 or later, you can find it at: https://numpy.org/ \n')
-    sys.exit()
-
 if sys.version_info[:2] < (3, 4):
     print("DomainMapper requires Python 3.4 or later. Python {}.{} detected".format(*sys.version_info[:2]))
     print("Please upgrade your version of Python.")
@@ -63,11 +43,12 @@ setup(
     package_dir = {'':'src'},
     install_requires=[
         "requests",
-        "bio",
-        "numpy",
-        "scipy"
+        "bio"
     ],
-    package_data={'': ['ecod.latest.domains.npy']},
+    extras_require={
+        "columnar": ["numpy"]
+    },
+    package_data={'': ['ecod.latest.domains.sst']},
     include_package_data=True,
     scripts=['src/DomainMapper/dommap'],
     python_requires=">=3.5"
@@ -1,298 +1,541 @@
-import re
+import os
 import sys
+import time
 import argparse
-from datetime import datetime
-from Bio.SearchIO import parse
-from DomainMapper import dommap_io, dommap_tools
-from DomainMapper.dommap_data_structures import *
+import importlib.util
+from DomainMapper import dommap_io, dommap_tools, dommap_engine, dommap_batch, dommap_store, dommap_index, dommap_profile, dommap_telemetry, dommap_shard
 
-# Parsing Arguments
-argparser = argparse.ArgumentParser(description=dommap_io.descriptionText)
 
-argparser.add_argument("-f", type=str, default="NULL", help="Input path to file from \'hmmscan\'")
+def mapping_arguments(argparser):
+    """
+    Adds the domain definition and mapping options shared by all commands which map domains
+    """
 
-argparser.add_argument("-o", type=str, default="NULL", help="Output path for mapped domains")
+    argparser.add_argument("--dom_def", default="NULL", type=str, help="Path to ECOD \'Latest Domains\' text file  (default = file is automatically downloaded [165 MB Free Space Required (deleted after parsing)] [2 MB File Saved])")
 
-argparser.add_argument("--dom_def", default="NULL", type=str, help="Path to ECOD \'Latest Domains\' text file  (default = file is automatically downloaded [165 MB Free Space Required (deleted after parsing)] [2 MB File Saved])")
+    argparser.add_argument("--intra_gap", "--intra_domain_gap_tolerance", type=int, default=30, help="Optional minimum gap size within a high-scoring pair for those residues to be carved out, generating a non-contiguous hit (default = 30)")
 
-argparser.add_argument("--intra_gap", "--intra_domain_gap_tolerance", type=int, default=30, help="Optional minimum gap size within a high-scoring pair for those residues to be carved out, generating a non-contiguous hit (default = 30)")
+    argparser.add_argument("--inter_gap", "--inter_domain_gap_tolerance", type=int, default=30, help="Optional minimum gap size between two high-scoring pairs for the residues inbetween to be left out, generating a non-contiguous hit (default = 30)")
 
-argparser.add_argument("--inter_gap", "--inter_domain_gap_tolerance", type=int, default=30, help="Optional minimum gap size between two high-scoring pairs for the residues inbetween to be left out, generating a non-contiguous hit (default = 30)")
+    argparser.add_argument("--overlap", "--domain_overlap_tolerance", type=int, default=40, help="Optional overlap between high-scoring pairs to mandate an elimination  (default = 40)")
 
-argparser.add_argument("--overlap", "--domain_overlap_tolerance", type=int, default=40, help="Optional overlap between high-scoring pairs to mandate an elimination  (default = 40)")
+    argparser.add_argument("--frac_overlap", "--fractional_domain_overlap_tolerance", type=float, default=0.7, help="Optional fractional overlap between high-scoring pairs to mandate an elimination (0.0 - 1.0) (default = 0.7)")
 
-argparser.add_argument("--frac_overlap", "--fractional_domain_overlap_tolerance", type=float, default=0.7, help="Optional fractional overlap between high-scoring pairs to mandate an elimination (0.0 - 1.0) (default = 0.7)")
+    argparser.add_argument("--eval_cutoff", type=float, default=1e-5, help="Optional upper bound tolerance of the E-value (default = 1e-5)")
 
-argparser.add_argument("--eval_cutoff", type=float, default=1e-5, help="Optional upper bound tolerance of the E-value (default = 1e-5)")
+    argparser.add_argument("--parser", type=str, default="native", choices=["native", "biopython"], help="Optional parser for the input hmmscan file, the built in parser is faster while Bio.SearchIO is kept as a fallback (default = native)")
 
-argparser.add_argument("--update", help="Update ECOD \'Latest Domains\'", default=False, action="store_true")
+    argparser.add_argument("--workers", type=int, default=1, help="Optional number of worker processes used to map proteins in parallel (default = 1)")
 
-args = argparser.parse_args()
 
-# Checking if the minimum number of arguments required have been passed
-if len(sys.argv) < 2:
-    dommap_io.error_msg("No Arguments Passed. View help page with \'dommap -h\'")
+def mapping_engine(args, ecod_domain_dict):
+    """
+    Returns the engine for the mapping options, invalid options exit with an error message
+    """
 
-# Checking which domain definitions to use
-if args.dom_def == "NULL":
+    # Domain definitions and mapping options are held by the engine, which validates the options
+    try:
+        return dommap_engine.DomainMapperEngine(ecod_domain_dict, args.intra_gap, args.inter_gap, args.overlap, args.frac_overlap, args.eval_cutoff, args.parser, args.workers)
+    except ValueError as err:
+        dommap_io.error_msg("{} Please ensure all numerical arguments are positive numbers. View help page with \'dommap -h\'".format(err))
 
-    #Dommap will use built in domain definitions
-    if args.update and len(sys.argv) < 3:
 
-        # Update built in domain definitions, recommended if they are older than 2 months
-        dommap_tools.update()
+def load_domain_definitions(args):
+    """
+    Returns the user's domain definitions (`--dom_def`), or the built in ones
+    """
 
-        dommap_io.notice_msg("Latest domain definitions updated.")
+    if args.dom_def == "NULL":
+        return dommap_tools.load()
 
-    if args.update and len(sys.argv) > 2:
-        # Update built in domain definitions, recommended if they are older than 2 months
-        dommap_tools.update()
+    return dommap_tools.load(args.dom_def)
 
-    # Read in built in domain definitions
-    ecod_domain_dict = dommap_tools.load()
 
-else:
+def serve_main(argv):
+    """
+    `dommap serve`, maps hmmscan outputs sent to a local server with the domain definitions and worker processes kept warm
+    """
 
-    # User would like to use their own definitions
-    ecod_domain_dict = dommap_tools.load(args.ecod_domains)
+    argparser = argparse.ArgumentParser(prog="dommap serve", description="Serves DomainMapper over localhost HTTP or a Unix socket. POST a hmmscan output (or GET/POST /map?path=<file> for a file within --map_root) to /map to receive the mapped rows, and GET /stats for request, queue-depth and latency statistics.")
 
-if args.f == "NULL":
-    dommap_io.error_msg("No Input hmmscan file provided. View help page with \'dommap -h\'")
+    argparser.add_argument("--host", type=str, default="127.0.0.1", help="Optional address to serve HTTP on (default = 127.0.0.1)")
 
-if args.o == "NULL":
-    dommap_io.error_msg("No Output path provided. View help page with \'dommap -h\'")
+    argparser.add_argument("--port", type=int, default=8765, help="Optional port to serve HTTP on (default = 8765)")
 
-if args.intra_gap < 0:
-    dommap_io.error_msg("Non-positive option detected for the intra-gap size tolerance. Please ensure all numerical arguments are positive numbers. View help page with \'dommap -h\'")
+    argparser.add_argument("--socket", type=str, default="NULL", help="Optional path of a Unix socket to serve HTTP on instead of a port")
 
-if args.inter_gap < 0:
-    dommap_io.error_msg("Non-positive option detected for the inter-gap size tolerance. Please ensure all numerical arguments are positive numbers. View help page with \'dommap -h\'")
+    argparser.add_argument("--map_root", type=str, default="NULL", help="Optional directory whose hmmscan outputs can be mapped with /map?path=<file> (default = files on the server host are not mapped)")
 
-if args.overlap < 0:
-    dommap_io.error_msg("Non-positive option detected for overlap tolerance. Please ensure all numerical arguments are positive numbers. View help page with \'dommap -h\'")
+    mapping_arguments(argparser)
 
-if args.frac_overlap < 0:
-    dommap_io.error_msg("Non-positive option detected for fractional overlap tolerance. Please ensure all numerical arguments are positive numbers. View help page with \'dommap -h\'")
+    args = argparser.parse_args(argv)
 
-if args.eval_cutoff < 0:
-    dommap_io.error_msg("Non-positive option detected for E-value cuttoff. Please ensure all numerical arguments are positive numbers. View help page with \'dommap -h\'")
+    engine = mapping_engine(args, load_domain_definitions(args))
 
+    # Only imported for the server, as it is not needed to map files
+    from DomainMapper import dommap_serve
 
-# Non-contiguous domain counter
-NC_domain_cnt = 0
+    try:
+        dommap_serve.serve(engine, args.host, args.port, None if args.socket == "NULL" else args.socket, None if args.map_root == "NULL" else args.map_root)
+    except (ValueError, OSError) as err:
+        dommap_io.error_msg(str(err))
 
-# Circular Permutant domain counter
-CP_domain_cnt = 0
 
-# Insertional domain counter
-IS_domain_cnt = 0
+def compile_main(argv):
+    """
+    `dommap compile`, compiles a hmmscan output into a store of its high-scoring pairs which is mapped without parsing the hmmscan output again
+    """
 
-# Total domain counter
-Tot_domain_cnt = 0
+    argparser = argparse.ArgumentParser(prog="dommap compile", description="Compiles a hmmscan output into a memory-mapped store of its high-scoring pairs. Map the store with 'dommap -f <store>' and any mapping options, without parsing the hmmscan output again.")
 
-# Final formatted output
-output_lines = list()
+    argparser.add_argument("-f", type=str, required=True, help="Input path to file from 'hmmscan' (may be gzip, bzip2 or xz compressed)")
 
-# Initial reading of the input hmm file
-hmmscan = parse(args.f,"hmmer3-text")
+    argparser.add_argument("-o", type=str, default="NULL", help="Optional output path of the store (default = input path ending in .dmc instead of a compression extension)")
 
-# Counting total number of proteins from input hmm file
-num_proteins = sum(1 for _ in hmmscan)
+    argparser.add_argument("--parser", type=str, default="native", choices=["native", "biopython"], help="Optional parser for the input hmmscan file (default = native)")
 
-# If proteins were not detected from the input hmm file, then send error message
-# Usually, this is because `--domtblout` was used in HMMER3 instead of `-o`
-if not num_proteins:
+    argparser.add_argument("--force", help="Compile the store even if it is up to date with the input file", default=False, action="store_true")
 
-    err_msg = "Input hmmscan file could not be read. View help page with \'dommap -h\'.\n\nOne common reasons for this error is providing a `hmmscan --domtblout` file instead of a `hmmscan -o` file."
-    
-    dommap_io.error_msg(err_msg)
+    args = argparser.parse_args(argv)
 
-# Initial progess bar
-dommap_io.progress_bar(0, num_proteins, prefix = "Mapping:", suffix = "Complete", length = 50)
+    if args.f == "-":
+        dommap_io.error_msg("Standard input can not be compiled, as the store is keyed by the contents of the input file. View help page with 'dommap compile -h'")
 
-# This is here to make the creation of Domain objects easier
-params = [args.intra_gap, args.inter_gap, args.overlap, args.frac_overlap]
+    store_path = args.o
 
-# Final reading of the input hmm file
-hmmscan = parse(args.f,"hmmer3-text")
+    if store_path == "NULL":
+        store_path = (os.path.splitext(args.f)[0] if dommap_io.output_compression(args.f) is not None else args.f) + ".dmc"
 
-for p_idx, protein in enumerate(hmmscan):
+    try:
 
-    accession = protein.id
+        if dommap_store.is_store(args.f):
+            dommap_io.error_msg("'{}' is already a compiled store.".format(args.f))
 
-    potential_domain_mappings = DomainMap()
+        source_hash = dommap_store.source_hash(args.f)
 
-    mapped_domains = DomainMap()
+        # Stores are keyed by the contents of the hmmscan output they were compiled from
+        if not args.force and os.path.isfile(store_path) and dommap_store.is_store(store_path) and dommap_store.HSPStore(store_path).source_hash == source_hash:
+            dommap_io.notice_msg("'{}' is up to date with '{}'.".format(store_path, args.f))
+            return
 
-    for hit in protein.hits:
+        # Alignments are read for every high-scoring pair, so that the store can be mapped with any E-value cutoff
+        proteins = (protein for protein, _ in dommap_engine.hmmscan_proteins(args.f, args.parser, None))
 
-        # Single high-scoring pair
-        if len(hit.hsps) == 1:
+        n_queries = dommap_store.HSPStore.compile(proteins, source_hash, store_path)
 
-            # Save as Domain() object
-            domain = Domain(hit.hsps[0], *params)
+    except (ValueError, OSError) as err:
+        dommap_io.error_msg(str(err))
 
-            # Keep domain if the E-value is less than or equal to cutoff
-            if domain.e_val <= args.eval_cutoff:
+    if not n_queries:
+        os.remove(store_path)
+        dommap_io.error_msg("Input hmmscan file '{}' could not be read.\n\nOne common reasons for this error is providing a `hmmscan --domtblout` file instead of a `hmmscan -o` file.".format(args.f))
 
-                potential_domain_mappings.append(domain)
-        
-        # Multiple high-scoring pairs
-        # When an alignment has multiple HSPs, these domains can have complex topologies (e.g. non-contiguouity, circular permutant, or both, or just repetitive domains)
-        if len(hit.hsps) > 1:
+    dommap_io.notice_msg("Compiled {} proteins of '{}' to '{}'.".format(n_queries, args.f, store_path))
 
-            # Create a temporary DomainMap() of domain annotations with multiple HSPs
-            # This will then be recursively eliminated so that only the lowest E-Values are retained
-            multi_hsps_domains = DomainMap()
 
-            for hsp in hit.hsps:
-                
-                # Save as Domain() object
-                domain = Domain(hsp, *params)
+def sweep_main(argv):
+    """
+    `dommap sweep`, maps a hmmscan output with every combination of a grid of mapping options from a single parse
+    """
 
-                # Keep domain if the E-value is less than or equal to cutoff
-                if domain.e_val <= args.eval_cutoff:
+    argparser = argparse.ArgumentParser(prog="dommap sweep", description="Maps a hmmscan output with every combination of the given mapping options. Each protein is parsed once and mapped with every combination, an output is written for each combination along with a summary table of their domain counts.")
 
-                    multi_hsps_domains.append(domain)
+    argparser.add_argument("-f", type=str, required=True, help="Input path to file from \'hmmscan\' (may be gzip, bzip2 or xz compressed, or a store from \'dommap compile\') or - for standard input")
 
-            # Eliminate overlapping HSP's
-            multi_hsps_domains.update_overlap_matrix()
+    argparser.add_argument("-o", type=str, required=True, help="Output directory of the mapped domains of each combination and the summary table")
 
-            multi_hsps_domains.eliminate_overlapping_domains()
+    argparser.add_argument("--dom_def", default="NULL", type=str, help="Path to ECOD \'Latest Domains\' text file  (default = built in domain definitions)")
 
-            # Check if any potential non-contig. domains must be combined
-            # By referencing domain_A from [:-1] (all but the last) and domain_B from [a+1:] (from index one more than "A" to the end)
-            # We are guaranteed to only check unique pairs of domans against each other
-            # In a non-contiguous domain, what happens is that the various AA-ranges correspond to distinct portions in the query sequence and in the HMM model
-            
-            if len(multi_hsps_domains) > 1:
+    argparser.add_argument("--intra_gap", "--intra_domain_gap_tolerance", type=int, nargs="+", default=[30], help="Optional values of the intra domain gap tolerance (default = 30)")
 
-                for a,domain_A in enumerate(multi_hsps_domains[:-1]):
+    argparser.add_argument("--inter_gap", "--inter_domain_gap_tolerance", type=int, nargs="+", default=[30], help="Optional values of the inter domain gap tolerance (default = 30)")
 
-                    for b,domain_B in enumerate(multi_hsps_domains[a+1:]):
+    argparser.add_argument("--overlap", "--domain_overlap_tolerance", type=int, nargs="+", default=[40], help="Optional values of the domain overlap tolerance (default = 40)")
 
-                        # If the domains have not been eliminated, check if they can be merged
-                        if domain_A and domain_B and domain_A.f_group == domain_B.f_group:
+    argparser.add_argument("--frac_overlap", "--fractional_domain_overlap_tolerance", type=float, nargs="+", default=[0.7], help="Optional values of the fractional domain overlap tolerance (default = 0.7)")
 
-                            # Merge domains if their query (map) ranges do not overlap
-                            # And if their hmm ranges do not overlap (70% for small domains)
-                            if domain_A.map_intersection(domain_B) <= domain_A.overlap \
-                                and domain_A.map_intersection(domain_B)/float(domain_A.map_len) < args.frac_overlap and domain_A.map_intersection(domain_B)/float(domain_B.map_len) < args.frac_overlap \
-                                    and domain_A.hmm_intersection(domain_B) <= domain_A.overlap \
-                                        and domain_A.hmm_intersection(domain_B)/float(domain_A.hmm_len) < args.frac_overlap and domain_A.hmm_intersection(domain_B)/float(domain_B.hmm_len) < args.frac_overlap:                                
-                                
-                                # Check to see if this is CP
-                                if ((domain_A.map_range[0] < domain_B.map_range[0] and domain_A.hmm_range[0] > domain_B.hmm_range[0]) or (domain_A.map_range[0] > domain_B.map_range[0] and domain_A.hmm_range[0] < domain_B.hmm_range[0])) \
-                                        and domain_A and domain_B and domain_A.f_group == domain_B.f_group:
-                            
-                                    domain_B.update_topology(f"CP")
-                                
-                                domain_B.merge(domain_A)
+    argparser.add_argument("--eval_cutoff", type=float, nargs="+", default=[1e-5], help="Optional values of the E-value cutoff (default = 1e-5)")
 
-                                # Remove domain_A
-                                multi_hsps_domains[a] = None
+    argparser.add_argument("--parser", type=str, default="native", choices=["native", "biopython"], help="Optional parser for the input hmmscan file (default = native)")
 
-                            else:
-                                # Otherwise, retain them, as they could be repetative domains
-                                pass
+    argparser.add_argument("--workers", type=int, default=1, help="Optional number of worker processes used to map proteins in parallel (default = 1)")
 
-            # Remove any domains with low E-values
-            for dom in multi_hsps_domains:
+    args = argparser.parse_args(argv)
 
-                if dom and dom.e_val < args.eval_cutoff:
+    if os.path.isfile(args.o):
+        dommap_io.error_msg("The output path of a sweep must be a directory. View help page with \'dommap sweep -h\'")
 
-                    potential_domain_mappings.append(dom)
+    if args.workers < 1:
+        dommap_io.error_msg("Non-positive option detected for the number of workers. View help page with \'dommap sweep -h\'")
 
-    # Eliminate overlapping HITs
-    potential_domain_mappings.update_overlap_matrix()
+    # Only imported for sweeps, as it is not needed to map files
+    from DomainMapper import dommap_sweep
 
-    potential_domain_mappings.eliminate_overlapping_domains()
+    try:
+        engines = dommap_sweep.sweep_engines(load_domain_definitions(args), args.intra_gap, args.inter_gap, args.overlap, args.frac_overlap, args.eval_cutoff, args.parser)
+    except ValueError as err:
+        dommap_io.error_msg("{} Please ensure all numerical arguments are positive numbers. View help page with \'dommap sweep -h\'".format(err))
 
-    # Final domains
+    try:
+        summary_file, counts = dommap_sweep.sweep_file(engines, args.f, args.o, args.workers, progress = True)
+    except (ValueError, OSError) as err:
+        dommap_io.error_msg(str(err))
 
-    for pot_dom_map in potential_domain_mappings:
+    print("Sweep Summary: {} combinations, written to '{}'".format(len(engines), summary_file))
+    print("    {:>9} {:>9} {:>7} {:>12} {:>11} {:>8} {:>8} {:>6} {:>6} {:>6}".format("intra_gap", "inter_gap", "overlap", "frac_overlap", "eval_cutoff", "proteins", "domains", "NC", "CP", "IS"))
 
-        if pot_dom_map:
+    for engine, engine_counts in zip(engines, counts):
+        print("    {:>9d} {:>9d} {:>7d} {:>12g} {:>11.2e} {:>8d} {:>8d} {:>6d} {:>6d} {:>6d}".format(engine.intra_gap, engine.inter_gap, engine.overlap, engine.frac_overlap, engine.eval_cutoff, *engine_counts))
 
-            mapped_domains.append(pot_dom_map)
-    
-    # Label the insertional domains (domains that lie within non-contiguous domains)
-    if len(mapped_domains) > 1: # only proteins with multiple domains can contain insertional domains
 
-        for a,domain_A in enumerate(mapped_domains):
+def main():
 
-            for b,domain_B in enumerate(mapped_domains):
+    # Commands other than mapping files have their own arguments
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        return commands[sys.argv[1]](sys.argv[2:])
 
-                # Check if domain B resides within domain A
-                # First, create the set of all "missing residues" in A
-                alignment_gap_A = [x for x in range(domain_A.map_range[0],domain_A.map_range[-1]) if x not in domain_A.map_range]
+    # Parsing Arguments
+    argparser = argparse.ArgumentParser(description=dommap_io.descriptionText, epilog="Other commands: " + ", ".join(["dommap {} -h".format(command) for command in commands]))
 
-                num_res_B_in_aln_gap_A = len(set(alignment_gap_A).intersection(set(domain_B.map_range)))
+    argparser.add_argument("-f", type=str, nargs="+", default=[], help="Input path to file from \'hmmscan\' (may be gzip, bzip2 or xz compressed, or a store from \'dommap compile\') or - for standard input, several paths or glob patterns map all files in batch mode")
 
-                # Then, if all of B"s residues (with 15 (default) allowed as exception) lie within a gap of A mark as IS of that domain
-                if num_res_B_in_aln_gap_A > (domain_B.map_len - args.overlap) and (domain_B.map_len - args.overlap) > 0: 
+    argparser.add_argument("-o", type=str, default="NULL", help="Output path for mapped domains (compressed if it ends in .gz, .bz2 or .xz) or - for standard output, or the output directory in batch mode")
 
-                    mapped_domains[b].update_topology(f"IS")
+    argparser.add_argument("--manifest", type=str, default="NULL", help="Optional batch mode input, a tab-separated file with the input path from \'hmmscan\' and the output path of each file on separate lines")
 
-    #Now just output this to a file
-    domain_info = dict()
+    argparser.add_argument("--force", help="Map every file in batch mode, even if its output is up to date", default=False, action="store_true")
 
-    for a,domain in enumerate(mapped_domains):
+    argparser.add_argument("--resume", help="Continue an interrupted run from the last checkpoint kept in \'<output>.journal\'", default=False, action="store_true")
 
-        #reformat the residue range into a nice tidy little string
-        start = domain.map_range[0]
+    argparser.add_argument("--index", help="Also build the index of the output in \'<output>.idx\', which \'dommap query\' uses to look up proteins, F-groups and X-groups", default=False, action="store_true")
 
-        residue_range_as_string = str(start+1)  #the +1 is an artifact caused by BioPython re-indexing 1 to 0.
+    argparser.add_argument("--npz", help="Also write the mapped domains as NumPy arrays to \'<output>.npz\' (requires NumPy)", default=False, action="store_true")
 
-        for i, mr in enumerate(domain.map_range[:-1]):
+    argparser.add_argument("--profile", type=str, nargs="?", default="NULL", const="", help="Optional path of a JSON report of the wall time and calls of each stage of mapping and the slowest proteins (default = \'<output>.profile.json\', or standard error for standard output)")
 
-            if mr + 1  == domain.map_range[i+1]:
+    argparser.add_argument("--profile_slowest", type=int, default=10, help="Optional number of the slowest proteins listed in the profile (default = 10)")
 
-                pass #they"re consecutive
+    argparser.add_argument("--progress_json", type=str, default="NULL", help="Optional path (or - for standard error) of a JSON-lines stream of the progress, mapping rates, estimated time left and memory of the run, for job schedulers to spot stalled or slow runs")
 
-            else:
-                residue_range_as_string += ("-{},{}").format(str(mr+1), str(domain.map_range[i+1]+1)) #Again, +1"s is because of BioPython indexing
+    argparser.add_argument("--progress_interval", type=float, default=5.0, help="Optional seconds between lines of the --progress_json stream (default = 5.0)")
 
-                domain.update_topology(f"NC")
+    mapping_arguments(argparser)
 
-        residue_range_as_string += ("-{}").format(str(domain.map_range[-1]+1))
-        
-        domain.res_str = residue_range_as_string
+    argparser.add_argument("--update", help="Update ECOD \'Latest Domains\'", default=False, action="store_true")
 
-        #try to find the domain in the domain dict else output the F group from the hmmscan
-        if domain.f_group in ecod_domain_dict.keys():
+    args = argparser.parse_args()
 
-            domain.f_id = ecod_domain_dict[domain.f_group][0]
+    # Checking if the minimum number of arguments required have been passed
+    if len(sys.argv) < 2:
+        dommap_io.error_msg("No Arguments Passed. View help page with \'dommap -h\'")
 
-            domain.arch = ecod_domain_dict[domain.f_group][1]
+    # Checking which domain definitions to use
+    if args.dom_def == "NULL":
 
-            domain.x_group = ecod_domain_dict[domain.f_group][2]
+        #Dommap will use built in domain definitions
+        if args.update and len(sys.argv) < 3:
 
-            domain.t_group = ecod_domain_dict[domain.f_group][3]
+            # Update built in domain definitions, recommended if they are older than 2 months
+            dommap_tools.update()
 
-        Tot_domain_cnt += 1 # yes I know taking the len of mapped_domains is fast but this shows future readers of this code where we are taking final count
+            dommap_io.notice_msg("Latest domain definitions updated.")
 
-    # print domains out in order of the first index that appears for a given annotation
-    final_mapped_domains = sorted(mapped_domains, key = lambda dom: int(dom.map_range[0]))
-    
-    for dom in final_mapped_domains:
+        if args.update and len(sys.argv) > 2:
+            # Update built in domain definitions, recommended if they are older than 2 months
+            dommap_tools.update()
 
-        if "CP" in dom.topology:
-            CP_domain_cnt += 1
-        if "NC" in dom.topology:
-            NC_domain_cnt += 1
-        if "IS" in dom.topology:
-            IS_domain_cnt += 1
+    # Read in built in domain definitions, or the user's own definitions
+    ecod_domain_dict = load_domain_definitions(args)
 
-        output_lines.append(("{}\t"*9).format(accession, f"{dom.e_val:3.2e}", dom.res_str, " ".join([top for top in dom.topology]), dom.arch, dom.x_group, dom.t_group, dom.f_group, dom.f_id)+"\n")
+    if not args.f and args.manifest == "NULL":
+        dommap_io.error_msg("No Input hmmscan file provided. View help page with \'dommap -h\'")
 
-    dommap_io.progress_bar(p_idx + 1, num_proteins, prefix = "Mapping:", suffix = "Complete", length = 50)
+    if args.o == "NULL" and args.manifest == "NULL":
+        dommap_io.error_msg("No Output path provided. View help page with \'dommap -h\'")
 
-with open(args.o, "w") as mapped_domains_file:
+    engine = mapping_engine(args, ecod_domain_dict)
 
-    mapped_domains_file.write(
-        dommap_io.file_header(datetime.now(), args.f, args.o, args.intra_gap, args.inter_gap, args.overlap, args.eval_cutoff, num_proteins, Tot_domain_cnt, NC_domain_cnt, CP_domain_cnt, IS_domain_cnt))
+    # Input files, glob patterns are expanded here as shells on some systems do not
+    try:
+        in_files = dommap_batch.input_paths(args.f)
+    except ValueError as err:
+        dommap_io.error_msg("{} View help page with \'dommap -h\'".format(err))
 
-    for line in output_lines:
-        
-        mapped_domains_file.write(line)
+    batch = dommap_batch.batch_mode(args.f, args.o, args.manifest != "NULL")
+
+    if args.npz:
+
+        if args.o == "-":
+            dommap_io.error_msg("The columnar output can not be written to standard output. View help page with \'dommap -h\'")
+
+        if importlib.util.find_spec("numpy") is None:
+            dommap_io.error_msg("The columnar output requires NumPy, which can be installed with \'pip install DomainMapper[columnar]\'.")
+
+    if args.index and (args.o == "-" or (not batch and dommap_io.output_compression(args.o) is not None)):
+        dommap_io.error_msg("Only uncompressed output files can be indexed. View help page with \'dommap -h\'")
+
+    if args.progress_interval <= 0:
+        dommap_io.error_msg("Non-positive option detected for the progress interval. View help page with \'dommap -h\'")
+
+    # The progress stream is only written with `--progress_json`
+    try:
+        telemetry = dommap_telemetry.ProgressTelemetry(sys.stderr if args.progress_json == "-" else args.progress_json, args.progress_interval) if args.progress_json != "NULL" else None
+    except OSError as err:
+        dommap_io.error_msg(str(err))
+
+    if batch:
+
+        if "-" in in_files or args.o == "-":
+            dommap_io.error_msg("Standard input and output can only be used to map a single file. View help page with \'dommap -h\'")
+
+        if args.profile != "NULL":
+            dommap_io.error_msg("Only a single file can be profiled. View help page with \'dommap -h\'")
+
+        run_batch(engine, in_files, args, telemetry)
+
+        return
+
+    # The profile is only kept with `--profile`, so that mapping is not slowed down otherwise
+    profile = dommap_profile.MapProfile(args.profile_slowest) if args.profile != "NULL" else None
+
+    start_time = time.perf_counter()
+
+    # Proteins are mapped and written out as they are parsed from the input hmm file, or by a pool of worker processes with `--workers`
+    try:
+        engine.map_file(in_files[0], args.o, progress = True, resume = args.resume, npz = args.npz, index = args.index, profile = profile, telemetry = telemetry)
+
+        if profile is not None:
+            write_profile(profile, engine, in_files[0], args, time.perf_counter() - start_time)
+    except ValueError as err:
+        dommap_io.error_msg("{} View help page with \'dommap -h\'.".format(err))
+    except BrokenPipeError:
+        # The reader of standard output has stopped (e.g. `| head`), the rest of the output is discarded
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except OSError as err:
+        dommap_io.error_msg(str(err))
+    finally:
+        if telemetry is not None:
+            telemetry.close()
+
+
+def write_profile(profile, engine, in_file, args, elapsed):
+    """
+    Writes the profile report of a mapped file to `--profile`, next to the output by default
+    """
+
+    report_file = args.profile or (sys.stderr if args.o == "-" else args.o + ".profile.json")
+
+    profile.write(report_file, input = in_file, output = args.o, parser = engine.parser, workers = engine.workers, elapsed_seconds = round(elapsed, 6),
+                  options = {"intra_gap": engine.intra_gap, "inter_gap": engine.inter_gap, "overlap": engine.overlap, "frac_overlap": engine.frac_overlap, "eval_cutoff": engine.eval_cutoff})
+
+    if report_file is not sys.stderr:
+        dommap_io.notice_msg("Profile written to '{}'.".format(report_file))
+
+
+def query_main(argv):
+    """
+    `dommap query`, looks up the rows of proteins, F-groups or X-groups in a mapped output through its index
+    """
+
+    argparser = argparse.ArgumentParser(prog="dommap query", description="Prints the rows of the given proteins, F-groups and X-groups of a mapped output. Rows are looked up through the index of the output (built with 'dommap --index', or by this command if it is missing or out of date) without reading the rest of the output.")
+
+    argparser.add_argument("-f", type=str, required=True, help="Path to an uncompressed output of 'dommap'")
+
+    argparser.add_argument("-a", "--accession", type=str, nargs="+", default=[], help="Optional protein accessions to look up")
+
+    argparser.add_argument("--accession_file", type=str, default="NULL", help="Optional file of protein accessions to look up, one per line")
+
+    argparser.add_argument("--f_group", type=str, nargs="+", default=[], help="Optional F-groups to look up")
+
+    argparser.add_argument("--x_group", type=str, nargs="+", default=[], help="Optional X-groups to look up")
+
+    argparser.add_argument("--build", help="Build the index again, even if it is up to date", default=False, action="store_true")
+
+    args = argparser.parse_args(argv)
+
+    accessions = list(args.accession)
+
+    try:
+
+        if args.accession_file != "NULL":
+            with open(args.accession_file, "r") as accession_file:
+                accessions.extend(line.strip() for line in accession_file if line.strip())
+
+        if args.build or not dommap_index.is_current(args.f):
+
+            if not args.build:
+                dommap_io.notice_msg("Building the index of '{}'.".format(args.f))
+
+            dommap_index.OutputIndex.build(args.f)
+
+        index = dommap_index.OutputIndex(args.f)
+
+    except (ValueError, OSError) as err:
+        dommap_io.error_msg(str(err))
+
+    try:
+
+        for accession in accessions:
+            sys.stdout.writelines(index.accession_rows(accession))
+
+        for column, names in (("f_group", args.f_group), ("x_group", args.x_group)):
+            for name in names:
+                sys.stdout.writelines(index.group_rows(column, name))
+
+        sys.stdout.flush()
+
+    except BrokenPipeError:
+        # The reader of standard output has stopped (e.g. `| head`), the rest of the rows are discarded
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+def split_main(argv):
+    """
+    `dommap split`, splits a hmmscan output into shards which are mapped on separate nodes
+    """
+
+    argparser = argparse.ArgumentParser(prog="dommap split", description="Splits a hmmscan output into shards of about the same size, cut between queries without parsing them. Map each shard on its own (e.g. on separate cluster nodes) with the same mapping options, and merge their outputs with 'dommap merge'.")
+
+    argparser.add_argument("-f", type=str, required=True, help="Input path to file from \'hmmscan\' (may be gzip, bzip2 or xz compressed)")
+
+    argparser.add_argument("-n", "--shards", type=int, required=True, help="Number of shards")
+
+    argparser.add_argument("-o", type=str, default=None, help="Optional output directory of the shards, named <name>.shard<N>.hmm.out (default = directory of the input file)")
+
+    args = argparser.parse_args(argv)
+
+    try:
+        shards = dommap_shard.split_file(args.f, args.shards, args.o)
+    except (ValueError, OSError) as err:
+        dommap_io.error_msg(str(err))
+
+    if not shards:
+        dommap_io.error_msg("Input hmmscan file \'{}\' could not be read.\n\nOne common reasons for this error is providing a `hmmscan --domtblout` file instead of a `hmmscan -o` file.".format(args.f))
+
+    if len(shards) < args.shards:
+        dommap_io.warning_msg("\'{}\' has fewer queries than shards, it was split into {} shards.".format(args.f, len(shards)))
+
+    for shard_file, n_queries, shard_size in shards:
+        print("{}\t{} queries\t{} bytes".format(shard_file, n_queries, shard_size))
+
+
+def merge_main(argv):
+    """
+    `dommap merge`, merges the mapped outputs of the shards of a hmmscan output into a single output
+    """
+
+    argparser = argparse.ArgumentParser(prog="dommap merge", description="Merges the outputs of the shards from \'dommap split\' into a single output, in the order they are given. The domain counts of the header are counted again, so the merged output is the same as mapping the whole hmmscan output at once, apart from the time it was executed on.")
+
+    argparser.add_argument("-f", type=str, nargs="+", required=True, help="Outputs of the mapped shards in input order, or quoted glob patterns (e.g. \'mapped/name.shard*.mapped.out\', which are merged in sorted order)")
+
+    argparser.add_argument("-o", type=str, required=True, help="Output path of the merged output (compressed if it ends in .gz, .bz2 or .xz) or - for standard output")
+
+    argparser.add_argument("--input", type=str, default=None, help="Optional input path listed in the header of the merged output (default = input of the first shard without its shard number)")
+
+    args = argparser.parse_args(argv)
+
+    try:
+        dommap_shard.merge_outputs(dommap_batch.input_paths(args.f), args.o, args.input)
+    except (ValueError, OSError) as err:
+        dommap_io.error_msg(str(err))
+
+
+def run_batch(engine, in_files, args, telemetry = None):
+    """
+    Maps every input file (and every file of the manifest) with the same engine, the output of each input file is written to the output directory.
+    Files are mapped by a shared pool of `--workers` processes and an aggregate summary is printed once all files are done.
+    With `--progress_json` a "file" line is written to the telemetry as each file is done.
+    """
+
+    file_pairs = list()
+
+    if in_files:
+
+        if os.path.isfile(args.o):
+            dommap_io.error_msg("The output path must be a directory when several input files are provided. View help page with \'dommap -h\'")
+
+        os.makedirs(args.o, exist_ok = True)
+
+        file_pairs.extend((in_file, dommap_batch.output_path(in_file, args.o)) for in_file in in_files)
+
+    if args.manifest != "NULL":
+
+        try:
+            file_pairs.extend(dommap_batch.read_manifest(args.manifest))
+        except (ValueError, OSError) as err:
+            dommap_io.error_msg(str(err))
+
+    if not file_pairs:
+        dommap_io.error_msg("No Input hmmscan file provided. View help page with \'dommap -h\'")
+
+    start_time = time.perf_counter()
+
+    counts = [0, 0, 0, 0, 0]
+
+    status_cnt = {"mapped": 0, "skipped": 0, "failed": 0}
+
+    progress_bar = dommap_io.ProgressBar(len(file_pairs), prefix = "Mapping:", suffix = "Files Complete", length = 50)
+
+    progress_bar.update(0)
+
+    try:
+
+        for file_num, result in enumerate(dommap_batch.map_batch(engine, file_pairs, args.workers, args.force, args.resume, args.npz, args.index), 1):
+
+            status_cnt[result.status] += 1
+
+            if result.status == "mapped":
+                counts = [cnt + file_cnt for cnt, file_cnt in zip(counts, result.counts)]
+
+            if result.status == "failed":
+                # Start a new line below the progress bar
+                if progress_bar.enabled:
+                    print()
+                dommap_io.warning_msg("'{}' was not mapped. {}".format(result.in_file, result.error))
+
+            progress_bar.update(file_num)
+
+            if telemetry is not None:
+
+                elapsed = time.perf_counter() - start_time
+
+                telemetry.line("file", in_file = result.in_file, in_size = None, out_file = result.out_file, status = result.status, error = result.error,
+                               file_proteins = result.counts.proteins if result.counts is not None else None, file_domains = result.counts.domains if result.counts is not None else None,
+                               files = file_num, files_total = len(file_pairs), proteins = counts[0], domains = counts[1],
+                               files_per_second = round(file_num/elapsed, 3), eta_seconds = round(elapsed*(len(file_pairs) - file_num)/file_num, 1))
+
+    except ValueError as err:
+        dommap_io.error_msg(str(err))
+    finally:
+        if telemetry is not None:
+            telemetry.close()
+
+    Tot_prot_cnt, Tot_cnt, NC_cnt, CP_cnt, IS_cnt = counts
+
+    # Domains of skipped files are not counted, their outputs hold their own counts
+    Tot_frac = float(Tot_cnt) if Tot_cnt else 1.0
+
+    print("Batch Summary:")
+    print("    Files:          {:6d} mapped, {} skipped (up to date), {} failed".format(status_cnt["mapped"], status_cnt["skipped"], status_cnt["failed"]))
+    print("    Total Proteins: {:6d}         Total Domains:  {:6d}".format(Tot_prot_cnt, Tot_cnt))
+    print("    NC : {:d} ({:.2%})    CP : {:d} ({:.2%})    IS : {:d} ({:.2%})".format(NC_cnt, NC_cnt/Tot_frac, CP_cnt, CP_cnt/Tot_frac, IS_cnt, IS_cnt/Tot_frac))
+    print("    Elapsed:        {:.1f} s".format(time.perf_counter() - start_time))
+
+    if status_cnt["failed"]:
+        dommap_io.error_msg("{} of {} files could not be mapped.".format(status_cnt["failed"], len(file_pairs)))
+
+# Commands and their entry points, `dommap <command> -h` shows the help page of each command
+commands = {
+    "serve": serve_main,
+    "compile": compile_main,
+    "sweep": sweep_main,
+    "query": query_main,
+    "split": split_main,
+    "merge": merge_main,
+}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# dommmap_batch.py
+# This file contains the batch mode, which maps many hmmscan files with the domain definitions loaded once and a shared pool of worker processes
+
+import os
+
+import glob
+
+import time
+
+from typing import NamedTuple
+
+from functools import partial
+
+from multiprocessing import Pool
+
+from DomainMapper import dommap_io, dommap_index
+
+from DomainMapper.dommap_engine import DomainMapperEngine, MapCounts, columnar_path
+
+
+class BatchResult(NamedTuple):
+    """
+    Outcome of a single file of a batch, `counts` is `None` unless the file was mapped and `error` is `None` unless it failed
+    """
+
+    in_file: str
+
+    out_file: str
+
+    status: str
+
+    counts: MapCounts
+
+    error: str
+
+    seconds: float
+
+
+def input_paths(paths: list):
+    """
+    Returns the input paths with glob patterns expanded, in the order they were given
+
+    Parameters
+    ------------
+    paths : list
+    Paths to files from `hmmscan -o` or glob patterns (e.g. "genomes/*.hmm.out")
+    """
+
+    in_files = list()
+
+    for path in paths:
+
+        if glob.has_magic(path):
+
+            matches = sorted(glob.glob(path))
+
+            if not matches:
+                raise ValueError("No input hmmscan files match '{}'.".format(path))
+
+            in_files.extend(matches)
+
+        else:
+            in_files.append(path)
+
+    return in_files
+
+
+def batch_mode(paths: list, out_path: str, manifest: bool = False):
+    """
+    Returns whether files are mapped in batch mode, which is decided from the arguments rather than from the number of input files:
+    several input paths, any glob pattern (even one which matches a single file), a manifest, or an output path which is an existing directory
+
+    Parameters
+    ------------
+    paths : list
+    Input paths or glob patterns as given to `dommap -f`
+
+    out_path : str
+    Output path as given to `dommap -o`
+
+    manifest : bool
+    Whether a manifest of input and output paths is given (default = False)
+    """
+
+    return len(paths) > 1 or any(glob.has_magic(path) for path in paths) or manifest or os.path.isdir(out_path)
+
+
+def output_path(in_file: str, out_dir: str):
+    """
+    Returns the output path of an input file within the output directory, `name.hmm.out` (or a compressed `name.hmm.out.gz`, or a compiled `name.hmm.out.dmc`) is mapped to `name.mapped.out`
+    """
+
+    name = os.path.basename(in_file)
+
+    if dommap_io.output_compression(name) is not None or name.endswith(".dmc"):
+        name = os.path.splitext(name)[0]
+
+    if name.endswith(".hmm.out"):
+        name = name[:-len(".hmm.out")]
+
+    return os.path.join(out_dir, name + ".mapped.out")
+
+
+def read_manifest(manifest_path: str):
+    """
+    Reads a manifest of input and output paths, one tab-separated pair per line.
+    Empty lines and lines starting with '#' are ignored, relative paths are relative to the manifest.
+
+    Returns
+    ------------
+    file_pairs : list
+    (in_file, out_file) for each line of the manifest
+    """
+
+    manifest_dir = os.path.dirname(manifest_path)
+
+    file_pairs = list()
+
+    with open(manifest_path, "r") as manifest_file:
+
+        for line_num, line in enumerate(manifest_file, 1):
+
+            if not line.strip() or line.startswith("#"):
+                continue
+
+            paths = line.rstrip("\r\n").split("\t")
+
+            if len(paths) != 2:
+                raise ValueError("Line {} of manifest '{}' does not have an input and an output path separated by a tab.".format(line_num, manifest_path))
+
+            file_pairs.append(tuple(os.path.join(manifest_dir, path) for path in paths))
+
+    return file_pairs
+
+
+def up_to_date(engine: DomainMapperEngine, in_file: str, out_file: str, npz: bool = False, index: bool = False):
+    """
+    Checks if the output of an input file is complete, newer than the input and was mapped with the same options as the engine,
+    with `npz` that its columnar output is also newer than the input, and with `index` that its index is up to date
+    """
+
+    if not os.path.exists(out_file) or os.path.getmtime(out_file) < os.path.getmtime(in_file):
+        return False
+
+    if npz and (not os.path.exists(columnar_path(out_file)) or os.path.getmtime(columnar_path(out_file)) < os.path.getmtime(in_file)):
+        return False
+
+    if index and not dommap_index.is_current(out_file):
+        return False
+
+    expected_header = dommap_io.file_header("", in_file, out_file, engine.intra_gap, engine.inter_gap, engine.overlap, engine.frac_overlap, engine.eval_cutoff, 0, 0, 0, 0, 0).split("\n")
+
+    with dommap_io.open_input(out_file, "r") as mapped_file:
+        header = [mapped_file.readline().rstrip("\n") for _ in expected_header]
+
+    # Options are listed after the input and output paths
+    options_start = expected_header.index("#  Options:")
+
+    options_end = expected_header.index("#  Domain Counts:")
+
+    if header[options_start:options_end] != expected_header[options_start:options_end]:
+        return False
+
+    # The domain counts are only filled in once the output is complete, and every output has at least one protein
+    try:
+        return int(header[options_end + 1].split("Total Proteins:")[1].split()[0]) > 0
+    except (IndexError, ValueError):
+        return False
+
+
+# Engine of a batch worker process, this is set once by the pool initializer
+__batch_engine = None
+
+
+def __init_batch_worker(engine):
+    global __batch_engine
+    __batch_engine = engine
+
+    # Worker processes can not start pools of their own
+    __batch_engine.workers = 1
+
+
+def __map_batch_file(file_pair, engine = None, resume = False, npz = False, index = False):
+    """
+    Maps a single file of a batch with the given engine or the engine of this worker process.
+    Errors of a single file are returned so that the rest of the batch can continue.
+    """
+
+    in_file, out_file = file_pair
+
+    start_time = time.perf_counter()
+
+    try:
+        counts = (engine or __batch_engine).map_file(in_file, out_file, resume = resume, npz = npz, index = index)
+    except (ValueError, OSError) as err:
+        return BatchResult(in_file, out_file, "failed", None, str(err), time.perf_counter() - start_time)
+
+    return BatchResult(in_file, out_file, "mapped", counts, None, time.perf_counter() - start_time)
+
+
+def map_batch(engine: DomainMapperEngine, file_pairs: list, workers: int = 1, force: bool = False, resume: bool = False, npz: bool = False, index: bool = False):
+    """
+    This function maps many hmmscan files with a single engine.
+    Files are scheduled over a shared pool of worker processes with the largest files first, so that no large file is left for last,
+    and every worker reuses the domain definitions of the engine.
+
+    Parameters
+    ------------
+    engine : DomainMapperEngine
+    Domain definitions and mapping options used for every file
+
+    file_pairs : list
+    (in_file, out_file) for each file of the batch
+
+    workers : int
+    Number of files mapped at the same time, each by its own worker process (default = 1, files are mapped one at a time by the engine)
+
+    force : bool
+    Map files even if their outputs are up to date (default = False)
+
+    resume : bool
+    Continue files which were interrupted from the last checkpoint of their journal (default = False)
+
+    npz : bool
+    Also write the mapped domains of each file as NumPy arrays next to its output (default = False)
+
+    index : bool
+    Build the index of each output, see dommap_index (default = False)
+
+    Returns
+    ------------
+    results : generator
+    Yields a BatchResult for each file, skipped files first and the rest as they are completed
+    """
+
+    out_files = [out_file for _, out_file in file_pairs]
+
+    if len(set(out_files)) != len(out_files):
+        raise ValueError("Several input files of the batch share the same output path.")
+
+    pending = list()
+
+    for in_file, out_file in file_pairs:
+
+        if not os.path.exists(in_file):
+            yield BatchResult(in_file, out_file, "failed", None, "'{}' could not be found.".format(in_file), 0.0)
+
+        elif not force and up_to_date(engine, in_file, out_file, npz, index):
+            yield BatchResult(in_file, out_file, "skipped", None, None, 0.0)
+
+        else:
+            pending.append((in_file, out_file))
+
+    # Largest files first
+    pending.sort(key = lambda file_pair: os.path.getsize(file_pair[0]), reverse = True)
+
+    if workers > 1 and len(pending) > 1:
+
+        with Pool(min(workers, len(pending)), initializer = __init_batch_worker, initargs = (engine,)) as pool:
+            yield from pool.imap_unordered(partial(__map_batch_file, resume = resume, npz = npz, index = index), pending)
+
+    else:
+
+        # Proteins of each file are still mapped in parallel if the engine has several workers
+        for file_pair in pending:
+            yield __map_batch_file(file_pair, engine, resume, npz, index)
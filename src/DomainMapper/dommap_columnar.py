@@ -0,0 +1,339 @@
+# dommmap_columnar.py
+# This file contains the columnar output, mapped domains written as NumPy arrays in an uncompressed .npz file which is loaded through memory maps
+
+import os
+
+import json
+
+import shutil
+
+import struct
+
+import zipfile
+
+import tempfile
+
+from array import array
+
+import numpy as np
+
+from DomainMapper.dommap_io import topology_order
+
+
+# Columns of ECOD names, each is stored as codes into an array of its distinct values
+dictionary_columns = ("arch", "x_group", "t_group", "f_group", "f_id")
+
+# Flag of each topology in the `topology` column, NC = 1, CP = 2 and IS = 4
+topology_flags = {topology: 1 << i for i, topology in enumerate(topology_order)}
+
+
+class ColumnarWriter:
+    """
+    Writes mapped domains to an uncompressed .npz file as they are mapped, one row per domain as in the text output.
+    Rows are streamed to a temporary file per column, which are packed into the .npz file with the header attributes when the writer is closed.
+    Every column is aligned within the file, so that `load` memory maps the columns instead of reading them. `numpy.load` also reads the file.
+
+    Columns
+    ------------
+    protein : uint32
+    Index of the protein of each domain in `accession`
+
+    accession : str
+    Accession of each protein with at least one domain
+
+    e_val : float64
+    Conditional E-value of each domain, not rounded as in the text output
+
+    segment_start : uint64 (domains + 1)
+    Index of the first residue segment of each domain in `segments`
+
+    segments : int32 (segments, 2)
+    Residue segments of each domain as 0-based, end exclusive (start, end) pairs
+
+    topology : uint8
+    Topology flags of each domain, see `topology_flags`
+
+    arch, x_group, t_group, f_group, f_id : uint32
+    ECOD names of each domain, as codes into the `<column>_values` arrays of their distinct values
+
+    attributes : str
+    JSON of the mapping options and domain counts listed in the header of the text output, and the topology flags
+    """
+
+    # Column data is aligned to this many bytes within the file, as the .npy header of each column is padded to a multiple of 64 bytes
+    __align = 64
+
+    # Column name, array typecode and number of values per row
+    __columns = (("protein", "I", 1), ("e_val", "d", 1), ("segment_start", "Q", 1), ("segments", "i", 2), ("topology", "B", 1)) + tuple((name, "I", 1) for name in dictionary_columns)
+
+    def __init__(self, npz_file: str, buffer_rows: int = 65536):
+
+        self.npz_file = npz_file
+
+        self.buffer_rows = buffer_rows
+
+        self.tmp_dir = tempfile.mkdtemp(prefix = os.path.basename(npz_file) + ".", dir = os.path.dirname(os.path.abspath(npz_file)))
+
+        self.buffers = {name: array(typecode) for name, typecode, _ in self.__columns}
+
+        self.column_files = {name: open(os.path.join(self.tmp_dir, name), "wb") for name, _, _ in self.__columns}
+
+        self.accession_file = open(os.path.join(self.tmp_dir, "accession"), "w", encoding = "utf-8")
+
+        self.n_proteins = 0
+
+        self.n_domains = 0
+
+        self.n_segments = 0
+
+        self.accession_len = 1
+
+        # Distinct values of each ECOD name column, and their codes
+        self.values = {name: dict() for name in dictionary_columns}
+
+        self.buffers["segment_start"].append(0)
+
+    def write_domains(self, accession: str, domains):
+        """
+        Writes the domains of a single protein, each given as (e_val, segments, topology, arch, x_group, t_group, f_group, f_id)
+        """
+
+        if not domains:
+            return
+
+        self.accession_file.write(accession + "\n")
+
+        self.accession_len = max(self.accession_len, len(accession))
+
+        buffers = self.buffers
+
+        for e_val, segments, topology, *ecod_names in domains:
+
+            buffers["protein"].append(self.n_proteins)
+
+            buffers["e_val"].append(e_val)
+
+            for start, end in segments:
+                buffers["segments"].extend((start, end))
+
+            self.n_segments += len(segments)
+
+            buffers["segment_start"].append(self.n_segments)
+
+            buffers["topology"].append(sum(flag for topology_name, flag in topology_flags.items() if topology_name in topology))
+
+            for name, value in zip(dictionary_columns, ecod_names):
+                buffers[name].append(self.values[name].setdefault(value, len(self.values[name])))
+
+        self.n_proteins += 1
+
+        self.n_domains += len(domains)
+
+        if len(buffers["protein"]) >= self.buffer_rows:
+            self.__flush()
+
+    def write_records(self, records):
+        """
+        Writes the domain records (dommap_engine.DomainRecord) of a single protein
+        """
+
+        if records:
+            self.write_domains(records[0].accession, [(rec.e_val, rec.segments, rec.topology, rec.arch, rec.x_group, rec.t_group, rec.f_group, rec.f_id) for rec in records])
+
+    def __flush(self):
+
+        for name, buffer in self.buffers.items():
+            buffer.tofile(self.column_files[name])
+            del buffer[:]
+
+    def close(self, attributes: dict):
+        """
+        Packs the columns and the header attributes into the .npz file, and removes the temporary column files
+        """
+
+        self.__flush()
+
+        for column_file in self.column_files.values():
+            column_file.close()
+
+        self.accession_file.close()
+
+        shapes = {"protein": (self.n_domains,), "e_val": (self.n_domains,), "segment_start": (self.n_domains + 1,), "segments": (self.n_segments, 2), "topology": (self.n_domains,)}
+
+        tmp_path = self.npz_file + ".tmp"
+
+        try:
+
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED, allowZip64 = True) as npz:
+
+                for name, typecode, _ in self.__columns:
+
+                    with open(os.path.join(self.tmp_dir, name), "rb") as column_file:
+                        ColumnarWriter.__write_column(npz, name, np.dtype(typecode), shapes.get(name, (self.n_domains,)), column_file)
+
+                ColumnarWriter.__write_accessions(npz, os.path.join(self.tmp_dir, "accession"), self.n_proteins, self.accession_len)
+
+                for name in dictionary_columns:
+                    ColumnarWriter.__write_array(npz, name + "_values", np.array(list(self.values[name]), dtype = str))
+
+                ColumnarWriter.__write_array(npz, "attributes", np.array(json.dumps(dict(attributes, topology_flags = topology_flags))))
+
+            os.replace(tmp_path, self.npz_file)
+
+        finally:
+
+            shutil.rmtree(self.tmp_dir, ignore_errors = True)
+
+    @staticmethod
+    def __open_member(npz, name: str):
+        """
+        Opens a new .npy member of the archive, padded so that the data of the member starts on an aligned offset
+        """
+
+        member = zipfile.ZipInfo(name + ".npy")
+
+        member.compress_type = zipfile.ZIP_STORED
+
+        # Local file header (30 bytes), member name, padding extra field and the zip64 extra field (20 bytes) written by `force_zip64`
+        header_len = 30 + len(member.filename.encode()) + 4 + 20
+
+        pad = -(npz.fp.tell() + header_len) % ColumnarWriter.__align
+
+        member.extra = struct.pack("<HH", 0xD935, pad) + bytes(pad)
+
+        return npz.open(member, "w", force_zip64 = True)
+
+    @staticmethod
+    def __write_column(npz, name: str, dtype, shape: tuple, column_file):
+
+        with ColumnarWriter.__open_member(npz, name) as member:
+
+            np.lib.format.write_array_header_1_0(member, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape})
+
+            shutil.copyfileobj(column_file, member, 1048576)
+
+    @staticmethod
+    def __write_accessions(npz, accession_path: str, n_proteins: int, accession_len: int, chunk_rows: int = 65536):
+
+        dtype = np.dtype("U{}".format(accession_len))
+
+        with ColumnarWriter.__open_member(npz, "accession") as member, open(accession_path, "r", encoding = "utf-8") as accession_file:
+
+            np.lib.format.write_array_header_1_0(member, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (n_proteins,)})
+
+            chunk = list()
+
+            for line in accession_file:
+
+                chunk.append(line[:-1])
+
+                if len(chunk) == chunk_rows:
+                    member.write(np.array(chunk, dtype = dtype).tobytes())
+                    chunk.clear()
+
+            member.write(np.array(chunk, dtype = dtype).tobytes())
+
+    @staticmethod
+    def __write_array(npz, name: str, values):
+
+        with ColumnarWriter.__open_member(npz, name) as member:
+            np.lib.format.write_array(member, values)
+
+
+class ColumnarDomains:
+    """
+    Mapped domains loaded from a columnar output, every column is a read-only memory map of the .npz file.
+    Columns are looked up by name (e.g. `domains["e_val"]`), see `ColumnarWriter` for the columns, and `attributes` holds the header attributes.
+    """
+
+    def __init__(self, columns: dict, attributes: dict):
+
+        self.columns = columns
+
+        self.attributes = attributes
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns["e_val"])
+
+    def keys(self):
+        return self.columns.keys()
+
+    def names(self, column: str):
+        """
+        Returns the ECOD names of a dictionary encoded column (e.g. "f_group") for every domain
+        """
+
+        return self.columns[column + "_values"][self.columns[column]]
+
+    def accessions(self):
+        """
+        Returns the protein accession of every domain
+        """
+
+        return self.columns["accession"][self.columns["protein"]]
+
+    def domain_segments(self, i: int):
+        """
+        Returns the residue segments of domain `i` as (segments, 2) 0-based, end exclusive pairs
+        """
+
+        return self.columns["segments"][self.columns["segment_start"][i]:self.columns["segment_start"][i + 1]]
+
+
+# Header reader of each .npy format version, all columns are written as version 1.0
+__header_readers = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+
+
+def load(npz_file: str):
+    """
+    Loads a columnar output without reading its columns, each column is memory mapped from the .npz file
+
+    Parameters
+    ------------
+    npz_file : str
+    Path of a columnar output written by ColumnarWriter
+
+    Returns
+    ------------
+    domains : ColumnarDomains
+    """
+
+    columns = dict()
+
+    with zipfile.ZipFile(npz_file) as npz, open(npz_file, "rb") as raw:
+
+        for member in npz.infolist():
+
+            if member.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("'{}' is compressed and can not be memory mapped, it was not written by DomainMapper.".format(npz_file))
+
+            # The data of a member follows its local file header, whose extra fields may differ from those of the central directory
+            raw.seek(member.header_offset)
+
+            name_len, extra_len = struct.unpack("<26xHH", raw.read(30))
+
+            raw.seek(member.header_offset + 30 + name_len + extra_len)
+
+            name = member.filename[:-len(".npy")]
+
+            version = np.lib.format.read_magic(raw)
+
+            if version not in __header_readers:
+                raise ValueError("Column '{}' of '{}' has an unknown .npy format version {}.".format(name, npz_file, version))
+
+            shape, fortran_order, dtype = __header_readers[version](raw)
+
+            if dtype.hasobject:
+                raise ValueError("Column '{}' of '{}' holds Python objects and can not be memory mapped.".format(name, npz_file))
+
+            if 0 in shape:
+                columns[name] = np.empty(shape, dtype = dtype)
+            else:
+                columns[name] = np.memmap(npz_file, dtype = dtype, mode = "r", offset = raw.tell(), shape = shape, order = "F" if fortran_order else "C")
+
+    attributes = json.loads(str(columns.pop("attributes")[()]))
+
+    return ColumnarDomains(columns, attributes)
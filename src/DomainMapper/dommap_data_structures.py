@@ -1,13 +1,281 @@
 # dommmap_data_structures.py 
 # This file contains all the data structures and supporting functions for these structures used in DomainMapper
 
-from scipy.stats import combine_pvalues
+from math import exp, log, lgamma
 
-from numpy import zeros
+from re import finditer
 
-from re import findall, finditer
+from typing import NamedTuple
+
+from DomainMapper.dommap_parser import HSP
+
+
+def hsp_e_val(hsp: HSP):
+    """
+    Returns the conditional E-value of a high-scoring pair, E-values of zero are set to 1e-99
+    """
+
+    return (1e-99, hsp.evalue_cond)[hsp.evalue_cond > 0]
+
+
+def hsp_alignment(hsp: HSP):
+    """
+    Returns the aligned query and HMM sequences of a high-scoring pair from either dommap_parser or Bio.SearchIO as strings
+    """
+
+    try:
+        return hsp.query_aln, hsp.hit_aln
+    except AttributeError:
+        return str(hsp.query.seq), str(hsp.hit.seq)
+
+
+def hsp_gap_runs(hsp: HSP, min_len: int = 1):
+    """
+    Returns the runs of at least `min_len` query residues of a high-scoring pair which are not aligned to the HMM (insertions, '.' in the HMM line), as (start, end) query residue pairs.
+    High-scoring pairs read from a compiled store (dommap_store.StoreHSP) hold their runs instead of their alignment.
+    """
+
+    gap_runs = getattr(hsp, "gap_runs", None)
+
+    if gap_runs is not None:
+        return [gap_run for gap_run in gap_runs if gap_run[1] - gap_run[0] >= min_len]
+
+    query_start = hsp.query_range[0]
+
+    query_aln, hmm_aln = hsp_alignment(hsp)
+
+    gap_runs = list()
+
+    # Runs are found in one pass over the alignment, counting the query deletions ('-') between consecutive runs
+    aln_pos = 0
+
+    num_deletions = 0
+
+    for gap in finditer(r'\.{'+str(min_len)+',}', hmm_aln):
+
+        gap_start, gap_end = gap.span()
+
+        num_deletions += query_aln.count('-', aln_pos, gap_start)
+
+        aln_pos = gap_start
+
+        # Alignment positions are shifted to query residues by the deletions before the gap
+        gap_runs.append((gap_start + query_start - num_deletions, gap_end + query_start - num_deletions))
+
+    return gap_runs
+
+
+# Log of the largest float as used by scipy's chi-squared survival function (cephes igamc), below exp(-MAXLOG) its leading factor underflows to 0
+__max_log = 7.09782712893383996843e2
+
+
+def fisher_combine(e_vals: list):
+    """
+    Combines E-values (treated as psuedo P-values) with Fisher's method, matching `scipy.stats.combine_pvalues(e_vals, "fisher")[1]`.
+    Any number of E-values can be combined at once.
+    The chi-squared survival function with 2k degrees of freedom has the closed form exp(-x/2) * sum((x/2)^i / i!) for i < k,
+    where x/2 = -sum(log(e_vals)) is half of Fisher's statistic.
+    Like scipy, the result is 0 once (x/2)^k exp(-x/2) / Gamma(k) is below exp(-MAXLOG), and smaller results are subnormal floats.
+
+    Parameters
+    ------------
+    e_vals : list
+    E-values greater than zero
+
+    Returns
+    ------------
+    combined_e_val : float
+    """
+
+    half_stat = -sum(log(e_val) for e_val in e_vals)
+
+    # E-values with a product above one have no evidence against the null
+    if half_stat <= 0:
+        return 1.0
+
+    if len(e_vals)*log(half_stat) - half_stat - lgamma(len(e_vals)) < -__max_log:
+        return 0.0
+
+    term = 1.0
+
+    total = 1.0
+
+    for i in range(1, len(e_vals)):
+        term *= half_stat / i
+        total += term
+
+    # The sum is taken into the exponent, exp(-x/2) alone is subnormal (or 0) well before the result is
+    return exp(log(total) - half_stat)
+
+
+# Residue ranges are stored as sorted lists of non-overlapping segments (start, end), which are 0-based and end exclusive
+# Segments that overlap or touch are always joined so each segment is a contiguous run of residues
+
+def segments_len(segs: list):
+    """
+    Returns the number of residues in a list of segments
+    """
+
+    return sum([end - start for start, end in segs])
+
+
+def segments_union(segs_A: list, segs_B: list):
+    """
+    Returns the union of two lists of segments
+    """
+
+    union = list()
+
+    for start, end in sorted(segs_A + segs_B):
+
+        if start >= end:
+            continue
+
+        if union and start <= union[-1][1]:
+            if end > union[-1][1]:
+                union[-1] = (union[-1][0], end)
+        else:
+            union.append((start, end))
+
+    return union
+
+
+def segments_difference(segs_A: list, segs_B: list):
+    """
+    Returns the residues in segments A which are not in segments B
+    """
+
+    difference = list()
+
+    segs_B = segments_union(segs_B, [])
+
+    b = 0
+
+    for start, end in segs_A:
+
+        # Skip segments of B that end before this segment of A
+        while b < len(segs_B) and segs_B[b][1] <= start:
+            b += 1
+
+        i = b
+        while i < len(segs_B) and segs_B[i][0] < end:
+            if segs_B[i][0] > start:
+                difference.append((start, segs_B[i][0]))
+            start = max(start, segs_B[i][1])
+            i += 1
+
+        if start < end:
+            difference.append((start, end))
+
+    return difference
+
+
+def segments_intersection(segs_A: list, segs_B: list):
+    """
+    Returns the number of residues shared by two lists of segments
+    """
+
+    a = b = 0
+
+    num_res = 0
+
+    while a < len(segs_A) and b < len(segs_B):
+
+        start = max(segs_A[a][0], segs_B[b][0])
+        end = min(segs_A[a][1], segs_B[b][1])
+
+        if start < end:
+            num_res += end - start
+
+        if segs_A[a][1] < segs_B[b][1]:
+            a += 1
+        else:
+            b += 1
+
+    return num_res
+
+
+def segments_slice(segs: list, start: int = 0, end: int = None):
+    """
+    Returns the segments of residues by their position in the domain, equivalent to slicing a list of residues as `residues[start:end]`
+    """
+
+    start, end, _ = slice(start, end).indices(segments_len(segs))
+
+    sliced = list()
+
+    res_idx = 0
+
+    for seg_start, seg_end in segs:
+
+        seg_len = seg_end - seg_start
+
+        sub_start = max(start - res_idx, 0)
+        sub_end = min(end - res_idx, seg_len)
+
+        if sub_start < sub_end:
+            sliced.append((seg_start + sub_start, seg_start + sub_end))
+
+        res_idx += seg_len
+
+    return sliced
+
+
+def segments_gaps(segs: list):
+    """
+    Returns the segments of residues missing between the first and last residue of a list of segments
+    """
+
+    return [(segs[i][1], segs[i+1][0]) for i in range(len(segs) - 1)]
+
+
+def segments_in_gaps(segs_list: list):
+    """
+    Returns the number of residues of each list of segments which lie within the gaps of every other list of segments.
+    The gaps of each list are found once and swept together with all segments in order of their first residue,
+    so only gaps and segments which overlap are ever compared.
+
+    Parameters
+    ------------
+    segs_list : list
+    Lists of segments, e.g. the segments of each mapped domain
+
+    Returns
+    ------------
+    res_in_gaps : dict
+    Number of residues of segments b within the gaps of segments a keyed by (a, b), pairs without any such residues are left out
+    """
+
+    intervals = list()
+
+    for i, segs in enumerate(segs_list):
+
+        intervals.extend((gap_start, gap_end, 0, i) for gap_start, gap_end in segments_gaps(segs))
+
+        intervals.extend((seg_start, seg_end, 1, i) for seg_start, seg_end in segs)
+
+    intervals.sort()
+
+    # Gaps and segments which have not ended yet
+    active = (list(), list())
+
+    res_in_gaps = dict()
+
+    for start, end, is_seg, i in intervals:
+
+        active = tuple([interval for interval in active_intervals if interval[1] > start] for active_intervals in active)
+
+        # Gaps are only compared with segments and segments only with gaps
+        for other_start, other_end, j in active[not is_seg]:
+
+            a, b = (j, i) if is_seg else (i, j)
+
+            res_in_gaps[(a, b)] = res_in_gaps.get((a, b), 0) + min(end, other_end) - max(start, other_start)
+
+        active[is_seg].append((start, end, i))
+
+    return res_in_gaps
 
-from Bio.SearchIO._model.hsp import HSP
 
 # Initializing for type annotations
 class Domain:
@@ -19,51 +287,140 @@ class DomainMap(list):
     pass
 
 
+class DomainParams(NamedTuple):
+    """
+    Mapping options shared by every domain of a run, see `dommap -h`
+    """
+
+    intra_gap: int
+
+    inter_gap: int
+
+    overlap: int
+
+    frac_overlap: float
+
+
 class Domain:
     """
-    Data structure for individual domains annotated (mapped) from a HMMER3 output
+    Data structure for individual domains annotated (mapped) from a HMMER3 output.
+    Domains have fixed slots instead of a `__dict__`, share the mapping options of their run as a single DomainParams,
+    and share one empty topology until a topology is added. ECOD names are only stored once a domain is annotated, until then they are "N/A".
     """
 
-    def __init__(self, hsp: HSP, intra_gap: int, inter_gap: int, overlap: int, frac_overlap: float):
+    __slots__ = ("map_segments", "map_len", "hmm_range", "hmm_len", "e_val", "topology", "f_group", "ecod", "res_str", "params")
 
-        self.map_range = self.__map_range_finder(hsp, intra_gap)
+    # Topology of every domain without any topology, `update_topology` replaces it
+    __no_topology = frozenset()
 
-        self.map_len = len(self.map_range)
+    def __init__(self, hsp: HSP, params: DomainParams, *options):
+        """
+        Parameters
+        ------------
+        hsp : dommap_parser.HSP, Bio.SearchIO._model.hsp.HSP or dommap_store.StoreHSP
+        High-scoring Pair from an HMM alignment to a query (protein) sequence.
+
+        params : DomainParams
+        Mapping options, or `intra_gap` followed by `inter_gap`, `overlap` and `frac_overlap` in `options`
+        """
+
+        if options:
+            params = DomainParams(params, *options)
+
+        self.params = params
+
+        self.map_segments = self.__map_range_finder(hsp, params.intra_gap)
+
+        self.map_len = segments_len(self.map_segments)
 
         self.hmm_range = hsp.hit_range
 
         self.hmm_len = self.hmm_range[1] - self.hmm_range[0] + 1
 
-        self.e_val = (1e-99, hsp.evalue_cond)[hsp.evalue_cond > 0]
+        self.e_val = hsp_e_val(hsp)
 
-        self.topology = set()
+        self.topology = Domain.__no_topology
 
         self.f_group = hsp.hit_id
 
-        self.t_group = "N/A"
+        # ECOD domain definition of the F-group, (F-id, architecture, X-group, T-group), set by `annotate`
+        self.ecod = None
 
-        self.x_group = "N/A"
+        self.res_str = ""
 
-        self.arch = "N/A"
+    @property
+    def intra_gap(self):
+        return self.params.intra_gap
 
-        self.f_id = "N/A"
+    @property
+    def inter_gap(self):
+        return self.params.inter_gap
 
-        self.res_str = ""
+    @property
+    def overlap(self):
+        return self.params.overlap
+
+    @property
+    def fol(self):
+        return self.params.frac_overlap
+
+    @property
+    def f_id(self):
+        return "N/A" if self.ecod is None else self.ecod[0]
 
-        self.intra_gap = intra_gap
+    @property
+    def arch(self):
+        return "N/A" if self.ecod is None else self.ecod[1]
 
-        self.inter_gap = inter_gap
+    @property
+    def x_group(self):
+        return "N/A" if self.ecod is None else self.ecod[2]
 
-        self.overlap = overlap
+    @property
+    def t_group(self):
+        return "N/A" if self.ecod is None else self.ecod[3]
+
+    def annotate(self, ecod_domain: tuple):
+        """
+        Annotates the domain with the ECOD domain definition of its F-group, (F-id, architecture, X-group, T-group)
+        """
+
+        self.ecod = ecod_domain
+
+    @property
+    def map_range(self):
+        """
+        Returns all residue indices this domain contains
+        """
+
+        return [x for start, end in self.map_segments for x in range(start, end)]
+
+    @property
+    def map_start(self):
+        """
+        Returns the first residue index this domain contains
+        """
+
+        return self.map_segments[0][0]
+
+    @property
+    def map_end(self):
+        """
+        Returns the last residue index this domain contains
+        """
 
-        self.fol = frac_overlap
+        return self.map_segments[-1][1] - 1
 
     def map_intersection(self, dom: Domain, start = 0, end = None):
         """
         Returns the number of residues overlapping between two domains
+        Residues of `dom` can be limited by their position, i.e. `dom.map_range[start:end]`
         """
 
-        return len(set(self.map_range).intersection(set(dom.map_range[start:end])))
+        if start == 0 and end is None:
+            return segments_intersection(self.map_segments, dom.map_segments)
+
+        return segments_intersection(self.map_segments, segments_slice(dom.map_segments, start, end))
 
     def hmm_intersection(self, dom: Domain):
         """
@@ -72,23 +429,29 @@ class Domain:
 
         start_A, end_A = self.hmm_range[:2]
         start_B, end_B = dom.hmm_range [:2]
-        return len(set(range(start_A, end_A)).intersection(set(range(start_B, end_B))))
+        return max(0, min(end_A, end_B) - max(start_A, start_B))
 
     def update_topology(self, topo: str):
         """
         Updates the topology types this domain contains
         """
 
-        self.topology.add(topo)
+        if topo not in self.topology:
+            self.topology = self.topology | {topo}
     
-    def update_map_range(self, range: list):
+    def update_map_range(self, segs: list):
         """
         Updates the map range this domain contains
         """
 
-        self.map_range += range
-        tmp_set = list(set(self.map_range))
-        self.map_range = sorted(tmp_set)
+        self.map_segments = segments_union(self.map_segments, segs)
+
+    def format_map_range(self):
+        """
+        Returns the residue range as a string of 1-based, inclusive segments (e.g. 6-85,116-233)
+        """
+
+        return ",".join(["{}-{}".format(start+1, end) for start, end in self.map_segments])
 
     def merge(self, dom: Domain):
         """
@@ -116,7 +479,7 @@ class Domain:
 
         Parmeters
         ------------
-        hsp : Bio.SearchIO._model.hsp.HSP
+        hsp : dommap_parser.HSP, Bio.SearchIO._model.hsp.HSP or dommap_store.StoreHSP
         High-scoring Pair from an HMM alignment to a query (protein) sequence.
 
         intra_gap : int
@@ -124,33 +487,31 @@ class Domain:
 
         Returns
         ------------
-        map_ranges : list
-        A list of residue indicies which aligned to an ECOD HMM
+        map_segments : list
+        A list of residue segments which aligned to an ECOD HMM
         """
 
-        gap_ranges = list()
-
         query_start, query_end = hsp.query_range
         hmm_start, hmm_end = hsp.hit_range
 
-        query_aln = hsp.aln[0]
-        hmm_aln = hsp.aln[1]
+        map_segments = list()
 
-        if (query_end - query_start) - (hmm_end - hmm_start) >= intra_gap:
-            alignment_gap = finditer(r'\.{'+str(intra_gap)+',}', str(hmm_aln.seq))
-            if alignment_gap:
-                for gap in alignment_gap:
-                    gap_start = gap.start()
-                    gap_end = gap.end()
+        map_start = query_start
 
-                    gap_start_query_idx = gap_start + query_start - len(findall('-',str(query_aln.seq[:gap_start])))
-                    gap_end_query_idx = gap_end + query_start - len(findall('-',str(query_aln.seq[:gap_start])))
+        # Gaps have at least one residue, empty matches never carve out residues
+        alignment_gaps = hsp_gap_runs(hsp, max(intra_gap, 1)) if (query_end - query_start) - (hmm_end - hmm_start) >= intra_gap else ()
 
-                    gap_ranges += list(range(gap_start_query_idx, gap_end_query_idx))
-                    
-        map_ranges = sorted([x for x in range(query_start, query_end) if x not in gap_ranges])
-        
-        return map_ranges
+        for gap_start_query_idx, gap_end_query_idx in alignment_gaps:
+
+            if gap_start_query_idx > map_start:
+                map_segments.append((map_start, gap_start_query_idx))
+
+            map_start = max(map_start, gap_end_query_idx)
+
+        if query_end > map_start:
+            map_segments.append((map_start, query_end))
+
+        return map_segments
 
     def __avg_e_val(self, dom_B: Domain):
         """
@@ -176,7 +537,7 @@ class Domain:
 
         try:
             # if none of the E-values are exactly zero
-            self.e_val = combine_pvalues([eval_A, eval_B], "fisher")[1]
+            self.e_val = fisher_combine([eval_A, eval_B])
         except:
             # else if an E-value is zero
             self.e_val = min(eval_A, eval_B)
@@ -198,26 +559,13 @@ class Domain:
         None
         """
 
-        map_rng_A = self.map_range
-
-        map_rng_B = dom_B.map_range
-
-        tmp_save = list()
         # if the range is non-overlapping and contains a gap less than `inter_gap` fill it in
-        if map_rng_A[-1] < map_rng_B[0] and (map_rng_B[0] - map_rng_A[-1]) < self.inter_gap:
-            for x in range(map_rng_A[-1], map_rng_B[0]):
-                if x not in map_rng_A:
-                    tmp_save.append(x)
-            
-            self.update_map_range(tmp_save)
+        if self.map_end < dom_B.map_start and (dom_B.map_start - self.map_end) < self.params.inter_gap:
+            self.update_map_range([(self.map_end, dom_B.map_start)])
 
         # else maintain any overlaps/gaps and simply merge
         else:
-            for x in dom_B.map_range:
-                if x not in map_rng_A:
-                    tmp_save.append(x)
-            
-            self.update_map_range(tmp_save)
+            self.update_map_range(dom_B.map_segments)
 
 
 class DomainMap(list):
@@ -227,7 +575,7 @@ class DomainMap(list):
 
     def overlap_matrix(self):
         """
-        Returns overlap matrix
+        Returns overlap matrix, stored as a sparse graph where row `i` lists the indices of all domains overlapping domain `i`
         """
 
         try:
@@ -240,16 +588,45 @@ class DomainMap(list):
         Initializes new overlap matrix for DomainMap list
         """
 
-        self._overlap_matrix = zeros(shape=(len(self), len(self)), dtype=int)
-        self._deletion_matrix = zeros(shape=len(self), dtype=int)
+        self._overlap_matrix = [list() for _ in range(len(self))]
+        self._deletion_matrix = [0]*len(self)
+
+    def __overlap_candidates(self):
+        """
+        This method finds all pairs of domains which could overlap with a sweep over the domains in order of their first residue.
+        Only pairs where the first to last residues of both domains overlap are returned, domains that are far apart are never compared.
+
+        Returns
+        ------------
+        candidates : list
+        Pairs of domain indices (a, b) where a < b
+        """
+
+        candidates = list()
+
+        active = list()
+
+        for i in sorted(range(len(self)), key = lambda i: self[i].map_start):
+
+            map_start = self[i].map_start
+
+            # Domains ending before this domain starts can not overlap any of the remaining domains
+            active = [j for j in active if self[j].map_end >= map_start]
+
+            for j in active:
+                candidates.append((min(i, j), max(i, j)))
+
+            active.append(i)
+
+        return candidates
 
     def __map_range_overlapper(self):
         """
         This method fills a logical matrix of all overlapping domains in a DomainMap.
         A square matrix contains rows which are indexed to the "centeral" domain being considered,
         with columns indicating which domains overlap with it.
-        For a given row `i`, r_i will always contains a logical `False` at column i, c_i;
-        this is the centeral domain. All over columns in r_i could be either `True` or `False`.
+        For a given row `i`, r_i will never contain the centeral domain i.
+        Rows only list the overlapping domains, in increasing order.
 
         Paramters
         ------------
@@ -261,29 +638,46 @@ class DomainMap(list):
         None 
         """
 
-        for a, dom_A in enumerate(self[:-1]):
-            for b, dom_B in enumerate(self[a+1:]):
-                # Domains that overlap more than the tolerated `overlap` could be allowed as long as the overlap is less than `overlap`
-                # on both the N- and C-terminal 
-                if dom_A.map_intersection(dom_B) > dom_A.overlap:
-                    
-                    # Check for situtations were a domain might overlap by greater than or equal to `overlap` number of residues at domain flanks
-                    if dom_A.map_intersection(dom_B) <= 2*dom_A.overlap and (dom_A.map_len >= 2*dom_A.overlap or dom_B.map_len >= 2*dom_B.overlap):
-                        mid_rng_idx_B = len(dom_A.map_range)//2
-                        
-                        if dom_A.map_intersection(dom_B, end = mid_rng_idx_B) >= dom_A.overlap or dom_A.map_intersection(dom_B, start = mid_rng_idx_B) >= dom_A.overlap:
-                            self._overlap_matrix[a][b+a+1] = 1
-                            self._overlap_matrix[b+a+1][a] = 1
-
-                    # More than twice the `overlap`` and it will be marked overlapping
-                    else:
-                        self._overlap_matrix[a][b+a+1] = 1
-                        self._overlap_matrix[b+a+1][a] = 1
+        for a, b in self.__overlap_candidates():
+
+            dom_A = self[a]
+            dom_B = self[b]
+
+            map_intersection = dom_A.map_intersection(dom_B)
+
+            # Domains without any shared residues never overlap
+            if not map_intersection:
+                continue
+
+            overlapping = False
+
+            overlap, frac_overlap = dom_A.params.overlap, dom_A.params.frac_overlap
+
+            # Domains that overlap more than the tolerated `overlap` could be allowed as long as the overlap is less than `overlap`
+            # on both the N- and C-terminal 
+            if map_intersection > overlap:
                 
-                # Small domains (less than `overlap`) must be treated differently since their overlap could be a larger fraction of their length
-                if dom_A.map_intersection(dom_B)/float(dom_A.map_len) > dom_A.fol or dom_A.map_intersection(dom_B)/float(dom_B.map_len) > dom_A.fol:
-                    self._overlap_matrix[a][b+a+1] = 1
-                    self._overlap_matrix[b+a+1][a] = 1
+                # Check for situtations were a domain might overlap by greater than or equal to `overlap` number of residues at domain flanks
+                if map_intersection <= 2*overlap and (dom_A.map_len >= 2*overlap or dom_B.map_len >= 2*dom_B.params.overlap):
+                    mid_rng_idx_B = segments_len(dom_A.map_segments)//2
+                    
+                    if dom_A.map_intersection(dom_B, end = mid_rng_idx_B) >= overlap or dom_A.map_intersection(dom_B, start = mid_rng_idx_B) >= overlap:
+                        overlapping = True
+
+                # More than twice the `overlap`` and it will be marked overlapping
+                else:
+                    overlapping = True
+            
+            # Small domains (less than `overlap`) must be treated differently since their overlap could be a larger fraction of their length
+            if map_intersection/float(dom_A.map_len) > frac_overlap or map_intersection/float(dom_B.map_len) > frac_overlap:
+                overlapping = True
+
+            if overlapping:
+                self._overlap_matrix[a].append(b)
+                self._overlap_matrix[b].append(a)
+
+        for overlap_row in self._overlap_matrix:
+            overlap_row.sort()
 
     def update_overlap_matrix(self):
         """
@@ -296,63 +690,60 @@ class DomainMap(list):
 
     def eliminate_overlapping_domains(self):
         """
-        This function organizes the overlapping domain elimination scheme
+        This function organizes the overlapping domain elimination scheme.
+        Starting from each domain in turn, it descends to the overlapping domain with the lowest E-value until it reaches a domain
+        with a lower E-value than all of its remaining overlapping domains. That domain is kept and all of its overlapping domains are eliminated.
+
+        The descent is iterative, so dense overlap clusters can not exceed the recursion limit.
+        The overlapping domains of each domain are ordered by E-value once, eliminated domains are then skipped from the front of that order
+        and never scanned again.
+
+        For n domains with E overlapping pairs this takes O(E log E) to order the overlapping domains, and O(E) to skip eliminated domains over all descents.
+        Descents are not shared, a domain passed through by one descent is walked again by later descents as long as it is not eliminated,
+        so each descent adds up to L steps for L distinct E-values in an overlap cluster, O(E log E + n*L) in all and O(n^2) for a chain of decreasing E-values.
+        Keeping domains in a single global order of E-value (a priority queue) would bound this by O(n log n + E), but it breaks ties between equal E-values
+        differently from the descent, and changes which domains are kept.
         """
 
-        def _recursive_elimination(overlap_map, i):
-            """
-            This support function recursively eliminates domains that overlap
+        overlap_matrix = self.overlap_matrix()
+
+        # Overlapping domains in order of their E-value, ties are broken by their index
+        overlap_by_e_val = [sorted([j for j in overlap_row if not self._deletion_matrix[j]], key = lambda j: (self[j].e_val, j)) for overlap_row in overlap_matrix]
+
+        # Position of the lowest E-value domain that has not been eliminated
+        lowest_e_val_pos = [0]*len(self)
+
+        # Domains kept with all of their overlapping domains eliminated
+        kept = [False]*len(self)
+
+        for i in range(len(self)):
 
-            Parameters
-            ------------
-            overlap_map : list
-            Logical array denoting the overlapping domain of the reference domain
+            ref = i
 
-            i : int
-            Index of the reference domain
+            # If this domain has already been eliminated, or kept, skip
+            while not self._deletion_matrix[ref] and not kept[ref]:
 
-            Returns
-            ------------
-            None
-            """
+                overlap_row = overlap_by_e_val[ref]
 
-            # If this domain has already been eliminated, skip
-            if self._deletion_matrix[i]:
-                return
+                pos = lowest_e_val_pos[ref]
 
-            # Temporarily save all index and E-value for domains that overlap
-            tmp_idx = [i]
-            tmp_eval = [self[i].e_val]
-            for j, overlap in enumerate(overlap_map):
-                if overlap and not self._deletion_matrix[j] and j != i:
-                    tmp_idx.append(j)
-                    tmp_eval.append(self[j].e_val)
+                while pos < len(overlap_row) and self._deletion_matrix[overlap_row[pos]]:
+                    pos += 1
 
-            # If the reference domain has the lowest E-value eliminate all overlapping domains 
-            min_eval_idx = tmp_idx[tmp_eval.index(min(tmp_eval))]
-            if  min_eval_idx == i:
-                for j in tmp_idx:
-                    if j != i:
+                lowest_e_val_pos[ref] = pos
+
+                # If the reference domain has the lowest E-value eliminate all overlapping domains 
+                if pos == len(overlap_row) or self[ref].e_val <= self[overlap_row[pos]].e_val:
+
+                    for j in overlap_row[pos:]:
                         self._deletion_matrix[j] = 1
-                return
-            # else recursively check the overlapping domains of the lowest E-value domain
-            else:
-                _recursive_elimination(self._overlap_matrix[min_eval_idx], min_eval_idx)
-        
-        # Check all rows of the overlap matrix
-        try:
-            for i, overlap_row in enumerate(self._overlap_matrix):
-                _recursive_elimination(overlap_row, i)
-            
-            for i,del_ele in enumerate(self._deletion_matrix):
-                if del_ele:
-                    self[i] = None
 
-        except AttributeError:
-            self.update_overlap_matrix()
-            for i, overlap_row in enumerate(self._overlap_matrix):
-                _recursive_elimination(overlap_row, i)
+                    kept[ref] = True
+
+                # else check the overlapping domains of the lowest E-value domain
+                else:
+                    ref = overlap_row[pos]
 
-            for i,del_ele in enumerate(self._deletion_matrix):
-                if del_ele:
-                    self[i] = None
\ No newline at end of file
+        for i,del_ele in enumerate(self._deletion_matrix):
+            if del_ele:
+                self[i] = None
@@ -0,0 +1,943 @@
+# dommmap_engine.py 
+# This file contains the mapping of domains for individual proteins and the process pool used to map proteins in parallel
+
+import os
+
+import sys
+
+import signal
+
+from io import StringIO
+
+from typing import NamedTuple
+
+from time import monotonic
+
+from datetime import datetime
+
+from itertools import chain
+
+from functools import partial
+
+from collections import deque
+
+from multiprocessing import Pool
+
+from DomainMapper import dommap_io, dommap_parser, dommap_store, dommap_tools, dommap_index, dommap_profile
+
+from DomainMapper.dommap_data_structures import *
+
+
+class DomainRecord(NamedTuple):
+    """
+    A mapped domain with the same fields as a row of the output file.
+    Residue segments are (start, end) pairs, 0-based and end exclusive, `res_str` is their 1-based form used in the output.
+    """
+
+    accession: str
+
+    e_val: float
+
+    segments: tuple
+
+    res_str: str
+
+    topology: tuple
+
+    arch: str
+
+    x_group: str
+
+    t_group: str
+
+    f_group: str
+
+    f_id: str
+
+
+class MapCounts(NamedTuple):
+    """
+    Number of proteins and domains mapped from a file, as listed in the header of its output
+    """
+
+    proteins: int
+
+    domains: int
+
+    NC: int
+
+    CP: int
+
+    IS: int
+
+
+def domain_record(accession: str, dom: Domain):
+    """
+    Returns the record of a mapped domain, topologies are listed in the same order as the output file
+    """
+
+    topology = tuple([top for top in dommap_io.topology_order if top in dom.topology])
+
+    return DomainRecord(accession, dom.e_val, tuple(dom.map_segments), dom.res_str, topology, dom.arch, dom.x_group, dom.t_group, dom.f_group, dom.f_id)
+
+
+def map_protein(protein, ecod_domain_dict: dict, intra_gap: int, inter_gap: int, overlap: int, frac_overlap: float, eval_cutoff: float, profile = None):
+    """
+    This function maps the domains of a single protein from all of its HMM alignments.
+    Proteins do not depend on each other, so they can be mapped in any order or in parallel.
+
+    Parameters
+    ------------
+    protein : dommap_parser.QueryResult or Bio.SearchIO._model.query.QueryResult
+    All hits of a query (protein) sequence from `hmmscan`
+
+    ecod_domain_dict : dommap_tools.EcodDomains or dict
+    ECOD domain definitions keyed by F-group
+
+    intra_gap, inter_gap, overlap, frac_overlap, eval_cutoff
+    Mapping options, see `dommap -h`
+
+    profile : dommap_profile.MapProfile
+    Adds the time of each stage of mapping to the profile (default = None, not profiled)
+
+    Returns
+    ------------
+    final_mapped_domains : list
+    Mapped domains in order of their first residue
+    """
+
+    # Mapping options shared by every Domain of the protein
+    params = DomainParams(intra_gap, inter_gap, overlap, frac_overlap)
+
+    potential_domain_mappings = DomainMap()
+
+    mapped_domains = DomainMap()
+
+    for hit in protein.hits:
+
+        # Single high-scoring pair
+        if len(hit.hsps) == 1:
+
+            # Keep domain if the E-value is less than or equal to cutoff
+            if hsp_e_val(hit.hsps[0]) <= eval_cutoff:
+
+                # Save as Domain() object
+                potential_domain_mappings.append(Domain(hit.hsps[0], params))
+
+                if profile is not None:
+                    profile.lap("domains")
+        
+        # Multiple high-scoring pairs
+        # When an alignment has multiple HSPs, these domains can have complex topologies (e.g. non-contiguouity, circular permutant, or both, or just repetitive domains)
+        if len(hit.hsps) > 1:
+
+            # Create a temporary DomainMap() of domain annotations with multiple HSPs
+            # This will then be recursively eliminated so that only the lowest E-Values are retained
+            multi_hsps_domains = DomainMap()
+
+            for hsp in hit.hsps:
+
+                # Keep domain if the E-value is less than or equal to cutoff
+                if hsp_e_val(hsp) <= eval_cutoff:
+
+                    # Save as Domain() object
+                    multi_hsps_domains.append(Domain(hsp, params))
+
+            if profile is not None:
+                profile.lap("domains", len(multi_hsps_domains))
+
+            # Eliminate overlapping HSP's
+            multi_hsps_domains.update_overlap_matrix()
+
+            if profile is not None:
+                profile.lap("overlap_matrix")
+
+            multi_hsps_domains.eliminate_overlapping_domains()
+
+            if profile is not None:
+                profile.lap("eliminate")
+
+            # Check if any potential non-contig. domains must be combined
+            # By referencing domain_A from [:-1] (all but the last) and domain_B from [a+1:] (from index one more than "A" to the end)
+            # We are guaranteed to only check unique pairs of domans against each other
+            # In a non-contiguous domain, what happens is that the various AA-ranges correspond to distinct portions in the query sequence and in the HMM model
+            
+            if len(multi_hsps_domains) > 1:
+
+                for a,domain_A in enumerate(multi_hsps_domains[:-1]):
+
+                    for b,domain_B in enumerate(multi_hsps_domains[a+1:]):
+
+                        # If the domains have not been eliminated, check if they can be merged
+                        if domain_A and domain_B and domain_A.f_group == domain_B.f_group:
+
+                            # Merge domains if their query (map) ranges do not overlap
+                            # And if their hmm ranges do not overlap (70% for small domains)
+                            if domain_A.map_intersection(domain_B) <= overlap \
+                                and domain_A.map_intersection(domain_B)/float(domain_A.map_len) < frac_overlap and domain_A.map_intersection(domain_B)/float(domain_B.map_len) < frac_overlap \
+                                    and domain_A.hmm_intersection(domain_B) <= overlap \
+                                        and domain_A.hmm_intersection(domain_B)/float(domain_A.hmm_len) < frac_overlap and domain_A.hmm_intersection(domain_B)/float(domain_B.hmm_len) < frac_overlap:                                
+                                
+                                # Check to see if this is CP
+                                if ((domain_A.map_start < domain_B.map_start and domain_A.hmm_range[0] > domain_B.hmm_range[0]) or (domain_A.map_start > domain_B.map_start and domain_A.hmm_range[0] < domain_B.hmm_range[0])) \
+                                        and domain_A and domain_B and domain_A.f_group == domain_B.f_group:
+                            
+                                    domain_B.update_topology(f"CP")
+                                
+                                domain_B.merge(domain_A)
+
+                                # Remove domain_A
+                                multi_hsps_domains[a] = None
+
+                            else:
+                                # Otherwise, retain them, as they could be repetative domains
+                                pass
+
+            # Remove any domains with low E-values
+            for dom in multi_hsps_domains:
+
+                if dom and dom.e_val < eval_cutoff:
+
+                    potential_domain_mappings.append(dom)
+
+            if profile is not None:
+                profile.lap("merge")
+
+    # Eliminate overlapping HITs
+    potential_domain_mappings.update_overlap_matrix()
+
+    if profile is not None:
+        profile.lap("overlap_matrix")
+
+    potential_domain_mappings.eliminate_overlapping_domains()
+
+    if profile is not None:
+        profile.lap("eliminate")
+
+    # Final domains
+
+    for pot_dom_map in potential_domain_mappings:
+
+        if pot_dom_map:
+
+            mapped_domains.append(pot_dom_map)
+    
+    # Label the insertional domains (domains that lie within non-contiguous domains)
+    if len(mapped_domains) > 1: # only proteins with multiple domains can contain insertional domains
+
+        # Count the residues of each domain B which lie within the alignment gaps of each domain A
+        # The gaps of every domain are only found once and each B is only compared with the gaps it overlaps
+        res_in_aln_gaps = segments_in_gaps([domain.map_segments for domain in mapped_domains])
+
+        for (a,b),num_res_B_in_aln_gap_A in res_in_aln_gaps.items():
+
+            domain_B = mapped_domains[b]
+
+            # If all of B"s residues (with 15 (default) allowed as exception) lie within a gap of A mark as IS of that domain
+            if num_res_B_in_aln_gap_A > (domain_B.map_len - overlap) and (domain_B.map_len - overlap) > 0: 
+
+                domain_B.update_topology(f"IS")
+
+    if profile is not None:
+        profile.lap("insertional")
+
+    #Now just output this to a file
+    for a,domain in enumerate(mapped_domains):
+
+        #reformat the residue range into a nice tidy little string
+        #domains with more than one segment are non-contiguous
+        if len(domain.map_segments) > 1:
+
+            domain.update_topology(f"NC")
+
+        domain.res_str = domain.format_map_range()
+
+        #try to find the domain in the domain dict else output the F group from the hmmscan
+        if domain.f_group in ecod_domain_dict:
+
+            domain.annotate(ecod_domain_dict[domain.f_group])
+
+    # print domains out in order of the first index that appears for a given annotation
+    final_mapped_domains = sorted(mapped_domains, key = lambda dom: dom.map_start)
+
+    if profile is not None:
+        profile.lap("annotate", len(final_mapped_domains))
+
+    return final_mapped_domains
+
+
+def hmmscan_proteins(file_path: str, parser: str = "native", eval_cutoff: float = None, start: int = 0, skip: int = 0):
+    """
+    This function parses each protein (query) from the input hmm file with either the built in parser or Bio.SearchIO
+
+    Parameters
+    ------------
+    file_path : str
+    Path to file from `hmmscan -o` or "-" for standard input, gzip, bz2 and xz compressed files are decompressed in a background thread.
+    Stores compiled by `dommap compile` are read directly, whichever parser is used
+
+    parser : str
+    "native" for dommap_parser or "biopython" for Bio.SearchIO
+
+    eval_cutoff : float
+    Alignments above the E-value cutoff are not read by the built in parser
+
+    start : int
+    Byte offset of the query to start from in an uncompressed input, to resume a run (default = 0)
+
+    skip : int
+    Number of queries to skip without parsing them, to resume a run over a compressed input or a store (default = 0)
+
+    Returns
+    ------------
+    proteins : generator
+    Yields each protein, and the byte offset in the input file where the protein ends (in the compressed file for compressed inputs)
+    """
+
+    if file_path != "-" and dommap_store.is_store(file_path):
+
+        store = dommap_store.HSPStore(file_path)
+
+        store_size = os.path.getsize(file_path)
+
+        # Offsets within a store are in proportion to the queries which have been read
+        for protein in store.proteins(skip):
+            yield protein, store_size*protein.end//len(store)
+
+    elif parser == "native" and not skip and file_path != "-" and dommap_io.input_compression(file_path) is None:
+
+        for protein in dommap_parser.parse(file_path, eval_cutoff, start):
+            yield protein, protein.end
+
+    elif parser == "native":
+
+        # Pipes and compressed files can not be memory mapped, they are parsed in blocks of whole queries as they are read
+        # Each query of a pipe is parsed as soon as it ends
+        for block, block_offset in dommap_io.query_blocks(file_path, 1 if file_path == "-" else 1048576, start, skip):
+
+            for protein in dommap_parser.parse_buffer(block, eval_cutoff):
+                yield protein, block_offset
+
+    elif start or skip:
+
+        from Bio.SearchIO import parse
+
+        # Bio.SearchIO can not start within a file, resumed runs are parsed in blocks which hold the preamble of the file
+        for block, block_offset in dommap_io.query_blocks(file_path, 1048576, start, skip):
+
+            for protein in parse(StringIO(block.decode()), "hmmer3-text"):
+                yield protein, block_offset
+
+    else:
+
+        # Bio is only imported when it is used, it is slow to import
+        from Bio.SearchIO import parse
+
+        with dommap_io.open_input(file_path, "r") as hmmscan_file:
+
+            for protein in parse(hmmscan_file, "hmmer3-text"):
+                yield protein, dommap_io.input_offset(hmmscan_file)
+
+
+def map_serial(file_path: str, ecod_domain_dict: dict, intra_gap: int, inter_gap: int, overlap: int, frac_overlap: float, eval_cutoff: float, parser: str = "native", start: int = 0, skip: int = 0, profile = None, telemetry = None):
+    """
+    This function maps each protein as it is parsed from the input hmm file
+
+    Parameters
+    ------------
+    file_path : str
+    Path to file from `hmmscan -o` (which may be compressed) or "-" for standard input
+
+    parser : str
+    "native" for dommap_parser or "biopython" for Bio.SearchIO
+
+    start, skip
+    Where to resume mapping, see `hmmscan_proteins`
+
+    profile : dommap_profile.MapProfile
+    Adds the time of each stage of mapping to the profile (default = None, not profiled)
+
+    telemetry : dommap_telemetry.ProgressTelemetry
+    Counts the high-scoring pairs of each protein in the telemetry (default = None, not counted)
+
+    Returns
+    ------------
+    mapped_proteins : generator
+    Yields the domain records of each protein, and the byte offset in the input file that has been mapped
+    """
+
+    proteins = hmmscan_proteins(file_path, parser, eval_cutoff, start, skip)
+
+    if telemetry is not None:
+        proteins = telemetry.count_hsps(proteins)
+
+    if profile is not None:
+        yield from profile_proteins(proteins, (ecod_domain_dict, intra_gap, inter_gap, overlap, frac_overlap, eval_cutoff), profile)
+        return
+
+    for protein, hmmscan_offset in proteins:
+
+        final_mapped_domains = map_protein(protein, ecod_domain_dict, intra_gap, inter_gap, overlap, frac_overlap, eval_cutoff)
+
+        yield [domain_record(protein.id, dom) for dom in final_mapped_domains], hmmscan_offset
+
+
+def profile_proteins(proteins, mapping_args: tuple, profile):
+    """
+    Maps proteins as `map_serial` does, and adds the time of each stage and of each protein to the profile.
+    Time since the previous lap of the profile until a protein is received is counted as parsing.
+
+    Parameters
+    ------------
+    proteins : iterable
+    Each parsed protein, paired with the byte offset in the input file where it ends
+
+    mapping_args : tuple
+    Domain definitions and mapping options in the order taken by `map_protein`
+
+    profile : dommap_profile.MapProfile
+    Profile of the run
+
+    Returns
+    ------------
+    mapped_proteins : generator
+    Yields the domain records of each protein, and the byte offset in the input file that has been mapped
+    """
+
+    for protein, hmmscan_offset in proteins:
+
+        profile.lap("parse")
+
+        map_start = profile.last
+
+        records = [domain_record(protein.id, dom) for dom in map_protein(protein, *mapping_args, profile)]
+
+        profile.lap("records", len(records))
+
+        profile.protein(protein, len(records), profile.last - map_start)
+
+        yield records, hmmscan_offset
+
+
+# Parser, domain definitions and mapping options of a worker process, these are set once by the pool initializer
+__worker_args = tuple()
+
+
+def __init_worker(*worker_args):
+    global __worker_args
+    __worker_args = worker_args
+
+    # Interrupts are handled by the main process, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def block_proteins(block, parser: str = "native", eval_cutoff: float = None):
+    """
+    Parses the proteins of a block from `input_blocks`, a block of hmmscan output or a range of the queries of a compiled store
+    """
+
+    if isinstance(block, tuple):
+        # Queries of a compiled store, (store path, first query, end query)
+        return dommap_store.HSPStore(block[0]).proteins(*block[1:])
+
+    if parser == "native":
+        return dommap_parser.parse_buffer(block, eval_cutoff)
+
+    from Bio.SearchIO import parse
+
+    return parse(StringIO(block.decode()), "hmmer3-text")
+
+
+def __map_query_block(block):
+    """
+    Maps all proteins in a block of hmmscan output and returns the domain records of each protein
+    """
+
+    parser, *mapping_args = __worker_args
+
+    proteins = block_proteins(block, parser, mapping_args[-1])
+
+    return [[domain_record(protein.id, dom) for dom in map_protein(protein, *mapping_args)] for protein in proteins]
+
+
+def __count_query_block(block):
+    """
+    Maps all proteins in a block as `__map_query_block` does, and returns the number of high-scoring pairs in the block along with the domain records of each protein
+    """
+
+    parser, *mapping_args = __worker_args
+
+    block_records, n_hsps = list(), 0
+
+    for protein in block_proteins(block, parser, mapping_args[-1]):
+
+        n_hsps += sum(len(hit.hsps) for hit in protein.hits)
+
+        block_records.append([domain_record(protein.id, dom) for dom in map_protein(protein, *mapping_args)])
+
+    return block_records, n_hsps
+
+
+def __profile_query_block(block, n_slowest: int = 10):
+    """
+    Maps all proteins in a block as `__map_query_block` does, and returns the profile of the block along with the domain records of each protein
+    """
+
+    parser, *mapping_args = __worker_args
+
+    profile = dommap_profile.MapProfile(n_slowest)
+
+    proteins = ((protein, None) for protein in block_proteins(block, parser, mapping_args[-1]))
+
+    return [records for records, _ in profile_proteins(proteins, mapping_args, profile)], profile
+
+
+def map_parallel(file_path: str, workers: int, ecod_domain_dict: dict, intra_gap: int, inter_gap: int, overlap: int, frac_overlap: float, eval_cutoff: float, parser: str = "native", start: int = 0, skip: int = 0, profile = None, telemetry = None):
+    """
+    This function maps proteins across a pool of worker processes.
+    The input is split into blocks of whole queries which are mapped independently, the domain definitions are only sent once to each worker.
+    Results are returned in the original input order and only a few blocks per worker are held in memory at any time.
+
+    Parameters
+    ------------
+    file_path : str
+    Path to file from `hmmscan -o` (which may be compressed) or "-" for standard input
+
+    workers : int
+    Number of worker processes
+
+    parser : str
+    "native" for dommap_parser or "biopython" for Bio.SearchIO
+
+    start, skip
+    Where to resume mapping, see `hmmscan_proteins`
+
+    profile : dommap_profile.MapProfile
+    Adds the profile of each block, summed over the worker processes, to the profile (default = None, not profiled)
+
+    telemetry : dommap_telemetry.ProgressTelemetry
+    Counts the high-scoring pairs of each block, as they are received from the workers, in the telemetry (default = None, not counted)
+
+    Returns
+    ------------
+    mapped_proteins : generator
+    Yields the domain records of each protein, and the byte offset in the input file that has been mapped
+    """
+
+    with worker_pool(workers, parser, ecod_domain_dict, intra_gap, inter_gap, overlap, frac_overlap, eval_cutoff) as pool:
+
+        if profile is not None:
+
+            for (block_records, block_profile), end_offset in map_blocks(pool, input_blocks(file_path, start, skip), 2*workers, partial(__profile_query_block, n_slowest = profile.n_slowest)):
+
+                profile.merge(block_profile)
+
+                if telemetry is not None:
+                    telemetry.hsps += block_profile.hsps
+
+                for records in block_records:
+
+                    # Time spent waiting for the workers is not counted in any stage
+                    profile.start()
+
+                    yield records, end_offset
+
+            return
+
+        if telemetry is not None:
+
+            for (block_records, n_hsps), end_offset in map_blocks(pool, input_blocks(file_path, start, skip), 2*workers, __count_query_block):
+
+                telemetry.hsps += n_hsps
+
+                for records in block_records:
+                    yield records, end_offset
+
+            return
+
+        for block_records, end_offset in map_blocks(pool, input_blocks(file_path, start, skip), 2*workers):
+
+            for records in block_records:
+                yield records, end_offset
+
+
+def input_blocks(file_path: str, start: int = 0, skip: int = 0, block_queries: int = 256):
+    """
+    Splits an input file into blocks of whole queries to be parsed with `block_proteins`, from the start of the input or where a run is resumed (see `hmmscan_proteins`).
+    Hmmscan outputs are split with `dommap_io.query_blocks`, compiled stores into ranges of `block_queries` queries which are read from the store by the worker which maps them.
+
+    Returns
+    ------------
+    blocks : generator
+    Yields each block, and the byte offset in the input file where the block ends
+    """
+
+    if file_path == "-" or not dommap_store.is_store(file_path):
+        yield from dommap_io.query_blocks(file_path, start = start, skip = skip)
+        return
+
+    n_queries = len(dommap_store.HSPStore(file_path))
+
+    store_size = os.path.getsize(file_path)
+
+    for block_start in range(skip, n_queries, block_queries):
+
+        block_end = min(block_start + block_queries, n_queries)
+
+        yield (file_path, block_start, block_end), store_size*block_end//n_queries
+
+
+def worker_pool(workers: int, parser: str, ecod_domain_dict: dict, intra_gap: int, inter_gap: int, overlap: int, frac_overlap: float, eval_cutoff: float):
+    """
+    Returns a pool of worker processes which map blocks of queries, the parser, domain definitions and mapping options are sent once to each worker
+    """
+
+    return Pool(workers, initializer = __init_worker, initargs = (parser, ecod_domain_dict, intra_gap, inter_gap, overlap, frac_overlap, eval_cutoff))
+
+
+def map_blocks(pool, blocks, max_pending: int, map_block = None):
+    """
+    Maps blocks of queries with a pool from `worker_pool`, results are returned in the original block order.
+    A pool can be shared by several callers, as long as each of them keeps its own blocks.
+
+    Parameters
+    ------------
+    pool : multiprocessing.pool.Pool
+    Pool of worker processes from `worker_pool`
+
+    blocks : iterable
+    Blocks of whole queries, each with the byte offset in the input where it ends (e.g. from `dommap_io.query_blocks`)
+
+    max_pending : int
+    Maximum number of blocks held in memory at any time
+
+    map_block : function
+    Function which maps a block in a worker process (default = maps the proteins of the block with the options of `worker_pool`)
+
+    Returns
+    ------------
+    mapped_blocks : generator
+    Yields the domain records of each protein in a block, and the byte offset in the input where the block ends
+    """
+
+    pending = deque()
+
+    for block, end_offset in blocks:
+
+        pending.append((pool.apply_async(map_block or __map_query_block, (block,)), end_offset))
+
+        # Limit the number of blocks held in memory
+        if len(pending) >= max_pending:
+            result, end_offset = pending.popleft()
+            yield result.get(), end_offset
+
+    while pending:
+        result, end_offset = pending.popleft()
+        yield result.get(), end_offset
+
+
+class DomainMapperEngine:
+    """
+    Maps domains from hmmscan outputs with the ECOD domain definitions and mapping options held once,
+    so that any number of files, or already parsed proteins, can be mapped within the same process.
+
+    Parameters
+    ------------
+    ecod_domain_dict : dommap_tools.EcodDomains or dict
+    ECOD domain definitions keyed by F-group (default = built in domain definitions)
+
+    intra_gap, inter_gap, overlap, frac_overlap, eval_cutoff
+    Mapping options, see `dommap -h`
+
+    parser : str
+    "native" for dommap_parser or "biopython" for Bio.SearchIO
+
+    workers : int
+    Number of worker processes used to map proteins of input files (default = 1, proteins are mapped in this process)
+    """
+
+    def __init__(self, ecod_domain_dict: dict = None, intra_gap: int = 30, inter_gap: int = 30, overlap: int = 40, frac_overlap: float = 0.7, eval_cutoff: float = 1e-5, parser: str = "native", workers: int = 1):
+
+        if intra_gap < 0:
+            raise ValueError("Non-positive option detected for the intra-gap size tolerance.")
+
+        if inter_gap < 0:
+            raise ValueError("Non-positive option detected for the inter-gap size tolerance.")
+
+        if overlap < 0:
+            raise ValueError("Non-positive option detected for overlap tolerance.")
+
+        if frac_overlap < 0:
+            raise ValueError("Non-positive option detected for fractional overlap tolerance.")
+
+        if eval_cutoff < 0:
+            raise ValueError("Non-positive option detected for E-value cuttoff.")
+
+        if workers < 1:
+            raise ValueError("Non-positive option detected for the number of workers.")
+
+        if parser not in ("native", "biopython"):
+            raise ValueError("Unknown parser '{}', use 'native' or 'biopython'.".format(parser))
+
+        self.ecod_domain_dict = dommap_tools.load() if ecod_domain_dict is None else ecod_domain_dict
+
+        self.intra_gap = intra_gap
+
+        self.inter_gap = inter_gap
+
+        self.overlap = overlap
+
+        self.frac_overlap = frac_overlap
+
+        self.eval_cutoff = eval_cutoff
+
+        self.parser = parser
+
+        self.workers = workers
+
+    def mapping_args(self):
+        """
+        Returns the domain definitions and mapping options in the order taken by `map_protein`
+        """
+
+        return (self.ecod_domain_dict, self.intra_gap, self.inter_gap, self.overlap, self.frac_overlap, self.eval_cutoff)
+
+    def worker_pool(self):
+        """
+        Returns a pool of `workers` processes holding the domain definitions and mapping options of this engine, to be used with `map_blocks`
+        """
+
+        return worker_pool(self.workers, self.parser, *self.mapping_args())
+
+    def map_protein(self, protein):
+        """
+        Returns the domain records of a single parsed protein (dommap_parser.QueryResult or Bio.SearchIO QueryResult)
+        """
+
+        return [domain_record(protein.id, dom) for dom in map_protein(protein, *self.mapping_args())]
+
+    def map_proteins(self, hmmscan, start: int = 0, skip: int = 0, profile = None, telemetry = None):
+        """
+        Maps every protein of a hmmscan output
+
+        Parameters
+        ------------
+        hmmscan : str or iterable
+        Path to file from `hmmscan -o`, or an iterable of parsed proteins
+
+        start, skip
+        Where to resume mapping a file, see `hmmscan_proteins`
+
+        profile : dommap_profile.MapProfile
+        Adds the time of each stage of mapping to the profile (default = None, not profiled)
+
+        telemetry : dommap_telemetry.ProgressTelemetry
+        Counts the high-scoring pairs of each protein of a file in the telemetry (default = None, not counted)
+
+        Returns
+        ------------
+        mapped_proteins : generator
+        Yields the domain records of each protein, and the byte offset in the input file that has been mapped (`None` for parsed proteins)
+        """
+
+        if not isinstance(hmmscan, str) and profile is not None:
+
+            yield from profile_proteins(((protein, None) for protein in hmmscan), self.mapping_args(), profile)
+
+        elif not isinstance(hmmscan, str):
+
+            for protein in hmmscan:
+                yield self.map_protein(protein), None
+
+        elif self.workers > 1:
+
+            yield from map_parallel(hmmscan, self.workers, *self.mapping_args(), self.parser, start, skip, profile, telemetry)
+
+        else:
+
+            yield from map_serial(hmmscan, *self.mapping_args(), self.parser, start, skip, profile, telemetry)
+
+    def map_domains(self, hmmscan):
+        """
+        Maps every protein of a hmmscan output and yields each mapped domain as a DomainRecord, proteins are mapped lazily as records are consumed
+        """
+
+        for records, _ in self.map_proteins(hmmscan):
+            yield from records
+
+    def map_file(self, in_file: str, out_file: str, progress: bool = False, resume: bool = False, checkpoint_interval: float = 60.0, npz: bool = False, index: bool = False, profile = None, telemetry = None):
+        """
+        Maps every protein of a `hmmscan -o` file and writes the mapped domains to the output file.
+        The output file is only created once the first protein has been mapped.
+        While an uncompressed output is mapped, a checkpoint of the input mapped so far, the domain counts and the rows written is kept in `<out_file>.journal`,
+        which is removed once the output is complete.
+
+        Parameters
+        ------------
+        in_file : str
+        Path to file from `hmmscan -o`, which may be gzip, bz2 or xz compressed, a store compiled by `dommap compile`, or "-" for standard input
+
+        out_file : str
+        Output path for mapped domains, which is compressed if it ends in .gz, .bz2 or .xz, or "-" for standard output
+
+        progress : bool
+        Show a progress bar of the input file that has been mapped, when the progress is written to a terminal (default = False, there is no progress bar for standard input)
+
+        resume : bool
+        Continue an interrupted run from the last checkpoint of its journal, the completed output is identical to that of an uninterrupted run (default = False)
+
+        checkpoint_interval : float
+        Seconds between checkpoints (default = 60.0)
+
+        npz : bool
+        Also write the mapped domains as NumPy arrays to `columnar_path(out_file)`, see dommap_columnar (default = False, runs with a columnar output are not checkpointed)
+
+        index : bool
+        Build the index of the completed output, see dommap_index (default = False, only uncompressed outputs can be indexed)
+
+        profile : dommap_profile.MapProfile
+        Adds the time of each stage of mapping, and of writing the output, to the profile (default = None, not profiled)
+
+        telemetry : dommap_telemetry.ProgressTelemetry
+        Writes the progress, rates and memory of the run to the telemetry stream (default = None, no telemetry)
+
+        Returns
+        ------------
+        counts : MapCounts
+        Number of proteins and domains in the output file
+        """
+
+        if index and (out_file == "-" or dommap_io.output_compression(out_file) is not None):
+            raise ValueError("Only uncompressed output files can be indexed.")
+
+        # Standard input and output can not be read again, and compressed outputs can not be truncated back to a checkpoint
+        journal = None
+
+        if in_file != "-" and out_file != "-" and dommap_io.output_compression(out_file) is None and not npz:
+
+            journal = dommap_io.MapJournal(out_file)
+
+            in_stat = os.stat(in_file)
+
+            run = {"time": str(datetime.now()), "in_file": in_file, "in_size": in_stat.st_size, "in_mtime": in_stat.st_mtime_ns, "options": list(self.mapping_args()[1:])}
+
+        checkpoint = journal.read() if journal is not None and resume else None
+
+        if checkpoint is not None:
+
+            if [checkpoint[key] for key in ("in_file", "in_size", "in_mtime", "options")] != [run[key] for key in ("in_file", "in_size", "in_mtime", "options")]:
+                raise ValueError("The journal '{}' was written for a different input file or different options, remove it to map the file again.".format(journal.path))
+
+            if not os.path.exists(out_file) or os.path.getsize(out_file) < checkpoint["out_bytes"]:
+                raise ValueError("The output '{}' is shorter than its journal '{}', remove the journal to map the file again.".format(out_file, journal.path))
+
+            # The header of the resumed output keeps the time of the interrupted run
+            run["time"] = checkpoint["time"]
+
+        # Uncompressed inputs are resumed from the end of the last mapped query, compressed inputs and stores skip the mapped queries without parsing them
+        skip_queries = in_file != "-" and (dommap_io.input_compression(in_file) is not None or dommap_store.is_store(in_file))
+
+        proteins = checkpoint["proteins"] if checkpoint is not None else 0
+
+        start = checkpoint["in_offset"] if checkpoint is not None and not skip_queries else 0
+
+        if profile is not None:
+            profile.start()
+
+        if telemetry is not None:
+            telemetry.start(in_file, os.path.getsize(in_file) if in_file != "-" else None, proteins, checkpoint["counts"][1] if checkpoint is not None else 0, start)
+
+        mapped_proteins = self.map_proteins(in_file, start, proteins if skip_queries else 0, profile, telemetry)
+
+        # If proteins were not detected from the input hmm file, then raise an error
+        # Usually, this is because `--domtblout` was used in HMMER3 instead of `-o`
+        first_protein = next(mapped_proteins, None)
+
+        if first_protein is None and checkpoint is None:
+            raise ValueError("Input hmmscan file '{}' could not be read.\n\nOne common reasons for this error is providing a `hmmscan --domtblout` file instead of a `hmmscan -o` file.".format(in_file))
+
+        # Final formatted output, the header counts are filled in once all proteins have been mapped
+        mapped_domains_file = dommap_io.DomainMapWriter(run["time"] if journal is not None else datetime.now(), in_file, out_file, self.intra_gap, self.inter_gap, self.overlap, self.frac_overlap, self.eval_cutoff, resume = checkpoint,
+                                                        columnar_file = columnar_path(out_file) if npz else None)
+
+        # Ends of the queries of an uncompressed input, found without parsing them, so that a checkpoint never falls within a block of queries
+        query_ends = dommap_io.query_ends(in_file, start) if journal is not None and not skip_queries else None
+
+        in_offset = start
+
+        last_checkpoint = monotonic()
+
+        # Progress is tracked by the position in the input hmm file, the size of standard input is not known
+        # The progress bar is kept apart from mapped domains streamed to standard output, and is only drawn to a terminal
+        progress_bar = None
+
+        if progress and in_file != "-":
+
+            progress_bar = dommap_io.ProgressBar(os.path.getsize(in_file), prefix = "Mapping:", suffix = "Complete", length = 50, file = sys.stderr if out_file == "-" else sys.stdout)
+
+            progress_bar.update(start)
+
+        for records, hmmscan_offset in chain([first_protein] if first_protein is not None else [], mapped_proteins):
+
+            mapped_domains_file.write_records(records)
+
+            proteins += 1
+
+            if query_ends is not None:
+                in_offset = next(query_ends, None)
+
+            if journal is not None and monotonic() - last_checkpoint >= checkpoint_interval and (in_offset is not None or skip_queries):
+
+                journal.write(dict(run, proteins = proteins, counts = mapped_domains_file.counts(), out_bytes = mapped_domains_file.checkpoint(), in_offset = in_offset))
+
+                last_checkpoint = monotonic()
+
+            if progress_bar is not None:
+                progress_bar.update(hmmscan_offset)
+
+            if telemetry is not None:
+                telemetry.update(proteins, mapped_domains_file.Tot_cnt, hmmscan_offset)
+
+            if profile is not None:
+                profile.lap("write")
+
+        # Complete the progress bar past any trailing lines of the input hmm file
+        if progress_bar is not None:
+            progress_bar.finish()
+
+        # Fill in the header with the final domain counts
+        mapped_domains_file.close()
+
+        if journal is not None:
+            journal.remove()
+
+        if index:
+            dommap_index.OutputIndex.build(out_file)
+
+        if telemetry is not None:
+            telemetry.finish(proteins, mapped_domains_file.Tot_cnt)
+
+        return MapCounts(mapped_domains_file.Tot_prot_cnt, mapped_domains_file.Tot_cnt, mapped_domains_file.NC_cnt, mapped_domains_file.CP_cnt, mapped_domains_file.IS_cnt)
+
+
+def columnar_path(out_file: str):
+    """
+    Returns the path of the columnar output written next to an output file, e.g. `name.mapped.npz` for `name.mapped.out.gz`,
+    or `name.columnar.npz` for an output file `name.npz`, which would otherwise be overwritten
+    """
+
+    if dommap_io.output_compression(out_file) is not None:
+        out_file = os.path.splitext(out_file)[0]
+
+    name, extension = os.path.splitext(out_file)
+
+    return name + (".columnar.npz" if extension.lower() == ".npz" else ".npz")
+
+
+def map_domains(hmmscan, **options):
+    """
+    Maps every protein of a hmmscan output (path or iterable of parsed proteins) and yields each mapped domain as a DomainRecord.
+    Options are those of DomainMapperEngine, use an engine directly to map many files without reloading the domain definitions.
+    """
+
+    return DomainMapperEngine(**options).map_domains(hmmscan)
@@ -0,0 +1,380 @@
+# dommmap_index.py
+# This file contains the sidecar index of a mapped output, which looks up the rows of a protein, F-group or X-group without reading the whole output
+
+import os
+
+import sys
+
+import mmap
+
+import struct
+
+import bisect
+
+import hashlib
+
+from array import array
+
+from operator import itemgetter
+
+from DomainMapper import dommap_io
+
+
+# Columns of the output which are indexed, and their position within a row
+group_columns = {"x_group": 5, "f_group": 7}
+
+
+def index_path(out_file: str):
+    """
+    Returns the path of the index of an output file, `name.mapped.out.idx` for `name.mapped.out`
+    """
+
+    return out_file + ".idx"
+
+
+def accession_hash(accession):
+    """
+    Returns the 64-bit key of an accession (str or utf-8 bytes) in the index
+    """
+
+    if isinstance(accession, str):
+        accession = accession.encode()
+
+    return int.from_bytes(hashlib.blake2b(accession, digest_size = 8).digest(), "little")
+
+
+class OutputIndex:
+    """
+    Read-only index of an uncompressed mapped output, looked up through memory maps of the index and of the output.
+    Proteins are found by a binary search over the sorted keys of their accessions, and the rows of an F-group or X-group are listed by their byte offsets,
+    so every lookup reads only the rows it returns. The index is tied to the size and modification time of the output it was built from.
+
+    Index layout
+    ------------
+    magic : 8 bytes
+    size and modification time (ns) of the output, number of proteins, rows, X-groups and F-groups : 6 little-endian uint64
+    columns, each padded to 8 bytes :
+        protein_keys (proteins, uint64) : sorted keys of the protein accessions, see `accession_hash`
+        protein_rows (proteins, uint64) : byte offset of the first row of each protein (in the same order)
+        protein_counts (proteins, uint32) : number of rows of each protein
+        for the X-groups and then the F-groups :
+            names (string table) : (groups + 1, uint64) offsets into the sorted, newline terminated utf-8 names which follow them
+            group_rows (groups + 1, uint64) : first row of each group in `rows`
+            rows (rows, uint64) : byte offsets of the rows of each group, in output order
+    """
+
+    magic = b'DMIDX1\n\x00'
+
+    __counts = struct.Struct('<6Q')
+
+    def __init__(self, out_file: str, index_file: str = None):
+
+        self.out_file = out_file
+
+        self.index_file = index_path(out_file) if index_file is None else index_file
+
+        with open(self.index_file, 'rb') as idx_file:
+
+            if idx_file.read(len(self.magic)) != self.magic:
+                raise ValueError("'{}' is not the index of a mapped output.".format(self.index_file))
+
+            self.__index = mmap.mmap(idx_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        out_size, out_mtime, self.n_proteins, self.n_rows, n_x_groups, n_f_groups = self.__counts.unpack_from(self.__index, len(self.magic))
+
+        out_stat = os.stat(out_file)
+
+        if (out_stat.st_size, out_stat.st_mtime_ns) != (out_size, out_mtime):
+            raise ValueError("The index '{}' is out of date with '{}', build it again with 'dommap query --build'.".format(self.index_file, out_file))
+
+        # Empty files can not be memory mapped
+        with open(out_file, 'rb') as mapped_file:
+            self.__output = mmap.mmap(mapped_file.fileno(), 0, access = mmap.ACCESS_READ) if out_size else b''
+
+        pos = len(self.magic) + self.__counts.size
+
+        # Columns are little-endian, see `dommap_io.little_endian_column`
+        def column(fmt, length):
+            nonlocal pos
+            values = dommap_io.little_endian_column(self.__index, pos, fmt, length)
+            pos += -(-length*struct.calcsize('<' + fmt)//8)*8
+            return values
+
+        self.__protein_keys = column('Q', self.n_proteins)
+        self.__protein_rows = column('Q', self.n_proteins)
+        self.__protein_counts = column('I', self.n_proteins)
+
+        # There are few groups, their names are decoded once
+        self.__groups = dict()
+
+        for name, n_groups in (("x_group", n_x_groups), ("f_group", n_f_groups)):
+
+            name_offsets = column('Q', n_groups + 1)
+            names = self.__index[pos:pos + name_offsets[-1]].decode().split('\n')[:-1]
+            pos += -(-name_offsets[-1]//8)*8
+
+            self.__groups[name] = ({group: i for i, group in enumerate(names)}, column('Q', n_groups + 1), column('Q', self.n_rows))
+
+    def __len__(self):
+        return self.n_rows
+
+    def __row(self, offset: int):
+        return self.__output[offset:self.__output.find(b'\n', offset) + 1]
+
+    def accession_rows(self, accession: str):
+        """
+        Returns the rows of a protein (in output order), or an empty list if it has no mapped domains
+        """
+
+        key = accession_hash(accession)
+
+        prefix = accession.encode() + b'\t'
+
+        rows = list()
+
+        # Proteins with the same key are sorted by the offset of their rows, and rows of other accessions which share the key are left out
+        for i in range(bisect.bisect_left(self.__protein_keys, key), bisect.bisect_right(self.__protein_keys, key)):
+
+            offset = self.__protein_rows[i]
+
+            for _ in range(self.__protein_counts[i]):
+
+                row = self.__row(offset)
+
+                offset += len(row)
+
+                if row.startswith(prefix):
+                    rows.append(row.decode())
+
+        return rows
+
+    def group_names(self, column: str):
+        """
+        Returns the sorted names of an indexed column ("x_group" or "f_group")
+        """
+
+        return list(self.__groups[column][0])
+
+    def group_rows(self, column: str, name: str):
+        """
+        Returns the rows of an X-group or F-group (in output order)
+
+        Parameters
+        ------------
+        column : str
+        "x_group" or "f_group"
+
+        name : str
+        Name of the group as written in the output
+        """
+
+        names, group_rows, rows = self.__groups[column]
+
+        if name not in names:
+            return []
+
+        group = names[name]
+
+        return [self.__row(rows[i]).decode() for i in range(group_rows[group], group_rows[group + 1])]
+
+    @staticmethod
+    def build(out_file: str, index_file: str = None):
+        """
+        Builds the index of a mapped output in two passes over the output, the first lists the proteins and counts the rows of each group,
+        and the second writes the byte offset of each row to its group. Only the proteins are held in memory.
+
+        Parameters
+        ------------
+        out_file : str
+        Path of an uncompressed mapped output (not standard output)
+
+        index_file : str
+        Path of the index (default = `index_path(out_file)`)
+
+        Returns
+        ------------
+        n_rows : int
+        Number of rows in the index
+        """
+
+        index_file = index_path(out_file) if index_file is None else index_file
+
+        if dommap_io.input_compression(out_file) is not None:
+            raise ValueError("'{}' is compressed, only uncompressed outputs can be indexed.".format(out_file))
+
+        out_stat = os.stat(out_file)
+
+        # Each protein is packed into a single int as (key, byte offset of its first row, number of rows), so that the proteins are sorted by key
+        proteins = list()
+
+        # Rows are counted by their groups in every indexed column at once, and the count of each group is summed up after the first pass
+        groups_counts = dict()
+
+        row_groups = itemgetter(*group_columns.values())
+
+        accession, first_row, protein_start, n_rows = None, 0, 0, 0
+
+        for row, offset in OutputIndex.__rows(out_file):
+
+            fields = row.split(b'\t', 8)
+
+            if fields[0] != accession:
+
+                if accession is not None:
+                    proteins.append(accession_hash(accession) << 96 | first_row << 32 | n_rows - protein_start)
+
+                accession, first_row, protein_start = fields[0], offset, n_rows
+
+            groups = row_groups(fields)
+
+            groups_counts[groups] = groups_counts.get(groups, 0) + 1
+
+            n_rows += 1
+
+        if accession is not None:
+            proteins.append(accession_hash(accession) << 96 | first_row << 32 | n_rows - protein_start)
+
+        proteins.sort()
+
+        group_counts = {column: dict() for column in group_columns}
+
+        for groups, count in groups_counts.items():
+            for column, group in zip(group_columns, groups):
+                group_counts[column][group] = group_counts[column].get(group, 0) + count
+
+        mask = (1 << 64) - 1
+
+        protein_keys = array('Q', (protein >> 96 for protein in proteins))
+        protein_rows = array('Q', (protein >> 32 & mask for protein in proteins))
+        protein_counts = array('I', (protein & 0xFFFFFFFF for protein in proteins))
+
+        del proteins
+
+        tmp_path = index_file + '.tmp'
+
+        with open(tmp_path, 'w+b') as idx_file:
+
+            idx_file.write(OutputIndex.magic)
+
+            idx_file.write(OutputIndex.__counts.pack(out_stat.st_size, out_stat.st_mtime_ns, len(protein_keys), n_rows, len(group_counts["x_group"]), len(group_counts["f_group"])))
+
+            for values in (protein_keys, protein_rows, protein_counts):
+                OutputIndex.__write_column(idx_file, values)
+
+            # Position of the next row of each group within the rows column of the index, filled in by the second pass
+            group_cursors = dict()
+
+            for column in group_columns:
+
+                names = sorted(group_counts[column])
+
+                name_offsets = array('Q', [0])
+
+                for name in names:
+                    name_offsets.append(name_offsets[-1] + len(name) + 1)
+
+                OutputIndex.__write_column(idx_file, name_offsets)
+
+                OutputIndex.__write_column(idx_file, b''.join(name + b'\n' for name in names))
+
+                group_rows = array('Q', [0])
+
+                for name in names:
+                    group_rows.append(group_rows[-1] + group_counts[column][name])
+
+                OutputIndex.__write_column(idx_file, group_rows)
+
+                rows_start = idx_file.tell()
+
+                group_cursors[column] = {name: rows_start + 8*group_rows[i] for i, name in enumerate(names)}
+
+                idx_file.seek(rows_start + 8*n_rows)
+
+            idx_file.truncate()
+
+            if n_rows:
+                OutputIndex.__write_group_rows(out_file, idx_file, group_cursors)
+
+        os.replace(tmp_path, index_file)
+
+        return n_rows
+
+    @staticmethod
+    def __rows(out_file: str):
+        """
+        Yields each row of an output file (without the header and trailer comments) and its byte offset
+        """
+
+        offset = 0
+
+        with open(out_file, 'rb') as mapped_file:
+
+            for row in mapped_file:
+
+                if row[0] != 35 and row != b'\n':
+                    yield row, offset
+
+                offset += len(row)
+
+    @staticmethod
+    def __write_column(idx_file, values):
+
+        if isinstance(values, array) and sys.byteorder == 'big':
+            values.byteswap()
+
+        values = values.tobytes() if isinstance(values, array) else values
+
+        idx_file.write(values + bytes(-len(values) % 8))
+
+    @staticmethod
+    def __write_group_rows(out_file: str, idx_file, group_cursors: dict):
+        """
+        Second pass over the output, writes the byte offset of each row to the next position of each of its groups
+        """
+
+        index = mmap.mmap(idx_file.fileno(), 0)
+
+        columns = [(field, group_cursors[column]) for column, field in group_columns.items()]
+
+        pack_row = struct.Struct('<Q').pack_into
+
+        try:
+
+            for row, offset in OutputIndex.__rows(out_file):
+
+                fields = row.split(b'\t', 8)
+
+                for field, cursors in columns:
+
+                    group = fields[field]
+
+                    pack_row(index, cursors[group], offset)
+
+                    cursors[group] += 8
+
+            index.flush()
+
+        finally:
+
+            index.close()
+
+
+def is_current(out_file: str, index_file: str = None):
+    """
+    Checks if an output has an index which is up to date with it
+    """
+
+    index_file = index_path(out_file) if index_file is None else index_file
+
+    try:
+
+        with open(index_file, 'rb') as idx_file:
+
+            header = idx_file.read(len(OutputIndex.magic) + 16)
+
+        out_stat = os.stat(out_file)
+
+    except OSError:
+        return False
+
+    return header[:len(OutputIndex.magic)] == OutputIndex.magic and struct.unpack_from('<2Q', header, len(OutputIndex.magic)) == (out_stat.st_size, out_stat.st_mtime_ns)
@@ -1,6 +1,40 @@
+import io
+
+import os
+
+import json
+
+import mmap
+
 import sys
 
-def file_header(time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_tol, eval_tol, Tot_prot_cnt, Tot_cnt, NC_cnt, CP_cnt, IS_cnt):
+import queue
+
+import struct
+
+import shutil
+
+import threading
+
+import importlib
+
+from time import monotonic
+
+from array import array
+
+# Width of the `#====` banner of the file header
+__header_width = 92
+
+# Order in which domain topologies are listed in the output
+topology_order = ("NC", "CP", "IS")
+
+# Magic bytes at the start of compressed inputs, and the module which decompresses them
+__compression_magic = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "lzma"))
+
+# Extensions of compressed outputs, and the module which compresses them
+__compression_ext = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma"}
+
+def file_header(time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_tol, frac_overlap_tol, eval_tol, Tot_prot_cnt, Tot_cnt, NC_cnt, CP_cnt, IS_cnt):
     fileHeader = """#===========================================================================================
 #  DOMAIN MAPPER v3.0.2
 #  Johns Hopkins Univeristy - September 22nd, 2022
@@ -19,25 +53,762 @@ def file_header(time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_t
 #  Options:
 #               Intra domain gap = {:2d}
 #               Inter domain gap = {:2d}
-#               overlap = {:2d}
+#               overlap = {:2d}, Fractional overlap = {}
 #               E-value cutoff = {:1.2e}
 #  Domain Counts:
-#               Total Proteins: {:6d}         Total Domains:  {:6d}
-#                                                        NC : {:3d} ({:.2%})
-#                                                        CP : {:3d} ({:.2%})
-#                                                        IS : {:3d} ({:.2%})
+{}
 #  Property Definitions:
 #               CP = Circular Permutant Domain
 #               NC = Non-Contiguous Domain
 #               IS = InSertional Domain
 #===========================================================================================
 # Accession\tE-Value\tResidue Range\tProperty\tArchitecture\tX-group\tT-group\tF-group\tF-id
-""".format(time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_tol, eval_tol, Tot_prot_cnt, Tot_cnt, NC_cnt, float(NC_cnt)/float(Tot_cnt), CP_cnt, float(CP_cnt)/float(Tot_cnt), IS_cnt, float(IS_cnt)/float(Tot_cnt),)
+""".format(time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_tol, frac_overlap_tol, eval_tol, domain_counts(Tot_prot_cnt, Tot_cnt, NC_cnt, CP_cnt, IS_cnt) if Tot_prot_cnt is not None else __trailer_counts)
     return fileHeader
 
+# Domain counts of the file header of a streamed output, which are written at the end of the output instead
+__trailer_counts = "\n".join(["#               Listed at the end of the output"] + ["#"]*3)
+
+def file_trailer(Tot_prot_cnt, Tot_cnt, NC_cnt, CP_cnt, IS_cnt):
+    """
+    Formats the domain counts written at the end of a streamed output, whose header can not be rewritten once the counts are known
+    """
+    return "#===========================================================================================\n#  Domain Counts:\n" + domain_counts(Tot_prot_cnt, Tot_cnt, NC_cnt, CP_cnt, IS_cnt) + "\n"
+
+def domain_counts(Tot_prot_cnt, Tot_cnt, NC_cnt, CP_cnt, IS_cnt):
+    """
+    Formats the domain counts of the file header.
+    Each line is padded to the width of the header banner so that the header size does not change with the counts,
+    this allows the header to be reserved before mapping and rewritten in place once the final counts are known.
+    """
+    # Avoid dividing by zero when no domains could be mapped
+    Tot_frac = float(Tot_cnt) if Tot_cnt else 1.0
+    domainCounts = [
+        "#               Total Proteins: {:6d}         Total Domains:  {:6d}".format(Tot_prot_cnt, Tot_cnt),
+        "#                                                        NC : {:3d} ({:.2%})".format(NC_cnt, float(NC_cnt)/Tot_frac),
+        "#                                                        CP : {:3d} ({:.2%})".format(CP_cnt, float(CP_cnt)/Tot_frac),
+        "#                                                        IS : {:3d} ({:.2%})".format(IS_cnt, float(IS_cnt)/Tot_frac),
+    ]
+    return "\n".join([line.ljust(__header_width) for line in domainCounts])
+
+def domain_row(accession, dom):
+    """
+    Formats a mapped domain into a single row of the output file.
+    Topologies are always listed in the same order so the output does not depend on set ordering.
+    """
+    return ("{}\t"*9).format(accession, f"{dom.e_val:3.2e}", dom.res_str, " ".join([top for top in topology_order if top in dom.topology]), dom.arch, dom.x_group, dom.t_group, dom.f_group, dom.f_id)+"\n"
+
+def input_compression(path):
+    """
+    Returns the module which decompresses a file ("gzip", "bz2" or "lzma"), detected from its first bytes, or `None` if the file is not compressed
+    """
+    with open(path, "rb") as in_file:
+        return __magic_compression(in_file.read(6))
+
+def __magic_compression(head):
+    for magic, module in __compression_magic:
+        if head.startswith(magic):
+            return module
+    return None
+
+def output_compression(path):
+    """
+    Returns the module which compresses a file ("gzip", "bz2" or "lzma"), chosen by its extension (.gz, .bz2 or .xz), or `None` for any other extension
+    """
+    return __compression_ext.get(os.path.splitext(path)[1].lower())
+
+def open_input(path, mode = "rb"):
+    """
+    Opens an input file for reading, gzip, bz2 and xz compressed files are decompressed in a background thread.
+
+    Parameters
+    ------------
+    path : str
+    Path to the input file, or "-" for standard input
+
+    mode : str
+    "rb" for a binary stream or "r" for a text stream
+
+    Returns
+    ------------
+    input_file : file
+    Stream of the (decompressed) contents, see `input_offset` for the position in the input file
+    """
+
+    if path == "-":
+
+        # Standard input is left open when the stream is closed
+        raw = open(sys.stdin.fileno(), "rb", closefd = False)
+
+        compression = __magic_compression(raw.peek(6)[:6])
+
+        if compression is None:
+            return raw if mode == "rb" else io.TextIOWrapper(raw)
+
+    else:
+
+        compression = input_compression(path)
+
+        if compression is None:
+            return open(path, mode)
+
+        raw = open(path, "rb")
+
+    stream = io.BufferedReader(BackgroundReader(raw, lambda: __decompressor(compression)), 1048576)
+
+    return stream if mode == "rb" else io.TextIOWrapper(stream)
+
+def __decompressor(compression):
+    """
+    Returns a decompressor of a single gzip member, bz2 stream or xz stream
+    """
+    if compression == "gzip":
+        return importlib.import_module("zlib").decompressobj(31)
+    if compression == "bz2":
+        return importlib.import_module("bz2").BZ2Decompressor()
+    return importlib.import_module("lzma").LZMADecompressor()
+
+def input_offset(input_file):
+    """
+    Returns the byte offset in the input file that has been read from a stream of `open_input`, or `None` for pipes.
+    Offsets of compressed files are given in the compressed file, as is their size on disk.
+    """
+    raw = getattr(getattr(input_file, "buffer", input_file), "raw", None)
+    if isinstance(raw, BackgroundReader):
+        return raw.position
+    try:
+        return input_file.tell()
+    except OSError:
+        return None
+
+def little_endian_column(buffer, start, fmt, length):
+    """
+    Returns `length` little-endian values of a single struct format character (e.g. 'I', 'Q' or 'd') from `start` of a buffer such as a memory map.
+    Columns are read in place on little-endian machines, and byte swapped into an array on big-endian machines.
+    """
+    values = memoryview(buffer)[start:start + length*struct.calcsize('<' + fmt)]
+    if sys.byteorder == 'little':
+        return values.cast(fmt)
+    values = array(fmt, values.tobytes())
+    values.byteswap()
+    return values
+
+class BackgroundReader(io.RawIOBase):
+    """
+    Raw binary stream which reads and decompresses a file in a background thread, ahead of the reader.
+    zlib, bz2 and lzma release the GIL while they decompress, so decompression overlaps with mapping.
+    Large pieces of the file are decompressed at a time, the GIL is taken back after every piece and smaller pieces leave the thread waiting on the reader.
+    """
+
+    def __init__(self, raw, new_decompressor, chunk_size = 262144, max_chunks = 8):
+
+        # Compressed file
+        self.raw = raw
+
+        # Returns a decompressor for each of the concatenated streams (or gzip members) of the file
+        self.new_decompressor = new_decompressor
+
+        # Byte offset in the compressed file up to which the returned data was decompressed
+        self.position = 0
+
+        self.chunk = memoryview(b"")
+
+        self.at_eof = False
+
+        self.chunks = queue.Queue(max_chunks)
+
+        self.closing = threading.Event()
+
+        self.thread = threading.Thread(target = self.read_ahead, args = (chunk_size,), daemon = True)
+
+        self.thread.start()
+
+    def readable(self):
+        return True
+
+    def read_ahead(self, chunk_size):
+        """
+        Decompresses pieces of `chunk_size` bytes of the file until the end of the file or until the reader is closed
+        """
+
+        try:
+
+            decompressor = self.new_decompressor()
+
+            # Streams which have not been started may only be followed by the end of the file
+            started = False
+
+            raw_offset = 0
+
+            while not self.closing.is_set():
+
+                data = self.raw.read1(chunk_size)
+
+                # Pipes can not tell their position, so it is counted from the bytes read
+                raw_offset += len(data)
+
+                if not data:
+
+                    if started and not decompressor.eof:
+                        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+
+                    self.put((b"", raw_offset))
+
+                    return
+
+                chunk = b""
+
+                # Streams may be followed by zeros as padding
+                if not started:
+                    data = data.lstrip(b"\x00")
+
+                while data:
+
+                    chunk += decompressor.decompress(data)
+
+                    started = True
+
+                    data = b""
+
+                    # The next stream starts in the unused data of the last one
+                    if decompressor.eof:
+                        data = decompressor.unused_data.lstrip(b"\x00")
+                        decompressor = self.new_decompressor()
+                        started = False
+
+                if chunk and not self.put((chunk, raw_offset)):
+                    return
+
+        except Exception as err:
+            self.put((err, self.position))
+
+    def put(self, item):
+
+        # The queue is only waited on while the reader is open
+        while not self.closing.is_set():
+            try:
+                self.chunks.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def readinto(self, buffer):
+
+        if not self.chunk:
+
+            if self.at_eof:
+                return 0
+
+            chunk, self.position = self.chunks.get()
+
+            if isinstance(chunk, Exception):
+                self.at_eof = True
+                raise OSError("Input file could not be decompressed ({}).".format(chunk)) from chunk
+
+            if not chunk:
+                self.at_eof = True
+                return 0
+
+            self.chunk = memoryview(chunk)
+
+        size = min(len(buffer), len(self.chunk))
+
+        buffer[:size] = self.chunk[:size]
+
+        self.chunk = self.chunk[size:]
+
+        return size
+
+    def close(self):
+
+        if not self.closed:
+
+            self.closing.set()
+
+            self.thread.join()
+
+            self.raw.close()
+
+        super().close()
+
+class BackgroundWriter(io.RawIOBase):
+    """
+    Raw binary stream which writes (and compresses) to a file in a background thread, behind the writer.
+    zlib, bz2 and lzma release the GIL while they compress, so compression overlaps with mapping.
+    """
+
+    def __init__(self, stream, max_chunks = 8):
+
+        # Compressed stream
+        self.stream = stream
+
+        self.error = None
+
+        self.chunks = queue.Queue(max_chunks)
+
+        self.thread = threading.Thread(target = self.write_behind, daemon = True)
+
+        self.thread.start()
+
+    def writable(self):
+        return True
+
+    def write_behind(self):
+        """
+        Writes chunks to the stream until the writer is closed, chunks are still taken after an error so that the writer is never blocked
+        """
+
+        chunk = self.chunks.get()
+
+        while chunk is not None:
+
+            if self.error is None:
+                try:
+                    self.stream.write(chunk)
+                except Exception as err:
+                    self.error = err
+
+            chunk = self.chunks.get()
+
+    def write(self, data):
+
+        if self.error is not None:
+            raise self.error
+
+        chunk = bytes(data)
+
+        self.chunks.put(chunk)
+
+        return len(chunk)
+
+    def close(self):
+
+        if not self.closed:
+
+            self.chunks.put(None)
+
+            self.thread.join()
+
+            self.stream.close()
+
+        super().close()
+
+        if self.error is not None:
+            raise self.error
+
+class DomainMapWriter:
+    """
+    Writes mapped domains to the output file as soon as each protein is mapped.
+    The file header is reserved with empty domain counts when the file is opened, and it is rewritten in place with the final counts when the file is closed.
+    Outputs ending in .gz, .bz2 or .xz are compressed in a background thread, their rows are compressed into a temporary file
+    which is appended to the compressed header when the file is closed (gzip, bzip2 and xz all read concatenated streams as a single file).
+    The output "-" is streamed to standard output, which is flushed at least every `flush_interval` seconds while rows are written,
+    and its domain counts are written as a trailer at the end of the output.
+    The same domains are also written to `columnar_file` if it is given, as NumPy arrays (see dommap_columnar.ColumnarWriter).
+    """
+
+    def __init__(self, time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_tol, frac_overlap_tol, eval_tol, flush_interval = 0.5, resume = None, columnar_file = None):
+
+        self.header_args = (time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_tol, frac_overlap_tol, eval_tol)
+
+        self.out_file = out_file
+
+        self.streamed = out_file == "-"
+
+        self.compression = None if self.streamed else output_compression(out_file)
+
+        self.flush_interval = flush_interval
+
+        self.Tot_prot_cnt = 0
+
+        self.Tot_cnt = 0
+
+        self.NC_cnt = 0
+
+        self.CP_cnt = 0
+
+        self.IS_cnt = 0
+
+        # NumPy is only needed for the columnar output
+        self.columnar = None if columnar_file is None else importlib.import_module("DomainMapper.dommap_columnar").ColumnarWriter(columnar_file)
+
+        if self.streamed:
+
+            self.handle = sys.stdout
+
+            self.header_len = self.handle.write(file_header(*self.header_args, None, None, None, None, None))
+
+            self.handle.flush()
+
+            self.last_flush = monotonic()
+
+        elif resume is not None:
+
+            # Rows written after the last checkpoint are dropped, and written again as they are mapped
+            self.Tot_prot_cnt, self.Tot_cnt, self.NC_cnt, self.CP_cnt, self.IS_cnt = resume["counts"]
+
+            self.handle = open(out_file, "r+")
+
+            self.handle.truncate(resume["out_bytes"])
+
+            self.handle.seek(resume["out_bytes"])
+
+            self.header_len = len(self.header())
+
+        elif self.compression is None:
+
+            self.handle = open(out_file, "w")
+
+            self.header_len = self.handle.write(self.header())
+
+        else:
+
+            # Compressed files can not be rewritten in place
+            self.rows_file = out_file + ".rows.tmp"
+
+            rows_stream = importlib.import_module(self.compression).open(self.rows_file, "wb")
+
+            self.handle = io.TextIOWrapper(io.BufferedWriter(BackgroundWriter(rows_stream), 1048576))
+
+            self.header_len = len(self.header())
+
+    def header(self):
+        """
+        Returns the file header with the current domain counts
+        """
+
+        return file_header(*self.header_args, self.Tot_prot_cnt, self.Tot_cnt, self.NC_cnt, self.CP_cnt, self.IS_cnt)
+
+    def write(self, accession, domains):
+        """
+        Writes all mapped domains of a single protein and updates the domain counts
+        """
+
+        self.write_rows([(domain_row(accession, dom), dom.topology) for dom in domains])
+
+        if self.columnar is not None:
+            self.columnar.write_domains(accession, [(dom.e_val, dom.map_segments, dom.topology, dom.arch, dom.x_group, dom.t_group, dom.f_group, dom.f_id) for dom in domains])
+
+    def write_records(self, records):
+        """
+        Writes the domain records (dommap_engine.DomainRecord) of a single protein and updates the domain counts
+        """
+
+        self.write_rows([(domain_row(record.accession, record), record.topology) for record in records])
+
+        if self.columnar is not None:
+            self.columnar.write_records(records)
+
+    def write_rows(self, rows, proteins = 1):
+        """
+        Writes the formatted rows of a single protein, each paired with the topology of its domain, and updates the domain counts.
+        Rows copied from other outputs are written with the number of `proteins` they belong to (e.g. 0 for all but the last rows of an output).
+        """
+
+        self.Tot_prot_cnt += proteins
+
+        for row, topology in rows:
+
+            self.Tot_cnt += 1
+
+            if "CP" in topology:
+                self.CP_cnt += 1
+            if "NC" in topology:
+                self.NC_cnt += 1
+            if "IS" in topology:
+                self.IS_cnt += 1
+
+            self.handle.write(row)
+
+        if self.streamed and monotonic() - self.last_flush >= self.flush_interval:
+
+            self.handle.flush()
+
+            self.last_flush = monotonic()
+
+    def attributes(self):
+        """
+        Returns the mapping options and domain counts of the file header as a dict
+        """
+
+        time, in_file, out_file, intra_gap_tol, inter_gap_tol, overlap_tol, frac_overlap_tol, eval_tol = self.header_args
+
+        return {"time": str(time), "input": in_file, "output": out_file, "intra_gap": intra_gap_tol, "inter_gap": inter_gap_tol, "overlap": overlap_tol, "frac_overlap": frac_overlap_tol, "eval_cutoff": eval_tol,
+                "proteins": self.Tot_prot_cnt, "domains": self.Tot_cnt, "NC": self.NC_cnt, "CP": self.CP_cnt, "IS": self.IS_cnt}
+
+    def counts(self):
+        """
+        Returns the current domain counts
+        """
+
+        return [self.Tot_prot_cnt, self.Tot_cnt, self.NC_cnt, self.CP_cnt, self.IS_cnt]
+
+    def checkpoint(self):
+        """
+        Flushes the rows written so far to disk and returns the size of the output file
+        """
+
+        self.handle.flush()
+
+        os.fsync(self.handle.fileno())
+
+        return self.handle.tell()
+
+    def close(self):
+        """
+        Rewrites the reserved file header with the final domain counts, or writes them as the trailer of a streamed output
+        """
+
+        if self.columnar is not None:
+            self.columnar.close(self.attributes())
+
+        if self.streamed:
+            self.handle.write(file_trailer(self.Tot_prot_cnt, self.Tot_cnt, self.NC_cnt, self.CP_cnt, self.IS_cnt))
+            self.handle.flush()
+            return
+
+        header = self.header()
+
+        if len(header) != self.header_len:
+
+            # The rows written so far are left without a header
+            self.handle.close()
+
+            if self.compression is not None:
+                os.remove(self.rows_file)
+
+            raise ValueError("Domain counts of '{}' do not fit in the reserved file header.".format(self.out_file))
+
+        if self.compression is None:
+            self.handle.seek(0)
+            self.handle.write(header)
+            self.handle.close()
+            return
+
+        # Waits for the remaining rows to be compressed
+        self.handle.close()
+
+        with importlib.import_module(self.compression).open(self.out_file, "wt") as header_file:
+            header_file.write(header)
+
+        with open(self.out_file, "ab") as out_file, open(self.rows_file, "rb") as rows_file:
+            shutil.copyfileobj(rows_file, out_file, 1048576)
+
+        os.remove(self.rows_file)
+
+class MapJournal:
+    """
+    Checkpoint journal of an output file which is being mapped, kept next to the output as `<out_file>.journal`.
+    Each checkpoint records the input byte offset up to which proteins have been mapped, the running domain counts and the size of the output written so far.
+    A checkpoint replaces the previous one atomically, so the journal always holds a complete checkpoint.
+    """
+
+    def __init__(self, out_file):
+
+        self.path = out_file + ".journal"
+
+    def read(self):
+        """
+        Returns the last checkpoint, or `None` if there is no journal
+        """
+
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, "r") as journal_file:
+            return json.load(journal_file)
+
+    def write(self, checkpoint: dict):
+
+        tmp_path = self.path + ".tmp"
+
+        with open(tmp_path, "w") as journal_file:
+            json.dump(checkpoint, journal_file)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def __block_end(pending, block_start, block_size):
+    """
+    Returns the end of the first `//` line (queries end with `//`) that ends at least `block_size` bytes past the start of the block, or 0 if there is no such complete line
+    """
+    # Lines from the line holding the last byte of the block size onwards end past the block size
+    line_start = max(pending.rfind(b"\n", block_start, block_start + block_size - 1) + 1, block_start)
+    if pending[line_start:line_start + 2] == b"//":
+        return pending.find(b"\n", line_start) + 1
+    query_end = pending.find(b"\n//", line_start)
+    if query_end == -1:
+        return 0
+    return pending.find(b"\n", query_end + 1) + 1
+
+def query_ends(hmmscan, start = 0):
+    """
+    Finds the end of each query of an uncompressed `hmmscan -o` file without parsing them
+
+    Parameters
+    ------------
+    hmmscan : str
+    Path to file from `hmmscan -o`
+
+    start : int
+    Byte offset of the line to start from (default = 0)
+
+    Returns
+    ------------
+    query_ends : generator
+    Yields the byte offset in the input where each query ends, in input order
+    """
+
+    with open(hmmscan, "rb") as hmmscan_file:
+
+        # Empty files cannot be memory mapped
+        if not os.fstat(hmmscan_file.fileno()).st_size:
+            return
+
+        with mmap.mmap(hmmscan_file.fileno(), 0, access = mmap.ACCESS_READ) as buffer:
+
+            query_end = __block_end(buffer, start, 1)
+
+            while query_end:
+
+                yield query_end
+
+                query_end = __block_end(buffer, query_end, 1)
+
+def query_blocks(hmmscan, block_size = 1048576, start = 0, skip = 0):
+    """
+    Splits a hmmscan output into blocks of whole queries without parsing them.
+    Every block is prefixed with the preamble of the output so that it can be parsed on its own.
+
+    Parameters
+    ------------
+    hmmscan : str or file
+    Path to file from `hmmscan -o` (which may be compressed) or "-" for standard input, or a binary stream of its contents with a `read` method
+
+    block_size : int
+    Minimum number of bytes in a block, a block always ends at the end of a query.
+    Input is not waited on once a block is complete, so a small block size yields each query of a pipe as soon as it ends.
+
+    start : int
+    Byte offset of the line to start from in the uncompressed input, the preamble is still read from the beginning (default = 0)
+
+    skip : int
+    Number of queries to drop without parsing them, for inputs whose offsets are not known (default = 0)
+
+    Returns
+    ------------
+    query_blocks : generator
+    Yields each block as bytes along with the byte offset in the input where the block ends (in the compressed file for compressed inputs)
+    """
+
+    if isinstance(hmmscan, str):
+
+        with open_input(hmmscan) as hmmscan_file:
+
+            compressed = isinstance(hmmscan_file.raw, BackgroundReader)
+
+            for block, block_offset in query_blocks(hmmscan_file, block_size, start, skip):
+                yield block, input_offset(hmmscan_file) if compressed else block_offset
+
+        return
+
+    # Buffered streams return what is available without waiting for the full size
+    read = getattr(hmmscan, "read1", hmmscan.read)
+
+    read_size = max(block_size, 1048576)
+
+    preamble = None
+
+    pending = b""
+
+    # Streams can not always tell their position, so it is counted from the bytes read
+    offset = 0
+
+    chunk = None
+
+    while chunk != b"":
+
+        chunk = read(read_size)
+
+        pending += chunk
+
+        offset += len(chunk)
+
+        # The preamble ends at the first query
+        if preamble is None:
+
+            query_start = 0 if pending.startswith(b"Query:") else pending.find(b"\nQuery:") + 1
+
+            if not query_start and not pending.startswith(b"Query:"):
+                continue
+
+            preamble = pending[:query_start]
+
+            pending = pending[query_start:]
+
+            # Byte offset of the start of `pending` in the input
+            pending_start = offset - len(pending)
+
+            if start <= pending_start:
+                pass
+
+            elif start <= offset:
+                pending = pending[start - pending_start:]
+
+            elif getattr(hmmscan, "seekable", bool)():
+                hmmscan.seek(start)
+                offset = start
+                pending = b""
+
+            else:
+
+                while chunk and offset < start:
+                    chunk = read(min(read_size, start - offset))
+                    offset += len(chunk)
+
+                pending = b""
+
+        block_start = 0
+
+        # Queries which were already mapped are dropped
+        while skip:
+
+            query_end = __block_end(pending, block_start, 1)
+
+            if not query_end:
+                break
+
+            block_start = query_end
+
+            skip -= 1
+
+        block_end = __block_end(pending, block_start, block_size)
+
+        while block_end:
+
+            yield preamble + pending[block_start:block_end], offset - len(pending) + block_end
+
+            block_start = block_end
+
+            block_end = __block_end(pending, block_start, block_size)
+
+        pending = pending[block_start:]
+
+    # The last query may not end with `//`, and is dropped if it was already mapped
+    if preamble is not None and not skip and (pending.startswith(b"Query:") or b"\nQuery:" in pending):
+        yield preamble + pending, offset
+
 # This was stolen from: Greenstick @ https://stackoverflow.com/questions/3173320/text-progress-bar-in-the-console?page=1&tab=votes#tab-top
 # Headless and fast
-def progress_bar (iteration, total, prefix = '', suffix = '', decimals = 1, length = 100, fill = '█', printEnd = "\r"):
+def progress_bar (iteration, total, prefix = '', suffix = '', decimals = 1, length = 100, fill = '█', printEnd = "\r", file = None):
     """
     Call in a loop to create terminal progress bar
     @params:
@@ -49,14 +820,71 @@ def progress_bar (iteration, total, prefix = '', suffix = '', decimals = 1, leng
         length      - Optional  : character length of bar (Int)
         fill        - Optional  : bar fill character (Str)
         printEnd    - Optional  : end character (e.g. "\r", "\r\n") (Str)
+        file        - Optional  : stream to print to (default = sys.stdout) (File)
     """
     percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
     filledLength = int(length * iteration // total)
     bar = fill * filledLength + '-' * (length - filledLength)
-    print(f'\r{prefix} |{bar}| {percent}% {suffix}', end = printEnd)
+    print(f'\r{prefix} |{bar}| {percent}% {suffix}', end = printEnd, file = file)
     # Print New Line on Complete
     if iteration == total: 
-        print()
+        print(file = file)
+
+class ProgressBar:
+    """
+    Progress bar which is drawn at most once every `interval` seconds, however often it is updated, and only to a terminal.
+    Output redirected to a file or a pipe is left without a progress bar. The completed bar is always drawn.
+    """
+
+    def __init__(self, total, prefix = '', suffix = '', length = 50, file = None, interval = 0.1):
+
+        self.total = total
+
+        self.prefix = prefix
+
+        self.suffix = suffix
+
+        self.length = length
+
+        self.file = sys.stdout if file is None else file
+
+        self.interval = interval
+
+        isatty = getattr(self.file, "isatty", None)
+
+        self.enabled = total > 0 and isatty is not None and isatty()
+
+        self.next_draw = 0.0
+
+        self.complete = False
+
+    def update(self, iteration):
+        """
+        Draws the bar at `iteration` of `total`, unless it was drawn less than `interval` seconds ago and it is not complete
+        """
+
+        if not self.enabled or self.complete:
+            return
+
+        complete = iteration >= self.total
+
+        now = monotonic()
+
+        if now < self.next_draw and not complete:
+            return
+
+        self.next_draw = now + self.interval
+
+        self.complete = complete
+
+        progress_bar(min(iteration, self.total), self.total, prefix = self.prefix, suffix = self.suffix, length = self.length, file = self.file)
+
+    def finish(self):
+        """
+        Draws the completed bar, if it has not been drawn yet
+        """
+
+        self.update(self.total)
 
 def error_msg(msg):
     ErrMsg = 'ERROR: ' + msg + '\n' + 'System Exiting...\n'
@@ -82,7 +910,7 @@ DomainMapper is a HMMER3 output parser designed to annotate protein domains usin
 \n
 `https://github.com/FriedLabJHU/DomainMapper`
 
-The first 31 lines consist of a header containing input and output file names, and parameter values. This is followed by summary statistics for the domains identified in the FASTA file submitted.  
+The first 31 lines consist of a header containing input and output file names, and parameter values (the overlap line also lists the fractional overlap, e.g. `overlap = 40, Fractional overlap = 0.7`). This is followed by summary statistics for the domains identified in the FASTA file submitted. Unlike DomainMapper v3.0.2, the four lines of domain counts end in trailing spaces up to the width of the `#====` banner, which reserves room for the final counts so that the header is rewritten in place once mapping is done.  
 
 Specifically:
 
@@ -0,0 +1,270 @@
+# dommmap_parser.py
+# This file contains a lightweight parser for `hmmscan -o` outputs which only reads what DomainMapper needs from each high-scoring pair
+
+import os
+
+import re
+
+import mmap
+
+
+# regex for parsing query id and length, same as Bio.SearchIO
+__query_id_len = re.compile(r"^Query:\s*(.*)\s+\[\w=(\d+)\]")
+
+
+class QueryResult:
+    """
+    All hits of a query (protein) sequence
+    """
+
+    __slots__ = ("id", "hits", "end")
+
+    def __init__(self, id: str, hits: list, end: int):
+
+        self.id = id
+
+        self.hits = hits
+
+        # Byte offset in the input where this query ends
+        self.end = end
+
+
+class Hit:
+    """
+    All high-scoring pairs of a query aligned to a single HMM
+    """
+
+    __slots__ = ("id", "hsps")
+
+    def __init__(self, id: str, hsps: list):
+
+        self.id = id
+
+        self.hsps = hsps
+
+
+class HSP:
+    """
+    High-scoring pair with the same coordinates as Bio.SearchIO, ranges are 0-based and end exclusive.
+    The alignment of high-scoring pairs above the E-value cutoff is not read and is left as `None`.
+    """
+
+    __slots__ = ("hit_id", "query_range", "hit_range", "evalue_cond", "query_aln", "hit_aln")
+
+    def __init__(self, hit_id: str, query_range: tuple, hit_range: tuple, evalue_cond: float):
+
+        self.hit_id = hit_id
+
+        self.query_range = query_range
+
+        self.hit_range = hit_range
+
+        self.evalue_cond = evalue_cond
+
+        self.query_aln = None
+
+        self.hit_aln = None
+
+
+def parse(file_path: str, eval_cutoff: float = None, start: int = 0):
+    """
+    Parses a `hmmscan -o` file through a memory map of the file
+
+    Parameters
+    ------------
+    file_path : str
+    Path to file from `hmmscan -o`
+
+    eval_cutoff : float
+    Alignments are only read for high-scoring pairs with a conditional E-value less than or equal to the cutoff (default = all alignments are read)
+
+    start : int
+    Byte offset of the line to start parsing from, queries before it are not read (default = 0)
+
+    Returns
+    ------------
+    query_results : generator
+    Yields a QueryResult for each query in the file
+    """
+
+    with open(file_path, "rb") as hmmscan_file:
+
+        # Empty files cannot be memory mapped
+        if not os.fstat(hmmscan_file.fileno()).st_size:
+            return
+
+        with mmap.mmap(hmmscan_file.fileno(), 0, access = mmap.ACCESS_READ) as hmmscan:
+
+            yield from parse_buffer(hmmscan, eval_cutoff, start)
+
+
+def parse_buffer(hmmscan, eval_cutoff: float = None, start: int = 0):
+    """
+    Parses `hmmscan -o` output held in a bytes-like object (e.g. bytes or mmap), from the line at the `start` offset
+
+    Returns
+    ------------
+    query_results : generator
+    Yields a QueryResult for each query in the buffer
+    """
+
+    query_start = __find_line(hmmscan, b"Query:", start, len(hmmscan))
+
+    while query_start != -1:
+
+        # Queries always end with `//`
+        query_end = __find_line(hmmscan, b"//", query_start, len(hmmscan))
+
+        if query_end == -1:
+            query_end = len(hmmscan)
+
+        query_line = __line(hmmscan, query_start).decode()
+
+        query_id = re.search(__query_id_len, query_line).group(1).strip()
+
+        # The statistics summary follows the last hit
+        hits_end = __find_line(hmmscan, b"Internal pipeline", query_start, query_end)
+
+        if hits_end == -1:
+            hits_end = query_end
+
+        hits = list()
+
+        # Queries without any hits have no domain annotations
+        hit_start = __find_line(hmmscan, b">> ", query_start, hits_end)
+
+        while hit_start != -1:
+
+            next_hit_start = __find_line(hmmscan, b">> ", hit_start + 1, hits_end)
+
+            hits.append(__parse_hit(hmmscan, hit_start, hits_end if next_hit_start == -1 else next_hit_start, eval_cutoff))
+
+            hit_start = next_hit_start
+
+        # The next query starts after the `//` line
+        query_end = hmmscan.find(b"\n", query_end) + 1 or len(hmmscan)
+
+        yield QueryResult(query_id, hits, query_end)
+
+        query_start = __find_line(hmmscan, b"Query:", query_end, len(hmmscan))
+
+
+def __parse_hit(hmmscan, hit_start: int, hit_end: int, eval_cutoff: float):
+    """
+    Parses the domain table and alignments of a single hit, from its `>> ` line up to `hit_end`
+    """
+
+    hit_line = __line(hmmscan, hit_start).decode()
+
+    hit_id = hit_line[len(">> "):].split("  ", 1)[0]
+
+    hsps = list()
+
+    # The domain table starts after its header lines, hits without reported domains have no table
+    pos = __find_line(hmmscan, b" ---   ------ ----- --------", hit_start, hit_end)
+
+    if pos != -1:
+        pos = hmmscan.find(b"\n", pos, hit_end) + 1
+
+    while 0 < pos < hit_end:
+
+        row = __line(hmmscan, pos)
+
+        if not row.strip():
+            break
+
+        # Hits without reported domains, or the end of the hits
+        if row.startswith((b"   [No ", b"Internal pipeline", b"  Alignments for each domain:", b">>")):
+            break
+
+        parsed = row.split()
+
+        if len(parsed) != 16:
+            raise ValueError("Unexpected domain table row for '{}': {}".format(hit_id, row.decode().strip()))
+
+        # For hmmscan, the hit is the HMM and the query is the protein sequence
+        # 'from' and 'to' coordinates are adjusted to 0-based ones
+        hsps.append(HSP(hit_id, (int(parsed[9]) - 1, int(parsed[10])), (int(parsed[6]) - 1, int(parsed[7])), float(parsed[4])))
+
+        pos = hmmscan.find(b"\n", pos, hit_end) + 1
+
+    # Alignments are in the same order as the domain table
+    aln_start = __find_line(hmmscan, b"  == domain ", hit_start, hit_end)
+
+    for hsp in hsps:
+
+        if aln_start == -1:
+            break
+
+        aln_end = __find_line(hmmscan, b"  == domain ", aln_start + 1, hit_end)
+
+        if eval_cutoff is None or (1e-99, hsp.evalue_cond)[hsp.evalue_cond > 0] <= eval_cutoff:
+
+            hsp.hit_aln, hsp.query_aln = __parse_alignment(hmmscan[aln_start:hit_end if aln_end == -1 else aln_end])
+
+        aln_start = aln_end
+
+    return Hit(hit_id, hsps)
+
+
+def __parse_alignment(aln_block: bytes):
+    """
+    Joins the HMM and query lines of an alignment, the HMM line always comes first in each block.
+    Alignment lines consist of an identifier, a start coordinate, the aligned sequence and an end coordinate.
+
+    Returns
+    ------------
+    hmm_aln, query_aln : str
+    """
+
+    hmm_aln = list()
+
+    query_aln = list()
+
+    for line in aln_block.split(b"\n")[1:]:
+
+        parsed = line.split()
+
+        if len(parsed) == 4 and __is_coord(parsed[1]) and __is_coord(parsed[3]):
+
+            if len(hmm_aln) == len(query_aln):
+                hmm_aln.append(parsed[2])
+            else:
+                query_aln.append(parsed[2])
+
+    return b"".join(hmm_aln).decode(), b"".join(query_aln).decode()
+
+
+def __is_coord(token: bytes):
+    return token.isdigit() or token == b"-"
+
+
+def __find_line(hmmscan, prefix: bytes, start: int, end: int):
+    """
+    Returns the offset of the first line beginning with `prefix` between `start` and `end`, or -1
+    """
+
+    if start == 0:
+
+        if hmmscan[:len(prefix)] == prefix:
+            return 0
+
+        start = 1
+
+    # A line beginning at `start` is preceded by a line ending
+    pos = hmmscan.find(b"\n" + prefix, start - 1, end)
+
+    return pos if pos == -1 else pos + 1
+
+
+def __line(hmmscan, start: int):
+    """
+    Returns the line beginning at `start` without its line ending
+    """
+
+    end = hmmscan.find(b"\n", start)
+
+    if end == -1:
+        end = len(hmmscan)
+
+    return hmmscan[start:end].rstrip(b"\r")
@@ -0,0 +1,153 @@
+# dommmap_profile.py
+# This file contains the profile of a mapping run, the wall time and number of calls of each stage of mapping and the slowest proteins
+
+import json
+
+import heapq
+
+from time import perf_counter
+
+
+class MapProfile:
+    """
+    Wall time and number of calls of each stage of mapping, and the slowest proteins to map.
+    Stages are timed by laps, each `lap` adds the time since the previous lap to a stage, so every second of a run is counted in exactly one stage.
+    Profiles of worker processes are merged into the profile of the run, their stage times are summed over all workers.
+
+    Stages
+    ------------
+    parse : parsing proteins from the input file
+    domains : building a Domain from each high-scoring pair (Domain.__map_range_finder)
+    overlap_matrix : DomainMap.update_overlap_matrix
+    eliminate : DomainMap.eliminate_overlapping_domains
+    merge : merging the high-scoring pairs of a hit into non-contiguous and circularly permuted domains
+    insertional : labelling insertional domains
+    annotate : formatting the residue ranges and looking up the ECOD names of mapped domains
+    records : building the domain records of each protein
+    write : writing the rows of each protein to the output, along with checkpoints and the progress bar
+    """
+
+    stages = ("parse", "domains", "overlap_matrix", "eliminate", "merge", "insertional", "annotate", "records", "write")
+
+    def __init__(self, n_slowest: int = 10):
+
+        self.n_slowest = n_slowest
+
+        self.seconds = dict.fromkeys(self.stages, 0.0)
+
+        self.calls = dict.fromkeys(self.stages, 0)
+
+        self.proteins = 0
+
+        self.hits = 0
+
+        self.hsps = 0
+
+        self.domains = 0
+
+        # Heap of the slowest proteins, (seconds, protein number, accession, hits, high-scoring pairs, domains)
+        self.slowest = list()
+
+        self.last = perf_counter()
+
+    def start(self):
+        """
+        Starts the next lap from now, time since the previous lap is not counted
+        """
+
+        self.last = perf_counter()
+
+    def lap(self, stage: str, calls: int = 1):
+        """
+        Adds the time since the previous lap to a stage
+        """
+
+        now = perf_counter()
+
+        self.seconds[stage] += now - self.last
+
+        self.calls[stage] += calls
+
+        self.last = now
+
+    def protein(self, protein, n_domains: int, seconds: float):
+        """
+        Counts a mapped protein, and keeps it if it is one of the slowest proteins
+
+        Parameters
+        ------------
+        protein : dommap_parser.QueryResult or Bio.SearchIO QueryResult
+        Protein which was mapped
+
+        n_domains : int
+        Number of mapped domains of the protein
+
+        seconds : float
+        Time spent mapping the protein, without parsing it
+        """
+
+        n_hsps = sum(len(hit.hsps) for hit in protein.hits)
+
+        self.proteins += 1
+
+        self.hits += len(protein.hits)
+
+        self.hsps += n_hsps
+
+        self.domains += n_domains
+
+        entry = (seconds, self.proteins, protein.id, len(protein.hits), n_hsps, n_domains)
+
+        if len(self.slowest) < self.n_slowest:
+            heapq.heappush(self.slowest, entry)
+        elif self.slowest and entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def merge(self, profile):
+        """
+        Adds the stage times, counts and slowest proteins of another profile (e.g. of a worker process)
+        """
+
+        for stage in self.stages:
+
+            self.seconds[stage] += profile.seconds[stage]
+
+            self.calls[stage] += profile.calls[stage]
+
+        self.proteins += profile.proteins
+
+        self.hits += profile.hits
+
+        self.hsps += profile.hsps
+
+        self.domains += profile.domains
+
+        self.slowest = heapq.nlargest(self.n_slowest, self.slowest + profile.slowest)
+
+        heapq.heapify(self.slowest)
+
+    def report(self, **run):
+        """
+        Returns the profile as a dict, with the given details of the run (e.g. input file, options and elapsed time)
+        """
+
+        total = sum(self.seconds.values()) or 1.0
+
+        return dict(run,
+                    proteins = self.proteins, hits = self.hits, hsps = self.hsps, domains = self.domains,
+                    stages = {stage: {"seconds": round(self.seconds[stage], 6), "calls": self.calls[stage], "fraction": round(self.seconds[stage]/total, 4)} for stage in self.stages},
+                    slowest_proteins = [{"accession": accession, "seconds": round(seconds, 6), "hits": n_hits, "hsps": n_hsps, "domains": n_domains}
+                                        for seconds, _, accession, n_hits, n_hsps, n_domains in sorted(self.slowest, reverse = True)])
+
+    def write(self, report_file, **run):
+        """
+        Writes the report of the profile as JSON to a path or an open text file
+        """
+
+        if isinstance(report_file, str):
+            with open(report_file, "w") as report:
+                return self.write(report, **run)
+
+        json.dump(self.report(**run), report_file, indent = 2)
+
+        report_file.write("\n")
@@ -0,0 +1,430 @@
+# dommmap_serve.py
+# This file contains the server mode, which keeps the domain definitions and worker processes warm and maps hmmscan outputs sent over a local socket
+
+import os
+
+import json
+
+import stat
+
+import time
+
+import signal
+
+import threading
+
+from itertools import chain
+
+from collections import deque
+
+from urllib.parse import urlparse, parse_qs
+
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from DomainMapper import dommap_io
+
+from DomainMapper.dommap_engine import DomainMapperEngine, map_blocks
+
+
+class ServerStats:
+    """
+    Requests, queue depth and latencies of a server, shared by all request threads
+    """
+
+    def __init__(self, workers: int, latency_window: int = 1000):
+
+        self.lock = threading.Lock()
+
+        self.start_time = time.time()
+
+        self.workers = workers
+
+        self.requests = 0
+
+        self.failed = 0
+
+        self.active = 0
+
+        # Blocks of queries sent to the worker processes which have not been returned yet
+        self.queued_blocks = 0
+
+        self.proteins = 0
+
+        self.domains = 0
+
+        # Latencies (seconds) of the most recent requests
+        self.latencies = deque(maxlen = latency_window)
+
+    def report(self):
+        """
+        Returns the current statistics as a dictionary
+        """
+
+        with self.lock:
+
+            latencies = sorted(self.latencies)
+
+            latency_ms = dict()
+
+            if latencies:
+                latency_ms["mean"] = 1e3*sum(latencies)/len(latencies)
+                latency_ms["p50"] = 1e3*latencies[len(latencies)//2]
+                latency_ms["p95"] = 1e3*latencies[min(len(latencies) - 1, int(0.95*len(latencies)))]
+                latency_ms["max"] = 1e3*latencies[-1]
+
+            return {
+                "uptime_s": time.time() - self.start_time,
+                "workers": self.workers,
+                "requests": self.requests,
+                "failed": self.failed,
+                "active_requests": self.active,
+                "queue_depth": self.queued_blocks,
+                "proteins": self.proteins,
+                "domains": self.domains,
+                "latency_ms": latency_ms,
+            }
+
+
+class RequestBody:
+    """
+    Binary stream of a request body, reads never go past its `Content-Length`
+    """
+
+    def __init__(self, rfile, length: int):
+
+        self.rfile = rfile
+
+        self.remaining = length
+
+    def read(self, size: int):
+
+        if self.remaining <= 0:
+            return b""
+
+        data = self.rfile.read(min(size, self.remaining))
+
+        self.remaining -= len(data)
+
+        return data
+
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests of a DomainMapper server
+
+    GET /stats
+    Server statistics as JSON
+
+    POST /map
+    Maps the hmmscan output in the request body and streams back the mapped rows, in the same format as an output file without its header
+
+    GET or POST /map?path=<path>
+    Maps a `hmmscan -o` file within the `map_root` directory of the server (a path relative to it, or an absolute path inside it),
+    which may be gzip, bz2 or xz compressed, and streams back the mapped rows. Files are only mapped from the host if the server has a `map_root`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    server_version = "DomainMapper"
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix-socket"
+
+    def do_GET(self):
+
+        url = urlparse(self.path)
+
+        if url.path == "/stats":
+            self.send_json(self.server.stats.report())
+
+        elif url.path == "/map" and "path" in parse_qs(url.query):
+            self.map_request(url)
+
+        else:
+            self.send_error(404, "Unknown request, use 'GET /stats' or 'POST /map'")
+
+    def do_POST(self):
+
+        url = urlparse(self.path)
+
+        if url.path == "/map":
+            self.map_request(url)
+        else:
+            self.send_error(404, "Unknown request, use 'GET /stats' or 'POST /map'")
+
+    def send_json(self, obj: dict):
+
+        body = json.dumps(obj, indent = 2).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def map_request(self, url):
+        """
+        Maps the hmmscan output of a request with the shared worker pool, rows are sent back in input order as each block of queries is mapped
+        """
+
+        stats = self.server.stats
+
+        start_time = time.perf_counter()
+
+        with stats.lock:
+            stats.requests += 1
+            stats.active += 1
+
+        try:
+
+            query = parse_qs(url.query)
+
+            if "path" in query:
+
+                map_root = self.server.map_root
+
+                if map_root is None:
+                    return self.failed_request(403, "Files on the server host are not mapped, start the server with --map_root to map files within a directory.")
+
+                # Links out of the directory are resolved before the path is checked
+                hmmscan = os.path.realpath(os.path.join(map_root, query["path"][0]))
+
+                if os.path.commonpath([hmmscan, map_root]) != map_root:
+                    return self.failed_request(403, "'{}' is not within the directory files are mapped from.".format(query["path"][0]))
+
+                # Compressed files are decompressed in a background thread
+                if not os.path.isfile(hmmscan):
+                    return self.failed_request(404, "'{}' could not be found.".format(query["path"][0]))
+
+            else:
+
+                if "Content-Length" not in self.headers:
+                    return self.failed_request(411, "The hmmscan output must be sent with a Content-Length.")
+
+                hmmscan = RequestBody(self.rfile, int(self.headers["Content-Length"]))
+
+            mapped_blocks = self.server.map_blocks(dommap_io.query_blocks(hmmscan))
+
+            # The response is only started once the first block of proteins has been mapped
+            first_block = next(mapped_blocks, None)
+
+            if first_block is None:
+                return self.failed_request(400, "Input hmmscan file could not be read. One common reasons for this error is providing a `hmmscan --domtblout` file instead of a `hmmscan -o` file.")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/tab-separated-values")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            proteins = 0
+
+            domains = 0
+
+            for block_records, _ in chain([first_block], mapped_blocks):
+
+                rows = "".join([dommap_io.domain_row(record.accession, record) for records in block_records for record in records])
+
+                proteins += len(block_records)
+
+                domains += sum(len(records) for records in block_records)
+
+                if rows:
+                    self.send_chunk(rows.encode())
+
+            self.wfile.write(b"0\r\n\r\n")
+
+            with stats.lock:
+                stats.proteins += proteins
+                stats.domains += domains
+                stats.latencies.append(time.perf_counter() - start_time)
+
+        except Exception:
+
+            # The response can not be completed, the client sees a truncated response
+            with stats.lock:
+                stats.failed += 1
+
+            self.close_connection = True
+
+            raise
+
+        finally:
+
+            with stats.lock:
+                stats.active -= 1
+
+    def failed_request(self, code: int, msg: str):
+
+        with self.server.stats.lock:
+            self.server.stats.failed += 1
+
+        # Unread parts of the request body would be taken as the next request
+        self.close_connection = True
+
+        self.send_error(code, msg)
+
+
+class DomainMapperServer:
+    """
+    Shared state of a server, the engine holding the domain definitions and options, its pool of worker processes and the server statistics
+    """
+
+    def __init__(self, engine: DomainMapperEngine):
+
+        self.engine = engine
+
+        self.pool = engine.worker_pool()
+
+        self.stats = ServerStats(engine.workers)
+
+    def map_blocks(self, blocks):
+        """
+        Maps blocks of queries with the shared pool, counting the blocks waiting in the pool as the queue depth
+        """
+
+        queued_blocks = 0
+
+        def counted_blocks():
+            nonlocal queued_blocks
+            for block in blocks:
+                with self.stats.lock:
+                    self.stats.queued_blocks += 1
+                queued_blocks += 1
+                yield block
+
+        try:
+
+            for mapped_block in map_blocks(self.pool, counted_blocks(), 2*self.engine.workers):
+
+                with self.stats.lock:
+                    self.stats.queued_blocks -= 1
+                queued_blocks -= 1
+
+                yield mapped_block
+
+        finally:
+
+            # Blocks of a request which was not completed are no longer waited on
+            with self.stats.lock:
+                self.stats.queued_blocks -= queued_blocks
+
+    def close(self):
+        self.pool.terminate()
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def __stop_server(signum, frame):
+    # Servers stopped by a service manager are shut down the same way as by Ctrl+C
+    raise KeyboardInterrupt
+
+
+def __is_socket(path: str):
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def make_server(engine: DomainMapperEngine, host: str = "127.0.0.1", port: int = 8765, socket_path: str = None, map_root: str = None):
+    """
+    Returns an HTTP server which handles requests concurrently with the worker processes of the engine once its `serve_forever` is called, see `serve`.
+    Close it with `close_server`.
+    """
+
+    if map_root is not None:
+
+        if not os.path.isdir(map_root):
+            raise ValueError("'{}' is not a directory, files can only be mapped from a directory.".format(map_root))
+
+        map_root = os.path.realpath(map_root)
+
+    if socket_path:
+
+        # A socket left by a server which was not shut down is replaced, any other file is left as it is
+        if os.path.lexists(socket_path) and not __is_socket(socket_path):
+            raise ValueError("'{}' already exists and is not a socket, choose another path for the socket.".format(socket_path))
+
+        if os.path.lexists(socket_path):
+            os.remove(socket_path)
+
+        http_server = ThreadingUnixHTTPServer(socket_path, MapRequestHandler)
+
+        http_server.address = socket_path
+
+    else:
+
+        http_server = ThreadingHTTPServer((host, port), MapRequestHandler)
+
+        http_server.daemon_threads = True
+
+        http_server.address = "http://{}:{}".format(*http_server.server_address[:2])
+
+    http_server.socket_path = socket_path
+
+    http_server.map_root = map_root
+
+    http_server.dommap_server = DomainMapperServer(engine)
+
+    http_server.stats = http_server.dommap_server.stats
+
+    http_server.map_blocks = http_server.dommap_server.map_blocks
+
+    return http_server
+
+
+def close_server(http_server):
+    """
+    Closes a server from `make_server`, its worker processes and its Unix socket
+    """
+
+    http_server.server_close()
+
+    http_server.dommap_server.close()
+
+    if http_server.socket_path and __is_socket(http_server.socket_path):
+        os.remove(http_server.socket_path)
+
+
+def serve(engine: DomainMapperEngine, host: str = "127.0.0.1", port: int = 8765, socket_path: str = None, map_root: str = None):
+    """
+    Runs a server until it is interrupted, requests are handled concurrently and share the worker processes of the engine
+
+    Parameters
+    ------------
+    engine : DomainMapperEngine
+    Domain definitions and mapping options used for every request
+
+    host, port
+    Address of the HTTP server, only local addresses should be used
+
+    socket_path : str
+    Path of a Unix socket to serve HTTP on instead of a network address, a file at this path which is not a socket raises a ValueError
+
+    map_root : str
+    Directory whose files can be mapped with `/map?path=` (default = None, files on the server host are not mapped)
+    """
+
+    http_server = make_server(engine, host, port, socket_path, map_root)
+
+    signal.signal(signal.SIGTERM, __stop_server)
+
+    dommap_io.notice_msg("DomainMapper is serving on {} with {} worker(s). Stop with Ctrl+C.".format(http_server.address, engine.workers))
+
+    try:
+        http_server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        close_server(http_server)
@@ -0,0 +1,312 @@
+# dommmap_shard.py
+# This file contains the splitting of a hmmscan output into shards which are mapped on separate nodes, and the merging of their mapped outputs into a single output
+
+import os
+
+import re
+
+from typing import NamedTuple
+
+from datetime import datetime
+
+from DomainMapper import dommap_io, dommap_store
+
+
+class ShardOutput(NamedTuple):
+    """
+    Mapping options, input file and domain counts listed in the header (or the trailer of a streamed output) of a mapped output
+    """
+
+    in_file: str
+
+    options: tuple
+
+    counts: tuple
+
+
+# Options and domain counts of the file header, see `dommap_io.file_header` and `dommap_io.domain_counts`
+__option_patterns = (re.compile(r"Intra domain gap = +(\d+)"), re.compile(r"Inter domain gap = +(\d+)"), re.compile(r"#\s+overlap = +(\d+)"), re.compile(r"Fractional overlap = +(\S+)"), re.compile(r"E-value cutoff = +(\S+)"))
+
+__option_names = ("intra domain gap", "inter domain gap", "overlap", "fractional overlap", "E-value cutoff")
+
+__proteins_pattern = re.compile(r"Total Proteins: +(\d+) +Total Domains: +(\d+)")
+
+__topology_pattern = re.compile(r"(NC|CP|IS) : +(\d+) ")
+
+
+def shard_paths(in_file: str, n_shards: int, out_dir: str = None):
+    """
+    Returns the paths of the shards of an input file, `name.shard1.hmm.out` to `name.shardN.hmm.out` (numbered with the same width) in the output directory
+
+    Parameters
+    ------------
+    in_file : str
+    Path to file from `hmmscan -o`
+
+    n_shards : int
+    Number of shards
+
+    out_dir : str
+    Output directory (default = directory of the input file)
+    """
+
+    name = os.path.basename(in_file)
+
+    if dommap_io.output_compression(name) is not None:
+        name = os.path.splitext(name)[0]
+
+    if name.endswith(".hmm.out"):
+        name = name[:-len(".hmm.out")]
+
+    out_dir = os.path.dirname(in_file) if out_dir is None else out_dir
+
+    return [os.path.join(out_dir, "{}.shard{:0{}d}.hmm.out".format(name, i, len(str(n_shards)))) for i in range(1, n_shards + 1)]
+
+
+def split_file(in_file: str, n_shards: int, out_dir: str = None):
+    """
+    Splits a hmmscan output into shards of about the same size, which are mapped on their own and merged back together with `merge_outputs`.
+    Shards are cut at the end of a query (after its `//` line) without parsing the queries, and each shard starts with the preamble of the hmmscan output.
+    Inputs with fewer queries than shards are split into fewer shards.
+
+    Parameters
+    ------------
+    in_file : str
+    Path to file from `hmmscan -o`, which may be gzip, bz2 or xz compressed (shards are balanced by the compressed size)
+
+    n_shards : int
+    Number of shards
+
+    out_dir : str
+    Output directory (default = directory of the input file)
+
+    Returns
+    ------------
+    shards : list
+    (path, number of queries, size in bytes) of each shard, in input order
+    """
+
+    if n_shards < 1:
+        raise ValueError("Non-positive option detected for the number of shards.")
+
+    if in_file == "-" or dommap_store.is_store(in_file):
+        raise ValueError("Only hmmscan output files can be split, not standard input or a compiled store.")
+
+    in_size = os.path.getsize(in_file)
+
+    paths = shard_paths(in_file, n_shards, out_dir)
+
+    if os.path.abspath(in_file) in map(os.path.abspath, paths):
+        raise ValueError("The shards of '{}' would overwrite it, split it into another directory.".format(in_file))
+
+    os.makedirs(os.path.dirname(paths[0]) or ".", exist_ok = True)
+
+    shards = list()
+
+    shard_file, n_queries, preamble_len = None, 0, None
+
+    try:
+
+        # Blocks are small next to a shard, so that each shard ends close to its share of the input
+        for block, block_end in dommap_io.query_blocks(in_file, block_size = max(1, min(1048576, in_size//(256*n_shards)))):
+
+            # Every block is prefixed with the same preamble
+            if preamble_len is None:
+                preamble_len = 0 if block.startswith(b"Query:") else block.find(b"\nQuery:") + 1
+
+            if shard_file is None:
+                shard_file = open(paths[len(shards)], "wb")
+                shard_file.write(block[:preamble_len])
+
+            shard_file.write(block[preamble_len:])
+
+            n_queries += block.count(b"\n//") + block.startswith(b"//")
+
+            # Each shard ends at the first query end past its share of the input, the last shard takes the rest of the input
+            if len(shards) < n_shards - 1 and block_end*n_shards >= in_size*(len(shards) + 1):
+
+                shards.append((shard_file.name, n_queries, shard_file.tell()))
+
+                shard_file.close()
+
+                shard_file, n_queries = None, 0
+
+        if shard_file is not None:
+
+            shards.append((shard_file.name, n_queries, shard_file.tell()))
+
+            shard_file.close()
+
+            shard_file = None
+
+    finally:
+
+        if shard_file is not None:
+            shard_file.close()
+
+    # Shards of an earlier split into more shards are removed, so that they are not merged with these
+    for path in paths[len(shards):]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    return shards
+
+
+def read_output(out_file: str):
+    """
+    Reads the mapping options, input file and domain counts of a mapped output from its header, or from its trailer for a streamed output
+
+    Returns
+    ------------
+    shard_output : ShardOutput
+    """
+
+    options, counts, in_file = [None]*len(__option_patterns), None, None
+
+    with dommap_io.open_input(out_file, "r") as mapped_file:
+
+        lines = iter(mapped_file)
+
+        for line in lines:
+
+            if not line.startswith("#"):
+                continue
+
+            if line.startswith("#  Input HMM:"):
+                in_file = next(lines)[1:].strip()
+
+            for i, pattern in enumerate(__option_patterns):
+
+                match = pattern.search(line)
+
+                if match and options[i] is None:
+                    options[i] = match.group(1)
+
+            match = __proteins_pattern.search(line)
+
+            if match:
+                counts = [int(match.group(1)), int(match.group(2)), 0, 0, 0]
+
+            match = __topology_pattern.search(line)
+
+            if match and counts is not None:
+                counts[2 + ("NC", "CP", "IS").index(match.group(1))] = int(match.group(2))
+
+    if None in options or counts is None:
+
+        # Outputs of earlier versions do not list the fractional overlap they were mapped with
+        if options.count(None) == 1 and options[3] is None and counts is not None:
+            raise ValueError("'{}' does not list the fractional overlap it was mapped with, map it again to merge it.".format(out_file))
+
+        raise ValueError("'{}' is not a mapped output, or its domain counts are missing.".format(out_file))
+
+    return ShardOutput(in_file, (int(options[0]), int(options[1]), int(options[2]), float(options[3]), float(options[4])), tuple(counts))
+
+
+def shard_input(in_file: str):
+    """
+    Returns the hmmscan output a shard was split from, `name.hmm.out` for `name.shard1.hmm.out`
+    """
+
+    return re.sub(r"\.shard\d+(\.hmm\.out)$", r"\1", in_file)
+
+
+def merge_outputs(out_files: list, merged_file: str, in_file: str = None, chunk_rows: int = 4096):
+    """
+    Merges the mapped outputs of the shards of a hmmscan output, in the order they are given, into a single output.
+    The domain counts and percentages of the header are counted again from the rows of every shard, and the proteins without domains are taken from the header of each shard,
+    so that the merged output is the same as mapping the whole hmmscan output at once (apart from the time it was executed on).
+
+    Parameters
+    ------------
+    out_files : list
+    Mapped outputs of the shards (which may be compressed, or streamed outputs), in input order
+
+    merged_file : str
+    Output path of the merged output, which is compressed if it ends in .gz, .bz2 or .xz, or "-" for standard output
+
+    in_file : str
+    Input path listed in the header of the merged output (default = the input of the first shard without its shard number, see `shard_input`)
+
+    chunk_rows : int
+    Number of rows copied at a time
+
+    Returns
+    ------------
+    counts : list
+    Number of proteins, domains, NC, CP and IS domains of the merged output
+    """
+
+    if not out_files:
+        raise ValueError("No shard outputs to merge.")
+
+    shard_outputs = list()
+
+    for out_file in out_files:
+
+        if os.path.abspath(out_file) == os.path.abspath(merged_file):
+            raise ValueError("The merged output '{}' is also one of the shard outputs.".format(merged_file))
+
+        # Outputs are only complete once their journal is removed
+        if os.path.exists(dommap_io.MapJournal(out_file).path):
+            raise ValueError("'{}' is incomplete, finish mapping it with --resume before merging.".format(out_file))
+
+        shard_outputs.append(read_output(out_file))
+
+    options = shard_outputs[0].options
+
+    for out_file, shard_output in zip(out_files, shard_outputs):
+        for name, value, first_value in zip(__option_names, shard_output.options, options):
+            if value != first_value:
+                raise ValueError("'{}' was mapped with a {} of {} and '{}' with {}, shards can only be merged if they were mapped with the same options.".format(out_file, name, value, out_files[0], first_value))
+
+    if in_file is None:
+        in_file = shard_input(shard_outputs[0].in_file)
+
+    merged = dommap_io.DomainMapWriter(datetime.now(), in_file, merged_file, *options)
+
+    try:
+
+        for out_file, shard_output in zip(out_files, shard_outputs):
+
+            shard_start = merged.counts()
+
+            with dommap_io.open_input(out_file, "r") as mapped_file:
+
+                rows = list()
+
+                for row in mapped_file:
+
+                    if row.startswith("#") or row == "\n":
+                        continue
+
+                    rows.append((row, row.split("\t", 4)[3].split()))
+
+                    if len(rows) == chunk_rows:
+                        merged.write_rows(rows, proteins = 0)
+                        rows = list()
+
+                # Proteins without any domains have no rows, all proteins of the shard are counted from its header
+                merged.write_rows(rows, proteins = shard_output.counts[0])
+
+            shard_counts = [cnt - start_cnt for cnt, start_cnt in zip(merged.counts(), shard_start)]
+
+            if tuple(shard_counts) != shard_output.counts:
+                raise ValueError("The rows of '{}' do not match the domain counts of its header, the output is incomplete or was modified.".format(out_file))
+
+        merged.close()
+
+    except BaseException:
+
+        # The partial merged output is left without a header, and is removed
+        if merged_file != "-":
+
+            merged.handle.close()
+
+            for path in (merged_file, getattr(merged, "rows_file", None)):
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+
+        raise
+
+    return merged.counts()
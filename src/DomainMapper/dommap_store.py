@@ -0,0 +1,281 @@
+# dommmap_store.py
+# This file contains the compiled HSP store, a columnar copy of a hmmscan output which is mapped again without parsing the hmmscan output
+
+import os
+
+import sys
+
+import mmap
+
+import struct
+
+import hashlib
+
+from array import array
+
+from DomainMapper import dommap_io
+
+from DomainMapper.dommap_parser import QueryResult, Hit
+
+from DomainMapper.dommap_data_structures import hsp_gap_runs
+
+
+class StoreHSP:
+    """
+    High-scoring pair read from a compiled store, with the same coordinates as dommap_parser.HSP.
+    Instead of its alignment, it holds every run of query residues which are not aligned to the HMM (insertions, '.' in the HMM line),
+    as (start, end) query residue pairs, which is all that is needed from the alignment to map domains.
+    """
+
+    __slots__ = ("hit_id", "query_range", "hit_range", "evalue_cond", "gap_runs")
+
+    def __init__(self, hit_id: str, query_range: tuple, hit_range: tuple, evalue_cond: float, gap_runs: list):
+
+        self.hit_id = hit_id
+
+        self.query_range = query_range
+
+        self.hit_range = hit_range
+
+        self.evalue_cond = evalue_cond
+
+        self.gap_runs = gap_runs
+
+
+class HSPStore:
+    """
+    Read-only compiled store of a `hmmscan -o` file, looked up through a memory map.
+    Every high-scoring pair is held as a row of fixed-width columns, and proteins are only decoded as they are read,
+    so the store is read many times faster than the hmmscan output is parsed. Every mapping option can be used with the same store.
+
+    Store layout
+    ------------
+    magic : 8 bytes
+    SHA-256 of the source hmmscan output : 32 bytes
+    number of queries, hits, high-scoring pairs, gap runs and hit names : 5 little-endian uint64
+    columns, each padded to 8 bytes :
+        query_hits (queries + 1, uint64) : first hit of each query
+        hit_hsps (hits + 1, uint64) : first high-scoring pair of each hit
+        hit_names (hits, uint32) : hit name (F-group) of each hit
+        query_start, query_end, hmm_start, hmm_end (hsps, uint32 each) : 0-based, end exclusive ranges
+        evalue_cond (hsps, float64) : conditional E-value
+        hsp_runs (hsps + 1, uint64) : first gap run of each high-scoring pair
+        run_start, run_end (runs, uint32 each) : query residues of each gap run
+        query_ids, names (string tables) : (count + 1, uint64) offsets into the utf-8 strings which follow them
+    """
+
+    magic = b'DMHSP1\n\x00'
+
+    __counts = struct.Struct('<32s5Q')
+
+    def __init__(self, file_path: str):
+
+        self.file_path = file_path
+
+        with open(file_path, 'rb') as store_file:
+            self.__store = mmap.mmap(store_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if self.__store[:len(self.magic)] != self.magic:
+            raise ValueError("'{}' is not a compiled hmmscan store.".format(file_path))
+
+        self.source_hash, self.n_queries, self.n_hits, self.n_hsps, self.n_runs, self.n_names = self.__counts.unpack_from(self.__store, len(self.magic))
+
+        pos = len(self.magic) + self.__counts.size
+
+        # Columns are little-endian with standard sizes, see `compile` and `dommap_io.little_endian_column`
+        def column(fmt, length):
+            nonlocal pos
+            values = dommap_io.little_endian_column(self.__store, pos, fmt, length)
+            pos += -(-length*struct.calcsize('<' + fmt)//8)*8
+            return values
+
+        self.__query_hits = column('Q', self.n_queries + 1)
+        self.__hit_hsps = column('Q', self.n_hits + 1)
+        self.__hit_names = column('I', self.n_hits)
+        self.__query_start = column('I', self.n_hsps)
+        self.__query_end = column('I', self.n_hsps)
+        self.__hmm_start = column('I', self.n_hsps)
+        self.__hmm_end = column('I', self.n_hsps)
+        self.__evalue_cond = column('d', self.n_hsps)
+        self.__hsp_runs = column('Q', self.n_hsps + 1)
+        self.__run_start = column('I', self.n_runs)
+        self.__run_end = column('I', self.n_runs)
+
+        # Query ids are only decoded as proteins are read, the few hit names are decoded once
+        self.__query_id_offsets = column('Q', self.n_queries + 1)
+        self.__query_ids_start = pos
+        pos += -(-self.__query_id_offsets[-1]//8)*8
+
+        name_offsets = column('Q', self.n_names + 1)
+        self.__names = self.__store[pos:pos + name_offsets[-1]].decode().split('\n')[:-1]
+
+    def __reduce__(self):
+        # Worker processes re-open the store rather than copying it
+        return (HSPStore, (self.file_path,))
+
+    def __len__(self):
+        return self.n_queries
+
+    def __iter__(self):
+        return self.proteins()
+
+    def proteins(self, start: int = 0, end: int = None):
+        """
+        Reads the proteins of the store
+
+        Parameters
+        ------------
+        start, end : int
+        Range of the queries to read, in input order (default = all queries)
+
+        Returns
+        ------------
+        query_results : generator
+        Yields a dommap_parser.QueryResult for each query, its `end` is the number of queries read up to and including it
+        """
+
+        query_hits, hit_hsps, hit_names, names = self.__query_hits, self.__hit_hsps, self.__hit_names, self.__names
+
+        query_start, query_end, hmm_start, hmm_end, evalue_cond = self.__query_start, self.__query_end, self.__hmm_start, self.__hmm_end, self.__evalue_cond
+
+        hsp_runs, run_start, run_end = self.__hsp_runs, self.__run_start, self.__run_end
+
+        for query in range(start, self.n_queries if end is None else end):
+
+            hits = list()
+
+            for hit in range(query_hits[query], query_hits[query + 1]):
+
+                hit_id = names[hit_names[hit]]
+
+                hits.append(Hit(hit_id, [StoreHSP(hit_id, (query_start[hsp], query_end[hsp]), (hmm_start[hsp], hmm_end[hsp]), evalue_cond[hsp],
+                                                  list(zip(run_start[hsp_runs[hsp]:hsp_runs[hsp + 1]], run_end[hsp_runs[hsp]:hsp_runs[hsp + 1]])))
+                                         for hsp in range(hit_hsps[hit], hit_hsps[hit + 1])]))
+
+            query_id = self.__store[self.__query_ids_start + self.__query_id_offsets[query]:self.__query_ids_start + self.__query_id_offsets[query + 1] - 1].decode()
+
+            yield QueryResult(query_id, hits, query + 1)
+
+    @staticmethod
+    def compile(proteins, source_hash: bytes, save_path: str):
+        """
+        Writes parsed proteins as a compiled store
+
+        Parameters
+        ------------
+        proteins : iterable
+        Every protein of a hmmscan output (dommap_parser.QueryResult or Bio.SearchIO QueryResult), with the alignments of all high-scoring pairs
+
+        source_hash : bytes
+        SHA-256 of the hmmscan output, see `source_hash`
+
+        save_path : str
+        Path of the compiled store
+
+        Returns
+        ------------
+        n_queries : int
+        Number of proteins in the store
+        """
+
+        query_hits, hit_hsps, hit_names, hsp_runs = array('Q', [0]), array('Q', [0]), array('I'), array('Q', [0])
+
+        query_start, query_end, hmm_start, hmm_end, evalue_cond = array('I'), array('I'), array('I'), array('I'), array('d')
+
+        run_start, run_end = array('I'), array('I')
+
+        query_ids = list()
+
+        # Hit names (F-groups) are shared by many proteins, each is stored once
+        names = dict()
+
+        for protein in proteins:
+
+            query_ids.append(protein.id)
+
+            for hit in protein.hits:
+
+                hit_names.append(names.setdefault(hit.id, len(names)))
+
+                for hsp in hit.hsps:
+
+                    query_start.append(hsp.query_range[0])
+                    query_end.append(hsp.query_range[1])
+                    hmm_start.append(hsp.hit_range[0])
+                    hmm_end.append(hsp.hit_range[1])
+                    evalue_cond.append(hsp.evalue_cond)
+
+                    for gap_start, gap_end in hsp_gap_runs(hsp):
+                        run_start.append(gap_start)
+                        run_end.append(gap_end)
+
+                    hsp_runs.append(len(run_start))
+
+                hit_hsps.append(len(query_start))
+
+            query_hits.append(len(hit_names))
+
+        query_id_strings, query_id_offsets = HSPStore.__string_table(query_ids)
+
+        name_strings, name_offsets = HSPStore.__string_table(names)
+
+        # The store is written next to its final path and moved in place, so a partial store is never read
+        tmp_path = save_path + '.tmp'
+
+        with open(tmp_path, 'wb') as store_file:
+
+            store_file.write(HSPStore.magic)
+
+            store_file.write(HSPStore.__counts.pack(source_hash, len(query_ids), len(hit_names), len(query_start), len(run_start), len(names)))
+
+            for column in (query_hits, hit_hsps, hit_names, query_start, query_end, hmm_start, hmm_end, evalue_cond, hsp_runs, run_start, run_end, query_id_offsets, query_id_strings, name_offsets, name_strings):
+
+                if isinstance(column, array) and sys.byteorder == 'big':
+                    column.byteswap()
+
+                column = column.tobytes() if isinstance(column, array) else column
+
+                store_file.write(column + bytes(-len(column) % 8))
+
+        os.replace(tmp_path, save_path)
+
+        return len(query_ids)
+
+    @staticmethod
+    def __string_table(strings):
+        """
+        Returns newline terminated strings as utf-8, and the offset where each of them starts
+        """
+
+        encoded = [(string + '\n').encode() for string in strings]
+
+        offsets = array('Q', [0])
+
+        for string in encoded:
+            offsets.append(offsets[-1] + len(string))
+
+        return b''.join(encoded), offsets
+
+
+def source_hash(file_path: str):
+    """
+    Returns the SHA-256 of a file, which identifies the hmmscan output a store was compiled from
+    """
+
+    digest = hashlib.sha256()
+
+    with open(file_path, 'rb') as source_file:
+
+        for chunk in iter(lambda: source_file.read(1048576), b''):
+            digest.update(chunk)
+
+    return digest.digest()
+
+
+def is_store(file_path: str):
+    """
+    Checks if a file is a compiled store
+    """
+
+    with open(file_path, 'rb') as store_file:
+        return store_file.read(len(HSPStore.magic)) == HSPStore.magic
@@ -0,0 +1,283 @@
+# dommmap_sweep.py
+# This file contains the sweep mode, which maps a hmmscan output with every combination of a grid of mapping options from a single parse
+
+import os
+
+import signal
+
+from itertools import chain, product
+
+from datetime import datetime
+
+from multiprocessing import Pool
+
+from DomainMapper import dommap_io, dommap_batch
+
+from DomainMapper.dommap_parser import QueryResult, Hit
+
+from DomainMapper.dommap_store import StoreHSP
+
+from DomainMapper.dommap_data_structures import hsp_gap_runs
+
+from DomainMapper.dommap_engine import DomainMapperEngine, MapCounts, hmmscan_proteins, input_blocks, block_proteins, map_blocks
+
+
+def sweep_engines(ecod_domain_dict: dict, intra_gaps: list, inter_gaps: list, overlaps: list, frac_overlaps: list, eval_cutoffs: list, parser: str = "native"):
+    """
+    Returns an engine for every combination of the mapping options, invalid options raise a ValueError.
+    Values given more than once (e.g. `--frac_overlap 0.7 0.70`) are only swept once, as their outputs would have the same name.
+
+    Parameters
+    ------------
+    ecod_domain_dict : dommap_tools.EcodDomains or dict
+    ECOD domain definitions keyed by F-group, shared by all engines
+
+    intra_gaps, inter_gaps, overlaps, frac_overlaps, eval_cutoffs : list
+    Values of each mapping option, see `dommap -h`
+
+    parser : str
+    "native" for dommap_parser or "biopython" for Bio.SearchIO
+    """
+
+    grid = [list(dict.fromkeys(values)) for values in (intra_gaps, inter_gaps, overlaps, frac_overlaps, eval_cutoffs)]
+
+    return [DomainMapperEngine(ecod_domain_dict, *options, parser) for options in product(*grid)]
+
+
+def options_name(engine: DomainMapperEngine):
+    """
+    Returns the mapping options of an engine as part of a file name, e.g. `intra30_inter30_overlap40_frac0.7_eval1e-05`
+    """
+
+    return "intra{}_inter{}_overlap{}_frac{}_eval{}".format(engine.intra_gap, engine.inter_gap, engine.overlap, engine.frac_overlap, engine.eval_cutoff)
+
+
+def shared_protein(protein):
+    """
+    Returns a protein whose high-scoring pairs hold the runs of their alignment gaps (dommap_store.StoreHSP) instead of their alignment,
+    so that each alignment is only searched once for all combinations of options instead of once for every Domain built from it
+    """
+
+    hits = list()
+
+    for hit in protein.hits:
+
+        # Alignments above the E-value cutoffs of every combination are not read by the built in parser, and never used
+        hits.append(Hit(hit.id, [hsp if isinstance(hsp, StoreHSP) else StoreHSP(hsp.hit_id, hsp.query_range, hsp.hit_range, hsp.evalue_cond, [] if getattr(hsp, "hit_aln", "") is None else hsp_gap_runs(hsp)) for hsp in hit.hsps]))
+
+    return QueryResult(protein.id, hits, None)
+
+
+class SweepOutput:
+    """
+    Output of a single combination of options. Its rows are kept in memory until they are flushed, when the output is opened, appended to and closed,
+    so that a sweep holds a single output open at a time however many combinations it maps (instead of running out of file descriptors).
+    """
+
+    def __init__(self, time, in_file: str, out_file: str, engine: DomainMapperEngine):
+
+        self.writer_args = (time, in_file, out_file, engine.intra_gap, engine.inter_gap, engine.overlap, engine.frac_overlap, engine.eval_cutoff)
+
+        self.out_file = out_file
+
+        self.rows = list()
+
+        self.proteins = 0
+
+        # Domain counts and size of the output once it has been flushed, from which it is opened again (see dommap_io.DomainMapWriter)
+        self.resume = None
+
+    def write_records(self, records):
+        """
+        Keeps the domain records of a single protein as rows of the output
+        """
+
+        self.rows.extend((dommap_io.domain_row(record.accession, record), record.topology) for record in records)
+
+        self.proteins += 1
+
+    def flush(self):
+        """
+        Appends the rows kept so far to the output, whose header is rewritten with the domain counts, and returns the domain counts
+        """
+
+        mapped_domains_file = dommap_io.DomainMapWriter(*self.writer_args, resume = self.resume)
+
+        mapped_domains_file.write_rows(self.rows, self.proteins)
+
+        mapped_domains_file.close()
+
+        self.resume = {"counts": mapped_domains_file.counts(), "out_bytes": os.path.getsize(self.out_file)}
+
+        self.rows, self.proteins = list(), 0
+
+        return mapped_domains_file.counts()
+
+
+def sweep_protein(engines: list, protein):
+    """
+    Maps a single protein with every engine and returns the domain records of each engine
+    """
+
+    protein = shared_protein(protein)
+
+    return [engine.map_protein(protein) for engine in engines]
+
+
+# Engines of a sweep worker process, these are set once by the pool initializer
+__sweep_engines = list()
+
+
+def __init_sweep_worker(engines):
+    global __sweep_engines
+    __sweep_engines = engines
+
+    # Interrupts are handled by the main process, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def __sweep_query_block(block):
+    """
+    Maps all proteins in a block with every engine of this worker process
+    """
+
+    proteins = block_proteins(block, __sweep_engines[0].parser, max(engine.eval_cutoff for engine in __sweep_engines))
+
+    return [sweep_protein(__sweep_engines, protein) for protein in proteins]
+
+
+def sweep_proteins(engines: list, in_file: str, workers: int = 1):
+    """
+    Parses each protein of a hmmscan output once and maps it with every engine
+
+    Parameters
+    ------------
+    engines : list
+    DomainMapperEngine of each combination of options, all with the same domain definitions and parser
+
+    in_file : str
+    Path to file from `hmmscan -o` (which may be compressed, or a store compiled by `dommap compile`) or "-" for standard input
+
+    workers : int
+    Number of worker processes which map blocks of proteins with every engine (default = 1)
+
+    Returns
+    ------------
+    swept_proteins : generator
+    Yields the domain records of each engine for each protein, and the byte offset in the input file that has been mapped
+    """
+
+    if workers > 1:
+
+        with Pool(workers, initializer = __init_sweep_worker, initargs = (engines,)) as pool:
+
+            for block_records, end_offset in map_blocks(pool, input_blocks(in_file), 2*workers, __sweep_query_block):
+
+                for records in block_records:
+                    yield records, end_offset
+
+        return
+
+    # Alignments are read up to the largest E-value cutoff of all combinations
+    for protein, hmmscan_offset in hmmscan_proteins(in_file, engines[0].parser, max(engine.eval_cutoff for engine in engines)):
+        yield sweep_protein(engines, protein), hmmscan_offset
+
+
+def sweep_file(engines: list, in_file: str, out_dir: str, workers: int = 1, progress: bool = False, buffer_rows: int = 200000):
+    """
+    Maps a hmmscan output with every engine from a single parse, and writes an output for each engine and a summary of their domain counts to the output directory.
+    Outputs are named after the input file and the options of each engine, e.g. `name.intra30_inter30_overlap40_frac0.7_eval1e-05.mapped.out`,
+    and the summary `name.sweep.tsv` lists the options, domain counts and output of each engine.
+
+    Parameters
+    ------------
+    engines : list
+    DomainMapperEngine of each combination of options (see `sweep_engines`)
+
+    in_file : str
+    Path to file from `hmmscan -o` (which may be compressed, or a store compiled by `dommap compile`) or "-" for standard input
+
+    out_dir : str
+    Output directory
+
+    workers : int
+    Number of worker processes (default = 1)
+
+    progress : bool
+    Show a progress bar of the input file that has been mapped, when the progress is written to a terminal (default = False, there is no progress bar for standard input)
+
+    buffer_rows : int
+    Number of rows of all combinations kept in memory before they are appended to their outputs one output at a time (default = 200000)
+
+    Returns
+    ------------
+    summary_file, counts
+    Path of the summary, and the MapCounts of each engine
+    """
+
+    name = dommap_batch.output_path("stdin" if in_file == "-" else in_file, out_dir)[:-len(".mapped.out")]
+
+    out_files = ["{}.{}.mapped.out".format(name, options_name(engine)) for engine in engines]
+
+    # Engines with the same options would overwrite each other's output
+    if len(set(out_files)) < len(out_files):
+        raise ValueError("Several engines have the same mapping options, each combination of options can only be swept once.")
+
+    swept_proteins = sweep_proteins(engines, in_file, workers)
+
+    # If proteins were not detected from the input hmm file, then raise an error
+    first_protein = next(swept_proteins, None)
+
+    if first_protein is None:
+        raise ValueError("Input hmmscan file '{}' could not be read.\n\nOne common reasons for this error is providing a `hmmscan --domtblout` file instead of a `hmmscan -o` file.".format(in_file))
+
+    os.makedirs(out_dir, exist_ok = True)
+
+    time = datetime.now()
+
+    outputs = [SweepOutput(time, in_file, out_file, engine) for engine, out_file in zip(engines, out_files)]
+
+    buffered_rows = 0
+
+    # The progress bar is only drawn to a terminal, see dommap_io.ProgressBar
+    progress_bar = None
+
+    if progress and in_file != "-":
+
+        progress_bar = dommap_io.ProgressBar(os.path.getsize(in_file), prefix = "Sweeping:", suffix = "Complete", length = 50)
+
+        progress_bar.update(0)
+
+    for engine_records, hmmscan_offset in chain([first_protein], swept_proteins):
+
+        for output, records in zip(outputs, engine_records):
+
+            output.write_records(records)
+
+            buffered_rows += len(records)
+
+        if buffered_rows >= buffer_rows:
+
+            for output in outputs:
+                output.flush()
+
+            buffered_rows = 0
+
+        if progress_bar is not None:
+            progress_bar.update(hmmscan_offset)
+
+    if progress_bar is not None:
+        progress_bar.finish()
+
+    counts = [MapCounts(*output.flush()) for output in outputs]
+
+    summary_file = name + ".sweep.tsv"
+
+    with open(summary_file, "w") as summary:
+
+        summary.write("\t".join(["intra_gap", "inter_gap", "overlap", "frac_overlap", "eval_cutoff", "proteins", "domains", "NC", "CP", "IS", "output"]) + "\n")
+
+        for engine, engine_counts, out_file in zip(engines, counts, out_files):
+            summary.write("\t".join(str(value) for value in (engine.intra_gap, engine.inter_gap, engine.overlap, engine.frac_overlap, engine.eval_cutoff, *engine_counts, os.path.basename(out_file))) + "\n")
+
+    return summary_file, counts
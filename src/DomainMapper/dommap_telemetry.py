@@ -0,0 +1,174 @@
+# dommmap_telemetry.py
+# This file contains the JSON-lines progress stream of a mapping run, which is read by job schedulers and orchestrators to spot stalled or slow runs
+
+import os
+
+import sys
+
+import json
+
+import time
+
+import resource
+
+from time import monotonic
+
+
+def resident_memory():
+    """
+    Returns the resident memory of this process in bytes (the peak resident memory on systems without /proc)
+    """
+
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return max_resident_memory()
+
+
+def max_resident_memory():
+    """
+    Returns the peak resident memory of this process in bytes
+    """
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*(1 if sys.platform == "darwin" else 1024)
+
+
+class ProgressTelemetry:
+    """
+    Stream of the progress of a mapping run as JSON lines, written at most once every `interval` seconds while proteins are mapped,
+    a "start" line when mapping starts and a "done" line once the output is complete. Each line is flushed as it is written.
+    Rates and the estimated time left are measured from the start of the run, and the `recent_` rates since the previous line,
+    a run whose recent rates fall to a fraction of its overall rates has slowed down, and a run without a new line for several intervals has stalled.
+
+    Fields
+    ------------
+    event : "start", "progress" or "done" ("file" for each file in batch mode)
+    time : Unix time of the line
+    elapsed : seconds since the start of the run
+    pid : process id of the run
+    in_file : input file
+    proteins, hsps, domains : number of proteins, high-scoring pairs and mapped domains so far (including those of a resumed run)
+    in_bytes, in_size : bytes of the input file which have been mapped, and its size (`null` for standard input)
+    proteins_per_second, hsps_per_second, recent_proteins_per_second, recent_hsps_per_second : mapping rates
+    eta_seconds : estimated seconds left, from the fraction of the input mapped (`null` if it is not known)
+    rss_bytes, max_rss_bytes : resident memory of the main process, and its peak (worker processes are not included)
+    """
+
+    def __init__(self, report_file, interval: float = 5.0):
+
+        # Path or an open text file, e.g. sys.stderr
+        self.owns_file = isinstance(report_file, str)
+
+        self.report_file = open(report_file, "a") if self.owns_file else report_file
+
+        self.interval = interval
+
+        self.in_file = None
+
+        self.in_size = None
+
+        self.hsps = 0
+
+        self.started = monotonic()
+
+        self.next_line = self.started + interval
+
+        # Counts at the start of the run, and at the previous line
+        self.start_counts = (0, 0, 0)
+
+        self.last_line = (self.started, 0, 0)
+
+    def start(self, in_file: str, in_size: int = None, proteins: int = 0, domains: int = 0, in_bytes: int = 0):
+        """
+        Starts the progress of an input file, from the counts and input offset of a resumed run
+        """
+
+        self.in_file = in_file
+
+        self.in_size = in_size
+
+        self.hsps = 0
+
+        self.started = monotonic()
+
+        self.next_line = self.started + self.interval
+
+        self.start_counts = (proteins, in_bytes or 0, 0)
+
+        self.last_line = (self.started, proteins, 0)
+
+        self.line("start", proteins = proteins, hsps = 0, domains = domains, in_bytes = in_bytes)
+
+    def count_hsps(self, proteins):
+        """
+        Counts the high-scoring pairs of each parsed protein as they pass through, (protein, input offset) pairs from `hmmscan_proteins`
+        """
+
+        for protein, hmmscan_offset in proteins:
+
+            self.hsps += sum(len(hit.hsps) for hit in protein.hits)
+
+            yield protein, hmmscan_offset
+
+    def update(self, proteins: int, domains: int, in_bytes: int = None):
+        """
+        Writes a "progress" line if `interval` seconds have passed since the previous line, called after each mapped protein
+        """
+
+        if monotonic() >= self.next_line:
+            self.progress("progress", proteins, domains, in_bytes)
+
+    def finish(self, proteins: int, domains: int, in_bytes: int = None):
+        """
+        Writes the "done" line of an input file
+        """
+
+        self.progress("done", proteins, domains, self.in_size if in_bytes is None else in_bytes)
+
+    def progress(self, event: str, proteins: int, domains: int, in_bytes: int = None):
+        """
+        Writes a line of the rates and estimated time left of the current input file
+        """
+
+        now = monotonic()
+
+        elapsed = max(now - self.started, 1e-9)
+
+        start_proteins, start_bytes, start_hsps = self.start_counts
+
+        last_time, last_proteins, last_hsps = self.last_line
+
+        since_last = max(now - last_time, 1e-9)
+
+        eta = None
+
+        if self.in_size is not None and in_bytes is not None and in_bytes > start_bytes:
+            eta = max(self.in_size - in_bytes, 0)*elapsed/(in_bytes - start_bytes)
+
+        self.line(event, proteins = proteins, hsps = self.hsps, domains = domains, in_bytes = in_bytes,
+                  proteins_per_second = round((proteins - start_proteins)/elapsed, 3), hsps_per_second = round((self.hsps - start_hsps)/elapsed, 3),
+                  recent_proteins_per_second = round((proteins - last_proteins)/since_last, 3), recent_hsps_per_second = round((self.hsps - last_hsps)/since_last, 3),
+                  eta_seconds = None if eta is None else round(eta, 1))
+
+        self.last_line = (now, proteins, self.hsps)
+
+        self.next_line = now + self.interval
+
+    def line(self, event: str, **fields):
+        """
+        Writes a single line with the time, input file and memory of the run, and the given fields
+        """
+
+        rss = resident_memory()
+
+        # The peak is counted by the kernel in a different unit, and may lag behind the current resident memory
+        self.report_file.write(json.dumps(dict({"event": event, "time": round(time.time(), 3), "elapsed": round(monotonic() - self.started, 3), "pid": os.getpid(),
+                                                "in_file": self.in_file, "in_size": self.in_size}, **fields, rss_bytes = rss, max_rss_bytes = max(rss, max_resident_memory()))) + "\n")
+
+        self.report_file.flush()
+
+    def close(self):
+
+        if self.owns_file:
+            self.report_file.close()
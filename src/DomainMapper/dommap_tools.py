@@ -3,13 +3,15 @@
 
 import os
 
-import pathlib
+import mmap
+
+import struct
 
-import requests
+import hashlib
 
-from numpy import load as npload
+import pathlib
 
-from numpy import save as npsave
+from collections.abc import Mapping
 
 from DomainMapper.dommap_io import *
 
@@ -19,14 +21,131 @@ __ecod_domain_txt_url = 'http://prodata.swmed.edu/ecod/distributions/ecod.latest
 
 __ecod_domain_txt_fn = 'ecod.latest.domains.txt'
 
-__ecod_domain_npy_fn = 'ecod.latest.domains.npy'
+__ecod_domain_sst_fn = 'ecod.latest.domains.sst'
 
 # install path variables
 __pt = os.path.dirname(os.path.realpath(__file__))
 
 __txt_fn_path = os.path.join(__pt,__ecod_domain_txt_fn)
 
-__npy_fn_path = os.path.join(__pt,__ecod_domain_npy_fn)
+__sst_fn_path = os.path.join(__pt,__ecod_domain_sst_fn)
+
+# user domain definitions are compiled into a cache directory, keyed on their contents
+__cache_dir_env = 'DOMMAP_CACHE'
+
+
+class EcodDomains(Mapping):
+    """
+    Read-only ECOD domain definitions keyed by F-group, stored as a sorted string table and looked up through a memory map.
+    Records ([f_id, arch, x_group, t_group]) are only decoded when they are looked up,
+    and every process which opens the same table shares its pages instead of holding its own dictionary.
+
+    Table layout
+    ------------
+    magic : 8 bytes
+    number of records (n) : little-endian uint32
+    record offsets : (n + 1) little-endian uint64, the last offset is the end of the records
+    records : 'f_group\tf_id\tarch\tx_group\tt_group\n' in utf-8, sorted by F-group
+    """
+
+    __magic = b'DMECOD1\n'
+
+    def __init__(self, file_path: str):
+
+        self.file_path = file_path
+
+        with open(file_path, 'rb') as table_file:
+            self.__table = mmap.mmap(table_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if self.__table[:len(self.__magic)] != self.__magic:
+            raise ValueError("'{}' is not a compiled ECOD domain definitions table.".format(pathlib.Path(file_path).name))
+
+        self.__len, = struct.unpack_from('<I', self.__table, len(self.__magic))
+
+        offsets_start = len(self.__magic) + 4
+
+        self.__offsets = little_endian_column(self.__table, offsets_start, 'Q', self.__len + 1)
+
+        # Decoded records, F-groups are looked up many times across proteins
+        self.__records = dict()
+
+    def __reduce__(self):
+        # Worker processes re-open the table rather than copying it
+        return (EcodDomains, (self.file_path,))
+
+    def __len__(self):
+        return self.__len
+
+    def __iter__(self):
+        for i in range(self.__len):
+            yield self.__record(i)[0]
+
+    def __getitem__(self, f_group: str):
+
+        if f_group in self.__records:
+            return self.__records[f_group]
+
+        key = f_group.encode()
+
+        # Binary search over the F-groups of the sorted records
+        lo, hi = 0, self.__len
+
+        while lo < hi:
+
+            mid = (lo + hi) // 2
+
+            if self.__record_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == self.__len or self.__record_key(lo) != key:
+            raise KeyError(f_group)
+
+        self.__records[f_group] = self.__record(lo)[1:]
+
+        return self.__records[f_group]
+
+    def __record_key(self, i: int):
+        record_start = self.__offsets[i]
+        return self.__table[record_start:self.__table.find(b'\t', record_start)]
+
+    def __record(self, i: int):
+        return self.__table[self.__offsets[i]:self.__offsets[i+1] - 1].decode().split('\t')
+
+    @staticmethod
+    def compile(ecod_domain_dict: dict, save_path: str):
+        """
+        Writes ECOD domain definitions ({f_group: [f_id, arch, x_group, t_group]}) as a sorted string table
+
+        Parameters
+        ------------
+        ecod_domain_dict : dict
+        ECOD domain definitions keyed by F-group
+
+        save_path : str
+        Path of the compiled table
+        """
+
+        records = sorted(('\t'.join([f_group] + list(ecod_domain_dict[f_group])) + '\n').encode() for f_group in ecod_domain_dict)
+
+        offsets_end = len(EcodDomains.__magic) + 4 + 8*(len(records) + 1)
+
+        offsets = [offsets_end]
+
+        for record in records:
+            offsets.append(offsets[-1] + len(record))
+
+        # The table is written next to its final path and moved in place, so running processes never read a partial table
+        tmp_path = save_path + '.tmp'
+
+        with open(tmp_path, 'wb') as table_file:
+            table_file.write(EcodDomains.__magic)
+            table_file.write(struct.pack('<I', len(records)))
+            table_file.write(struct.pack('<{}Q'.format(len(offsets)), *offsets))
+            table_file.writelines(records)
+
+        os.replace(tmp_path, save_path)
 
 
 # Checking if file is older than 2 months
@@ -41,8 +160,10 @@ def __ecod_domain_exists(file_path):
     return False
 
 
-# Using requests to download the ecod domain defintions
+# Using requests to download the ecod domain defintions, requests is only imported for downloads
 def __download_latest_ecod_domain_txt():
+    import requests
+
     ecod_domain_def = requests.get(__ecod_domain_txt_url, allow_redirects=False)
 
     with open(__txt_fn_path,"wb") as write_file:
@@ -67,18 +188,33 @@ def __parse_ecod_domain_txt(file_path,save_path):
                             x_group = t_group
                     ecod_domain_dict[f_group] = [f_id, arch, x_group, t_group]
 
-    npsave(save_path, ecod_domain_dict)
-    os.remove(file_path)
+    EcodDomains.compile(ecod_domain_dict, save_path)
+
+
+# Path of the compiled table of the user's domain definitions, in $DOMMAP_CACHE (default = ~/.cache/DomainMapper) and named after the SHA-256 of the file
+def __compiled_path(file_path):
+    digest = hashlib.sha256()
+
+    with open(file_path, 'rb') as ecod_file:
+        for chunk in iter(lambda: ecod_file.read(1048576), b''):
+            digest.update(chunk)
+
+    cache_dir = os.environ.get(__cache_dir_env) or os.path.join(os.path.expanduser('~'), '.cache', 'DomainMapper')
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    return os.path.join(cache_dir, 'ecod.{}.sst'.format(digest.hexdigest()[:32]))
 
 
-# Update workflow
+# Update workflow, the downloaded text file is removed once it has been parsed
 def update():
     notice_msg("Updating 'ecod.latest.domains' from http://prodata.swmed.edu/ecod")
     __download_latest_ecod_domain_txt()
-    __parse_ecod_domain_txt(__txt_fn_path,__npy_fn_path)
+    __parse_ecod_domain_txt(__txt_fn_path,__sst_fn_path)
+    os.remove(__txt_fn_path)
 
 
-# Loading parsed ecod domain defintions and return as a dictionary
+# Loading parsed ecod domain defintions and return them as a read-only mapping
 def load(file_path = False):
     # if user provides their own ecod domains, this part will parse their file
     if file_path:
@@ -87,8 +223,11 @@ def load(file_path = False):
             if __out_of_date(file_path):
                 warning_msg("WARNING: '{}' is out of date. Please update your domain definitions file.".format(pathlib.Path(file_path).name))
 
-            __parse_ecod_domain_txt(file_path,__ecod_domain_npy_fn)
-            return npload(__ecod_domain_npy_fn, allow_pickle = True).item()
+            # the user's file is never modified, it is compiled once into the cache and the compiled table is reused while the file is unchanged
+            sst_path = __compiled_path(file_path)
+            if not __ecod_domain_exists(sst_path):
+                __parse_ecod_domain_txt(file_path,sst_path)
+            return EcodDomains(sst_path)
             
         else:
             error_msg("ERROR: '{}' could not be found.".format(pathlib.Path(file_path).name))
@@ -96,16 +235,16 @@ def load(file_path = False):
     # default is to parse the domain definitions provided in this module
     else:
         # if the domain definitions are not present, a warning will be presented and the file will be updated, the  the file will be read
-        if __ecod_domain_exists(__npy_fn_path):
+        if __ecod_domain_exists(__sst_fn_path):
             # if the domain definitions are out of date, a warning will be presented but the file will be read
-            if __out_of_date(__npy_fn_path):
+            if __out_of_date(__sst_fn_path):
                 warning_msg("'ecod.latest.domains' is out of date. Please re-run program with the --update flag.")
-            return npload(__npy_fn_path, allow_pickle = True).item()
+            return EcodDomains(__sst_fn_path)
 
         else:
             notice_msg("'ecod.latest.domains' not found. Proceeding with download ...")
             update()
-            return npload(__npy_fn_path, allow_pickle = True).item()
+            return EcodDomains(__sst_fn_path)
 
 
 if __name__ == "__main__":
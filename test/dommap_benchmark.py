@@ -0,0 +1,456 @@
+# dommmap_benchmark.py
+# This file contains the benchmark suite of DomainMapper, run on synthetic hmmscan outputs, and the regression check of the mapped outputs against golden outputs
+#
+# Benchmark (times and peak memory of each mapping path):
+#   python test/dommap_benchmark.py --proteins 2000 --hits 6 --hsps 4 --aln_len 200 --gap_density 0.05
+#
+# Regression check (every golden output in test/golden/ is mapped again and compared, exits with an error on any difference):
+#   python test/dommap_benchmark.py --check
+#
+# Golden outputs are only written again with `--check --update_golden`, after a change to the mapped domains has been reviewed
+
+import os
+
+import sys
+
+import json
+
+import time
+
+import argparse
+
+import re
+
+import tempfile
+
+import resource
+
+import tracemalloc
+
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from DomainMapper import dommap_parser, dommap_store
+
+from DomainMapper.dommap_engine import DomainMapperEngine, map_protein
+
+from DomainMapper.dommap_data_structures import Domain, DomainMap, DomainParams, hsp_e_val
+
+import dommap_synthetic
+
+
+golden_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+# Synthetic inputs of the golden outputs, (proteins, hits, hsps, aln_len, gap_density, seed)
+golden_inputs = {
+    "sparse": (300, 2, 1, 150, 0.01, 1),
+    "dense": (150, 8, 4, 200, 0.03, 2),
+    "gappy": (150, 4, 3, 250, 0.08, 3),
+    "long": (20, 6, 6, 1500, 0.02, 4),
+}
+
+# Mapping options of the golden outputs, (intra_gap, inter_gap, overlap, frac_overlap, eval_cutoff)
+golden_options = {
+    "default": (30, 30, 40, 0.7, 1e-5),
+    "tight": (5, 50, 10, 0.3, 1e-20),
+}
+
+# Synthetic input of the gap mapping micro-benchmark, alignments run the length of the HMM or query with many insertions (proteins, hits, hsps, aln_len, gap_density, seed)
+gap_input = (40, 4, 3, 1500, 0.08, 5)
+
+# Header lines of an output which depend on the run rather than the mapped domains (time, input and output paths)
+__run_lines = (10, 12, 14)
+
+
+def comparable_lines(out_file: str):
+    """
+    Returns the lines of an output without those which depend on the run
+    """
+
+    with open(out_file, "r") as mapped_file:
+        return [line for i, line in enumerate(mapped_file) if i not in __run_lines]
+
+
+def best_time(function, repeat: int):
+    """
+    Returns the shortest wall time of `repeat` calls of a function
+    """
+
+    times = list()
+
+    for _ in range(repeat):
+
+        start = time.perf_counter()
+
+        function()
+
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def traced_memory(function):
+    """
+    Returns the peak memory traced while a function runs, and the bytes and blocks still allocated when it returns, which are held by its result.
+    Blocks allocated and freed while the function runs are only seen in the peak, tracemalloc does not count every allocation.
+    """
+
+    tracemalloc.start()
+
+    result = function()
+
+    retained = tracemalloc.take_snapshot().statistics("filename")
+
+    peak = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.stop()
+
+    del result
+
+    return peak, sum(stat.size for stat in retained), sum(stat.count for stat in retained)
+
+
+def traced_allocations(map_protein, proteins: list):
+    """
+    Maps proteins one at a time under tracemalloc, with a snapshot before and after each protein.
+    Returns the bytes allocated by each protein on top of those already traced (its traced peak, so that temporaries freed before it returns are counted),
+    and the bytes and blocks of its mapped domains (the difference of its snapshots, counting the blocks allocated by DomainMapper only)
+    """
+
+    allocated, held_bytes, held_blocks = list(), list(), list()
+
+    package_traces = [tracemalloc.Filter(True, os.path.join(os.path.dirname(dommap_parser.__file__), "*"))]
+
+    tracemalloc.start()
+
+    for protein in proteins:
+
+        before = tracemalloc.take_snapshot().filter_traces(package_traces)
+
+        tracemalloc.reset_peak()
+
+        start_bytes = tracemalloc.get_traced_memory()[0]
+
+        mapped = map_protein(protein)
+
+        allocated.append(tracemalloc.get_traced_memory()[1] - start_bytes)
+
+        held = tracemalloc.take_snapshot().filter_traces(package_traces).compare_to(before, "filename")
+
+        held_bytes.append(sum(stat.size_diff for stat in held))
+
+        held_blocks.append(sum(stat.count_diff for stat in held))
+
+        del mapped, before, held
+
+    tracemalloc.stop()
+
+    return allocated, held_bytes, held_blocks
+
+
+def baseline_map_ranges(hsp, intra_gap: int):
+    """
+    Returns the query residues mapped from a high-scoring pair by DomainMapper v3.0.2, as a sorted list of residue indices.
+    Gaps are found with a regex, the deletions before each gap are counted from the start of the alignment, and every residue is checked against a list of the gap residues.
+    """
+
+    gap_ranges = list()
+
+    query_start, query_end = hsp.query_range
+    hmm_start, hmm_end = hsp.hit_range
+
+    query_aln = hsp.query_aln
+    hmm_aln = hsp.hit_aln
+
+    if (query_end - query_start) - (hmm_end - hmm_start) >= intra_gap:
+        for gap in re.finditer(r'\.{'+str(intra_gap)+',}', hmm_aln):
+            gap_start = gap.start()
+            gap_end = gap.end()
+
+            gap_start_query_idx = gap_start + query_start - len(re.findall('-', query_aln[:gap_start]))
+            gap_end_query_idx = gap_end + query_start - len(re.findall('-', query_aln[:gap_start]))
+
+            gap_ranges += list(range(gap_start_query_idx, gap_end_query_idx))
+
+    return sorted([x for x in range(query_start, query_end) if x not in gap_ranges])
+
+
+def run_gap_benchmark(args):
+    """
+    Times mapping the query residues of long, gappy alignments (Domain.__map_range_finder, through hsp_gap_runs) against the regex and list search of DomainMapper v3.0.2,
+    and checks that both map the same residues
+    """
+
+    families, _ = dommap_synthetic.domain_definitions()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        in_file = os.path.join(tmp_dir, "gappy.hmm.out")
+
+        with open(in_file, "w") as hmmscan:
+            dommap_synthetic.write_hmmscan(hmmscan, *gap_input, families, end_rate = 0.0)
+
+        hsps = [hsp for protein in dommap_parser.parse(in_file) for hit in protein.hits for hsp in hit.hsps]
+
+    # Only the alignments which are searched for gaps, the query is longer than the HMM by at least `intra_gap`
+    gappy = [hsp for hsp in hsps if (hsp.query_range[1] - hsp.query_range[0]) - (hsp.hit_range[1] - hsp.hit_range[0]) >= args.intra_gap]
+
+    # The range finder is private to Domain, it does not read the domain it is called on
+    map_range_finder = Domain._Domain__map_range_finder
+
+    mismatches = sum(baseline_map_ranges(hsp, args.intra_gap) != [x for start, end in map_range_finder(None, hsp, args.intra_gap) for x in range(start, end)] for hsp in gappy)
+
+    baseline_time = best_time(lambda: [baseline_map_ranges(hsp, args.intra_gap) for hsp in gappy], args.repeat)
+
+    gap_time = best_time(lambda: [map_range_finder(None, hsp, args.intra_gap) for hsp in gappy], args.repeat)
+
+    return {"alignments": len(gappy), "mean_aln_len": sum(len(hsp.hit_aln) for hsp in gappy)/max(len(gappy), 1), "gaps": sum(len(re.findall(r"\.+", hsp.hit_aln)) for hsp in gappy),
+            "seconds": gap_time, "baseline_seconds": baseline_time, "speedup": baseline_time/gap_time, "mismatches": mismatches}
+
+
+def run_benchmark(args):
+    """
+    Times the Domain, DomainMap and end-to-end mapping paths on a synthetic hmmscan output, and measures their peak memory
+    """
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    params = DomainParams(args.intra_gap, args.inter_gap, args.overlap, args.frac_overlap)
+
+    report = {"input": {"proteins": args.proteins, "hits": args.hits, "hsps": args.hsps, "aln_len": args.aln_len, "gap_density": args.gap_density, "seed": args.seed},
+              "options": {"intra_gap": args.intra_gap, "inter_gap": args.inter_gap, "overlap": args.overlap, "frac_overlap": args.frac_overlap, "eval_cutoff": args.eval_cutoff},
+              "repeat": args.repeat, "python": sys.version.split()[0]}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        in_file = os.path.join(tmp_dir, "synthetic.hmm.out")
+
+        with open(in_file, "w") as hmmscan:
+            dommap_synthetic.write_hmmscan(hmmscan, args.proteins, args.hits, args.hsps, args.aln_len, args.gap_density, args.seed, families)
+
+        in_size = os.path.getsize(in_file)
+
+        # Every alignment is read, so that the Domain path is timed for every high-scoring pair
+        proteins = list(dommap_parser.parse(in_file))
+
+        hsps = [hsp for protein in proteins for hit in protein.hits for hsp in hit.hsps]
+
+        passing = [hsp for hsp in hsps if hsp_e_val(hsp) <= args.eval_cutoff]
+
+        report["input"].update(bytes = in_size, queries = len(proteins), hits_total = sum(len(protein.hits) for protein in proteins), hsps_total = len(hsps), hsps_passing = len(passing))
+
+        parse_time = best_time(lambda: list(dommap_parser.parse(in_file, args.eval_cutoff)), args.repeat)
+
+        report["parse"] = {"seconds": parse_time, "proteins_per_second": len(proteins)/parse_time, "mb_per_second": in_size/1e6/parse_time}
+
+        # Domain construction from each high-scoring pair below the E-value cutoff, the memory held by each domain and the rate at which it is built
+        domain_time = best_time(lambda: [Domain(hsp, params) for hsp in passing], args.repeat)
+
+        domain_peak, domain_bytes, domain_blocks = traced_memory(lambda: [Domain(hsp, params) for hsp in passing])
+
+        report["domain"] = {"seconds": domain_time, "domains_per_second": len(passing)/domain_time, "peak_bytes": domain_peak,
+                            "retained_bytes_per_domain": domain_bytes/max(len(passing), 1), "retained_blocks_per_domain": domain_blocks/max(len(passing), 1),
+                            "retained_bytes_per_second": domain_bytes/domain_time, "retained_blocks_per_second": domain_blocks/domain_time}
+
+        # Overlap matrix and elimination of the domains of each protein, as for the hits of a protein
+        protein_domains = [[Domain(hsp, params) for hit in protein.hits for hsp in hit.hsps if hsp_e_val(hsp) <= args.eval_cutoff] for protein in proteins]
+
+        def eliminate_all():
+
+            for domains in protein_domains:
+
+                domain_map = DomainMap(domains)
+
+                domain_map.update_overlap_matrix()
+
+                domain_map.eliminate_overlapping_domains()
+
+        domain_map_time = best_time(eliminate_all, args.repeat)
+
+        domain_map_peak, _, _ = traced_memory(eliminate_all)
+
+        report["domain_map"] = {"seconds": domain_map_time, "proteins_per_second": len(proteins)/domain_map_time, "domains_per_second": len(passing)/domain_map_time, "peak_bytes": domain_map_peak}
+
+        del protein_domains
+
+        # Mapping of each protein from its high-scoring pairs, the bytes it allocates and the bytes and blocks its mapped domains hold, and the rate at which they are allocated
+        mapping_args = (ecod_domain_dict, args.intra_gap, args.inter_gap, args.overlap, args.frac_overlap, args.eval_cutoff)
+
+        mapping_time = best_time(lambda: [map_protein(protein, *mapping_args) for protein in proteins], args.repeat)
+
+        n_mapped = sum(len(map_protein(protein, *mapping_args)) for protein in proteins)
+
+        allocated, held_bytes, held_blocks = traced_allocations(lambda protein: map_protein(protein, *mapping_args), proteins)
+
+        report["allocation"] = {"seconds": mapping_time, "proteins_per_second": len(proteins)/mapping_time, "domains": n_mapped,
+                                "allocated_bytes_per_protein": sum(allocated)/len(proteins), "max_allocated_bytes": max(allocated),
+                                "held_bytes_per_protein": sum(held_bytes)/len(proteins), "held_blocks_per_protein": sum(held_blocks)/len(proteins),
+                                "held_bytes_per_domain": sum(held_bytes)/max(n_mapped, 1), "held_blocks_per_domain": sum(held_blocks)/max(n_mapped, 1),
+                                "allocated_bytes_per_second": sum(allocated)/mapping_time, "held_blocks_per_second": sum(held_blocks)/mapping_time}
+
+        # Parsing, mapping and writing the output
+        engine = DomainMapperEngine(ecod_domain_dict, args.intra_gap, args.inter_gap, args.overlap, args.frac_overlap, args.eval_cutoff, workers = args.workers)
+
+        out_file = os.path.join(tmp_dir, "synthetic.mapped.out")
+
+        counts = list()
+
+        end_to_end_time = best_time(lambda: counts.append(engine.map_file(in_file, out_file)), args.repeat)
+
+        end_to_end_peak, _, _ = traced_memory(lambda: engine.map_file(in_file, out_file))
+
+        report["end_to_end"] = {"seconds": end_to_end_time, "proteins_per_second": len(proteins)/end_to_end_time, "mb_per_second": in_size/1e6/end_to_end_time,
+                                "peak_bytes": end_to_end_peak, "domains": counts[-1].domains, "workers": args.workers}
+
+    report["gap_mapping"] = run_gap_benchmark(args)
+
+    # Peak resident memory of the whole benchmark, including the parsed proteins held for the Domain and DomainMap paths
+    report["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*(1 if sys.platform == "darwin" else 1024)
+
+    return report
+
+
+def print_report(report):
+
+    source = report["input"]
+
+    print("Input:       {} proteins, {} hits, {} high-scoring pairs ({} below the E-value cutoff), {:.1f} MB".format(source["queries"], source["hits_total"], source["hsps_total"], source["hsps_passing"], source["bytes"]/1e6))
+    print("Parse:       {:8.3f} s   {:10.0f} proteins/s   {:6.1f} MB/s".format(report["parse"]["seconds"], report["parse"]["proteins_per_second"], report["parse"]["mb_per_second"]))
+    print("Domain:      {:8.3f} s   {:10.0f} domains/s    {:6.0f} bytes/domain   {:4.1f} blocks/domain retained (peak {:.1f} MB)".format(report["domain"]["seconds"], report["domain"]["domains_per_second"], report["domain"]["retained_bytes_per_domain"], report["domain"]["retained_blocks_per_domain"], report["domain"]["peak_bytes"]/1e6))
+    print("             retaining {:.1f} MB/s in {:.2f} million blocks/s".format(report["domain"]["retained_bytes_per_second"]/1e6, report["domain"]["retained_blocks_per_second"]/1e6))
+    print("DomainMap:   {:8.3f} s   {:10.0f} proteins/s   {:6.0f} domains/s (peak {:.2f} MB)".format(report["domain_map"]["seconds"], report["domain_map"]["proteins_per_second"], report["domain_map"]["domains_per_second"], report["domain_map"]["peak_bytes"]/1e6))
+    print("Mapping:     {:8.3f} s   {:10.0f} proteins/s   {:6.0f} bytes/protein allocated (at most {:.2f} MB)".format(report["allocation"]["seconds"], report["allocation"]["proteins_per_second"], report["allocation"]["allocated_bytes_per_protein"], report["allocation"]["max_allocated_bytes"]/1e6))
+    print("             {:.0f} bytes and {:.1f} blocks/domain held by the mapped domains, allocating {:.1f} MB/s in {:.2f} million held blocks/s".format(report["allocation"]["held_bytes_per_domain"], report["allocation"]["held_blocks_per_domain"], report["allocation"]["allocated_bytes_per_second"]/1e6, report["allocation"]["held_blocks_per_second"]/1e6))
+    print("End to end:  {:8.3f} s   {:10.0f} proteins/s   {:6.1f} MB/s (peak {:.1f} MB traced)".format(report["end_to_end"]["seconds"], report["end_to_end"]["proteins_per_second"], report["end_to_end"]["mb_per_second"], report["end_to_end"]["peak_bytes"]/1e6))
+    print("Gap mapping: {:8.3f} s   {:10.1f}x faster than v3.0.2 ({:.3f} s) on {} alignments of {:.0f} columns with {} gaps, {} mismatch(es)".format(report["gap_mapping"]["seconds"], report["gap_mapping"]["speedup"], report["gap_mapping"]["baseline_seconds"], report["gap_mapping"]["alignments"], report["gap_mapping"]["mean_aln_len"], report["gap_mapping"]["gaps"], report["gap_mapping"]["mismatches"]))
+    print("Max RSS:     {:.1f} MB".format(report["max_rss_bytes"]/1e6))
+
+
+def run_check(update_golden: bool = False):
+    """
+    Maps every golden input with every golden option set, serially, with worker processes, with Bio.SearchIO and from a compiled store,
+    and compares each output with its golden output. Returns the number of differences.
+    """
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    differences = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        for input_name, (proteins, hits, hsps, aln_len, gap_density, seed) in golden_inputs.items():
+
+            in_file = os.path.join(tmp_dir, input_name + ".hmm.out")
+
+            with open(in_file, "w") as hmmscan:
+                dommap_synthetic.write_hmmscan(hmmscan, proteins, hits, hsps, aln_len, gap_density, seed, families)
+
+            store_file = os.path.join(tmp_dir, input_name + ".dmc")
+
+            dommap_store.HSPStore.compile((protein for protein in dommap_parser.parse(in_file)), dommap_store.source_hash(in_file), store_file)
+
+            for options_name, options in golden_options.items():
+
+                golden_file = os.path.join(golden_dir, "{}.{}.mapped.out".format(input_name, options_name))
+
+                runs = {"native": (in_file, "native", 1), "workers": (in_file, "native", 2), "biopython": (in_file, "biopython", 1), "store": (store_file, "native", 1)}
+
+                for run_name, (run_input, parser, workers) in runs.items():
+
+                    out_file = os.path.join(tmp_dir, "{}.{}.{}.mapped.out".format(input_name, options_name, run_name))
+
+                    DomainMapperEngine(ecod_domain_dict, *options, parser = parser, workers = workers).map_file(run_input, out_file)
+
+                    if update_golden and run_name == "native":
+
+                        os.makedirs(golden_dir, exist_ok = True)
+
+                        with open(golden_file, "w") as golden:
+                            golden.writelines(comparable_lines(out_file))
+
+                    if not os.path.exists(golden_file):
+                        print("MISSING {} (write it with --update_golden)".format(golden_file))
+                        differences += 1
+                        break
+
+                    with open(golden_file, "r") as golden:
+                        expected = golden.readlines()
+
+                    mapped = comparable_lines(out_file)
+
+                    if mapped == expected:
+                        print("OK      {:<8} {:<8} {}".format(input_name, options_name, run_name))
+                        continue
+
+                    differences += 1
+
+                    # Rows which differ, as counts so that reordered rows are also reported
+                    missing, extra = Counter(expected) - Counter(mapped), Counter(mapped) - Counter(expected)
+
+                    print("DIFF    {:<8} {:<8} {} ({} lines differ{})".format(input_name, options_name, run_name, sum(missing.values()) + sum(extra.values()), "" if missing or extra else ", in a different order"))
+
+                    for sign, lines in (("-", missing), ("+", extra)):
+                        for line in list(lines)[:5]:
+                            print("      {} {}".format(sign, line.rstrip("\n")))
+
+    return differences
+
+
+def main():
+
+    argparser = argparse.ArgumentParser(description="Benchmarks DomainMapper on a synthetic hmmscan output, or checks the mapped outputs of the golden synthetic inputs against test/golden/")
+
+    argparser.add_argument("--check", help="Map the golden inputs and compare them with the golden outputs instead of benchmarking", default=False, action="store_true")
+
+    argparser.add_argument("--update_golden", help="With --check, write the golden outputs again from this version of DomainMapper", default=False, action="store_true")
+
+    argparser.add_argument("--proteins", type=int, default=2000, help="Number of proteins (default = 2000)")
+
+    argparser.add_argument("--hits", type=int, default=6, help="Maximum number of hits of a protein (default = 6)")
+
+    argparser.add_argument("--hsps", type=int, default=4, help="Maximum number of high-scoring pairs of a hit (default = 4)")
+
+    argparser.add_argument("--aln_len", type=int, default=200, help="Mean length of the HMM of each family (default = 200)")
+
+    argparser.add_argument("--gap_density", type=float, default=0.03, help="Probability of an insertion or deletion starting at each column of an alignment (default = 0.03)")
+
+    argparser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic input (default = 0)")
+
+    argparser.add_argument("--intra_gap", type=int, default=30, help="Intra domain gap tolerance (default = 30)")
+
+    argparser.add_argument("--inter_gap", type=int, default=30, help="Inter domain gap tolerance (default = 30)")
+
+    argparser.add_argument("--overlap", type=int, default=40, help="Domain overlap tolerance (default = 40)")
+
+    argparser.add_argument("--frac_overlap", type=float, default=0.7, help="Fractional domain overlap tolerance (default = 0.7)")
+
+    argparser.add_argument("--eval_cutoff", type=float, default=1e-5, help="E-value cutoff (default = 1e-5)")
+
+    argparser.add_argument("--workers", type=int, default=1, help="Worker processes of the end to end path (default = 1)")
+
+    argparser.add_argument("--repeat", type=int, default=3, help="Number of times each path is timed, the shortest time is reported (default = 3)")
+
+    argparser.add_argument("--json", type=str, default="NULL", help="Optional path of a JSON report of the benchmark")
+
+    args = argparser.parse_args()
+
+    if args.check:
+
+        differences = run_check(args.update_golden)
+
+        print("{} difference(s) from the golden outputs".format(differences))
+
+        sys.exit(1 if differences else 0)
+
+    report = run_benchmark(args)
+
+    print_report(report)
+
+    if args.json != "NULL":
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
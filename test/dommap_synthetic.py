@@ -0,0 +1,247 @@
+# dommmap_synthetic.py
+# This file contains the generator of synthetic `hmmscan -o` outputs, and of the domain definitions of their families, for benchmarks and regression checks
+
+import random
+
+
+# Residues of the query and HMM lines of alignments
+__residues = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def domain_definitions(n_families: int = 40, n_unknown: int = 5):
+    """
+    Returns the names of the synthetic families, and ECOD domain definitions (F-id, architecture, X-group, T-group) keyed by F-group for all but the last `n_unknown` of them,
+    which are mapped with "N/A" as are families missing from the ECOD domain definitions
+
+    Returns
+    ------------
+    families, ecod_domain_dict : list, dict
+    """
+
+    families = ["SynFam{}".format(i) for i in range(n_families)] + ["UnknownFam{}".format(i) for i in range(n_unknown)]
+
+    ecod_domain_dict = {family: ("{}.{}.{}.{}".format(i % 7 + 1, i % 5 + 1, i % 3 + 1, i + 1), "Arch{}".format(i % 7), "XGroup{}".format(i % 11), "TGroup{}".format(i % 17))
+                        for i, family in enumerate(families[:n_families])}
+
+    return families, ecod_domain_dict
+
+
+def __format_e_val(e_val: float):
+
+    if e_val == 0:
+        return "0"
+
+    return "%.2g" % e_val if e_val >= 0.01 else "%.1e" % e_val
+
+
+def __alignment(rng, query_len: int, hmm_len: int, query_from: int, gap_density: float, max_insert: int, end_rate: float):
+    """
+    Returns a random alignment of an HMM to the query from `query_from`, as (hmm_from, hmm_to, query_from, query_to, hmm_line, query_line) or `None` if it is too short.
+    Insertions (query residues not aligned to the HMM, '.' in the HMM line) and deletions ('-' in the query line) start at each column with probability `gap_density`,
+    and the alignment ends early at each column with probability `end_rate`.
+    """
+
+    hmm_from = rng.randint(1, max(1, hmm_len//10))
+
+    hmm_pos, query_pos = hmm_from, query_from
+
+    hmm_line, query_line = list(), list()
+
+    while hmm_pos <= hmm_len and query_pos <= query_len:
+
+        draw = rng.random()
+
+        if draw < gap_density and query_pos < query_len - 5:
+
+            # Runs of inserted residues, some of them longer than the intra domain gap tolerance
+            for _ in range(min(rng.choice([1, 2, 3, 5, rng.randint(1, max_insert)]), query_len - query_pos)):
+                hmm_line.append(".")
+                query_line.append(rng.choice(__residues).lower())
+                query_pos += 1
+
+        elif draw < 1.6*gap_density:
+
+            for _ in range(rng.randint(1, 6)):
+                if hmm_pos > hmm_len:
+                    break
+                hmm_line.append(rng.choice(__residues).lower())
+                query_line.append("-")
+                hmm_pos += 1
+
+        else:
+
+            hmm_line.append(rng.choice(__residues).lower())
+            query_line.append(rng.choice(__residues))
+            hmm_pos += 1
+            query_pos += 1
+
+        if rng.random() < end_rate:
+            break
+
+    # Alignments start and end on aligned residues
+    while hmm_line and (hmm_line[-1] == "." or query_line[-1] == "-"):
+
+        if hmm_line.pop() != ".":
+            hmm_pos -= 1
+
+        if query_line.pop() != "-":
+            query_pos -= 1
+
+    if len(hmm_line) < 5:
+        return None
+
+    return hmm_from, hmm_pos - 1, query_from, query_pos - 1, "".join(hmm_line), "".join(query_line)
+
+
+def write_hmmscan(out_file, proteins: int = 200, hits: int = 4, hsps: int = 3, aln_len: int = 200, gap_density: float = 0.03, seed: int = 0, families: list = None, max_insert: int = 70, end_rate: float = 0.01):
+    """
+    Writes a synthetic `hmmscan -o` output in the HMMER 3.3 text format, the same parameters and seed always write the same output
+
+    Parameters
+    ------------
+    out_file : file
+    Open text file the output is written to
+
+    proteins : int
+    Number of proteins (queries)
+
+    hits : int
+    Maximum number of hits (families) of a protein, each protein has between 0 and `hits` hits
+
+    hsps : int
+    Maximum number of high-scoring pairs of a hit, each hit has between 1 and `hsps` high-scoring pairs
+
+    aln_len : int
+    Mean length of the HMM of each family, alignments span up to the whole HMM
+
+    gap_density : float
+    Probability of an insertion or deletion starting at each column of an alignment
+
+    seed : int
+    Seed of the random generator
+
+    families : list
+    Names of the families (default = families of `domain_definitions`)
+
+    max_insert : int
+    Maximum length of a single insertion
+
+    end_rate : float
+    Probability of an alignment ending early at each column, alignments otherwise run to the end of the HMM or the query
+    """
+
+    rng = random.Random(seed)
+
+    families = domain_definitions()[0] if families is None else families
+
+    write = out_file.write
+
+    write("# hmmscan :: search sequence(s) against a profile database\n")
+    write("# HMMER 3.3.2 (Nov 2020); http://hmmer.org/\n")
+    write("# Copyright (C) 2020 Howard Hughes Medical Institute.\n")
+    write("# Freely distributed under the BSD open source license.\n")
+    write("# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -\n")
+    write("# query sequence file:             synthetic.fasta\n")
+    write("# target HMM database:             synthetic.hmm\n")
+    write("# output directed to file:         synthetic.hmm.out\n")
+    write("# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -\n\n")
+
+    for protein in range(proteins):
+
+        query_len = rng.randint(aln_len//2 + 20, max(aln_len//2 + 20, aln_len*max(hits, 1)))
+
+        query_id = "sp|S{:06d}|SYN{}_SYNTH".format(protein, protein)
+
+        write("Query:       {}  [L={}]\n".format(query_id, query_len))
+        write("Description: Synthetic protein {}\n".format(protein))
+        write("Scores for complete sequence (score includes all domains):\n")
+        write("   --- full sequence ---   --- best 1 domain ---    -#dom-\n")
+        write("    E-value  score  bias    E-value  score  bias    exp  N  Model        Description\n")
+        write("    ------- ------ -----    ------- ------ -----   ---- --  --------     -----------\n")
+
+        hit_list = list()
+
+        for family in rng.sample(families, min(rng.randint(0, hits), len(families))):
+
+            hmm_len = rng.randint(max(aln_len//2, 10), max(3*aln_len//2, 10))
+
+            hsp_list = list()
+
+            for _ in range(rng.randint(1, max(hsps, 1))):
+
+                alignment = __alignment(rng, query_len, hmm_len, rng.randint(1, max(1, query_len - 20)), gap_density, max_insert, end_rate)
+
+                if alignment is None:
+                    continue
+
+                # A few alignments are reported with an E-value of 0, and some are above the default E-value cutoff
+                e_val = 0.0 if rng.random() < 0.03 else 10**-rng.uniform(0, 60)
+
+                hsp_list.append((e_val,) + alignment)
+
+            if hsp_list:
+                hit_list.append((family, hsp_list))
+
+        if not hit_list:
+
+            write("\n   [No hits detected that satisfy reporting thresholds]\n\n\n")
+            write("Domain annotation for each model (and alignments):\n")
+            write("\n   [No targets detected that satisfy reporting thresholds]\n\n\n")
+
+        else:
+
+            for family, hsp_list in hit_list:
+                e_val = __format_e_val(min(hsp[0] for hsp in hsp_list))
+                write("    %7s %6.1f %5.1f    %7s %6.1f %5.1f  %5.1f %2d  %-12s -\n" % (e_val, 50.0, 0.1, e_val, 49.0, 0.1, 1.2, len(hsp_list), family))
+
+            write("\n\nDomain annotation for each model (and alignments):\n")
+
+            for family, hsp_list in hit_list:
+
+                write(">> {}  -\n".format(family))
+                write("   #    score  bias  c-Evalue  i-Evalue hmmfrom  hmm to    alifrom  ali to    envfrom  env to     acc\n")
+                write(" ---   ------ ----- --------- --------- ------- -------    ------- -------    ------- -------    ----\n")
+
+                for i, (e_val, hmm_from, hmm_to, query_from, query_to, _, _) in enumerate(hsp_list, 1):
+                    write("   %d !  %6.1f %5.1f %9s %9s %7d %7d .. %7d %7d .. %7d %7d .. %4.2f\n" % (i, 40.0, 0.1, __format_e_val(e_val), __format_e_val(10*e_val), hmm_from, hmm_to, query_from, query_to, query_from, query_to, 0.9))
+
+                write("\n  Alignments for each domain:\n")
+
+                for i, (e_val, hmm_from, hmm_to, query_from, query_to, hmm_line, query_line) in enumerate(hsp_list, 1):
+
+                    write("  == domain {}  score: 40.0 bits;  conditional E-value: {}\n".format(i, __format_e_val(e_val)))
+
+                    name_width, coord_width = max(len(family), len(query_id)), len(str(max(hmm_to, query_to)))
+
+                    hmm_pos, query_pos = hmm_from, query_from
+
+                    # Alignments are wrapped every 80 columns, as in hmmscan
+                    for block in range(0, len(hmm_line), 80):
+
+                        hmm_block, query_block = hmm_line[block:block + 80], query_line[block:block + 80]
+
+                        hmm_res, query_res = sum(c != "." for c in hmm_block), sum(c != "-" for c in query_block)
+
+                        write("  %*s %*s %s %-*s\n" % (name_width, family, coord_width, hmm_pos if hmm_res else "-", hmm_block, coord_width, hmm_pos + hmm_res - 1 if hmm_res else "-"))
+                        write("  %*s %s\n" % (name_width + coord_width + 1, "", "".join(h.upper() if h.upper() == q else "+" for h, q in zip(hmm_block, query_block))))
+                        write("  %*s %*s %s %-*s\n" % (name_width, query_id, coord_width, query_pos if query_res else "-", query_block, coord_width, query_pos + query_res - 1 if query_res else "-"))
+                        write("  %*s %s PP\n" % (name_width + coord_width + 1, "", "".join("." if q == "-" else "8" for q in query_block)))
+                        write("\n")
+
+                        hmm_pos += hmm_res
+                        query_pos += query_res
+
+                write("\n")
+
+        write("\n\nInternal pipeline statistics summary:\n")
+        write("-------------------------------------\n")
+        write("Query sequence(s):                         1  ({} residues searched)\n".format(query_len))
+        write("Target model(s):                       12675  (2137450 nodes)\n")
+        write("Passed MSV filter:                       425  (0.0198836); expected 427.5 (0.02)\n")
+        write("Initial search space (Z):              12675  [actual number of targets]\n")
+        write("Domain search space  (domZ):               {}  [number of targets reported over threshold]\n".format(len(hit_list)))
+        write("# CPU time: 0.05u 0.00s 00:00:00.05 Elapsed: 00:00:00.03\n")
+        write("# Mc/sec: 10217.71\n")
+        write("//\n")
+
+    write("[ok]\n")
@@ -0,0 +1,76 @@
+# test_dommap_batch.py
+# This file contains the tests of the up to date check of batch mode, which skips outputs that were already mapped with the same options
+#
+#   python -m pytest -q test/test_dommap_batch.py
+
+import os
+
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+from DomainMapper.dommap_batch import up_to_date, batch_mode
+
+
+__options = {"intra_gap": 30, "inter_gap": 30, "overlap": 40, "frac_overlap": 0.7, "eval_cutoff": 1e-5}
+
+
+@pytest.fixture(scope = "module")
+def mapped_output(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("batch")
+
+    in_file, out_file = str(tmp_dir / "sample.hmm.out"), str(tmp_dir / "sample.mapped.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 20, families = families)
+
+    DomainMapperEngine(ecod_domain_dict, **__options).map_file(in_file, out_file)
+
+    return ecod_domain_dict, in_file, out_file
+
+
+def test_same_options(mapped_output):
+
+    ecod_domain_dict, in_file, out_file = mapped_output
+
+    assert up_to_date(DomainMapperEngine(ecod_domain_dict, **__options), in_file, out_file)
+
+
+@pytest.mark.parametrize("option, value", [("intra_gap", 20), ("inter_gap", 50), ("overlap", 10), ("frac_overlap", 0.2), ("frac_overlap", 0.71), ("eval_cutoff", 1e-6)])
+def test_changed_option(mapped_output, option, value):
+
+    ecod_domain_dict, in_file, out_file = mapped_output
+
+    # Every mapping option is listed in the header, an output mapped with any other value is mapped again
+    assert not up_to_date(DomainMapperEngine(ecod_domain_dict, **dict(__options, **{option: value})), in_file, out_file)
+
+
+def test_batch_mode(tmp_path):
+
+    out_dir = str(tmp_path)
+
+    # Batch mode does not depend on how many files a glob pattern matches
+    assert batch_mode(["genomes/*.hmm.out"], "mapped")
+
+    assert batch_mode(["genome_?.hmm.out"], "mapped.out")
+
+    assert batch_mode(["genome_1.hmm.out", "genome_2.hmm.out"], "mapped")
+
+    assert batch_mode([], "NULL", manifest = True)
+
+    assert batch_mode(["genome_1.hmm.out"], out_dir)
+
+    assert not batch_mode(["genome_1.hmm.out"], "genome_1.mapped.out")
+
+    assert not batch_mode(["-"], "-")
@@ -0,0 +1,199 @@
+# test_dommap_cli.py
+# This file contains the tests of running `dommap` from the command line, as a separate process, on synthetic hmmscan outputs
+#
+#   python -m pytest -q test/test_dommap_cli.py
+
+import os
+
+import sys
+
+import time
+
+import lzma
+
+import queue
+
+import threading
+
+import subprocess
+
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+sys.path.insert(0, src_dir)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_io
+
+
+def dommap_env():
+
+    return dict(os.environ, PYTHONPATH = os.pathsep.join([src_dir] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])))
+
+
+def run_dommap(args: list, **kwargs):
+    """
+    Runs `dommap` with the package of this tree, and returns the completed process
+    """
+
+    return subprocess.run([sys.executable, "-m", "DomainMapper.dommap"] + args, env = dommap_env(), stdout = subprocess.PIPE, stderr = subprocess.PIPE, check = True, **kwargs)
+
+
+def output_rows(mapped_lines: list):
+
+    return [line for line in mapped_lines if not line.startswith("#") and line != "\n"]
+
+
+@pytest.fixture(scope = "module")
+def hmmscan_input(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("cli")
+
+    in_file, out_file = str(tmp_dir / "sample.hmm.out"), str(tmp_dir / "sample.mapped.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 50, families = families)
+
+    run_dommap(["-f", in_file, "-o", out_file])
+
+    with open(out_file) as mapped_file:
+        return in_file, mapped_file.readlines()
+
+
+def test_compressed_files(hmmscan_input, tmp_path):
+
+    in_file, mapped_lines = hmmscan_input
+
+    xz_file, gz_file = str(tmp_path / "sample.hmm.out.xz"), str(tmp_path / "sample.mapped.out.gz")
+
+    with open(in_file, "rb") as hmmscan_file, lzma.open(xz_file, "wb") as compressed_file:
+        compressed_file.write(hmmscan_file.read())
+
+    run_dommap(["-f", xz_file, "-o", gz_file])
+
+    # The output is compressed by its extension
+    assert dommap_io.input_compression(gz_file) == "gzip"
+
+    with dommap_io.open_input(gz_file, "r") as mapped_file:
+        compressed_lines = mapped_file.readlines()
+
+    assert output_rows(compressed_lines) == output_rows(mapped_lines)
+
+    assert len(compressed_lines) == len(mapped_lines)
+
+
+def test_pipe(hmmscan_input):
+
+    in_file, mapped_lines = hmmscan_input
+
+    with open(in_file, "rb") as hmmscan_file:
+        piped_lines = run_dommap(["-f", "-", "-o", "-"], stdin = hmmscan_file, universal_newlines = True).stdout.splitlines(keepends = True)
+
+    # Standard output holds the header without domain counts, the rows, and the domain counts as a trailer
+    assert len(piped_lines) == len(mapped_lines) + 6
+
+    assert piped_lines[12:15] == ["#               -\n", "#  Output:\n", "#               -\n"]
+
+    assert piped_lines[21] == "#               Listed at the end of the output\n"
+
+    assert output_rows(piped_lines[:-6]) == output_rows(mapped_lines)
+
+    assert piped_lines[-6:] == [mapped_lines[0], "#  Domain Counts:\n"] + mapped_lines[21:25]
+
+    # Compressed input is detected from standard input as well
+    with open(in_file, "rb") as hmmscan_file:
+        compressed = lzma.compress(hmmscan_file.read())
+
+    compressed_lines = run_dommap(["-f", "-", "-o", "-"], input = compressed).stdout.decode().splitlines(keepends = True)
+
+    # All but the time the output was executed on
+    assert compressed_lines[:10] + compressed_lines[11:] == piped_lines[:10] + piped_lines[11:]
+
+
+def test_streamed_rows(hmmscan_input):
+
+    in_file, mapped_lines = hmmscan_input
+
+    with open(in_file, "rb") as hmmscan_file:
+        contents = hmmscan_file.read()
+
+    # Start of each query
+    query_starts = [i + 1 for i in range(len(contents)) if contents.startswith(b"\nQuery:", i)]
+
+    process = subprocess.Popen([sys.executable, "-m", "DomainMapper.dommap", "-f", "-", "-o", "-"], env = dommap_env(), stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+
+    lines = queue.Queue()
+
+    reader = threading.Thread(target = lambda: [lines.put(line.decode()) for line in iter(process.stdout.readline, b"")])
+
+    reader.start()
+
+    try:
+
+        process.stdin.write(contents[:query_starts[30]])
+
+        process.stdin.flush()
+
+        # Rows are flushed once the flush interval has passed and a further protein is mapped
+        time.sleep(0.6)
+
+        process.stdin.write(contents[query_starts[30]:query_starts[35]])
+
+        process.stdin.flush()
+
+        streamed_lines = list()
+
+        deadline = time.monotonic() + 60.0
+
+        while not output_rows(streamed_lines) and time.monotonic() < deadline:
+            try:
+                streamed_lines.append(lines.get(timeout = 0.1))
+            except queue.Empty:
+                pass
+
+        # The first rows are written while the rest of the input has not been read
+        assert output_rows(streamed_lines)[0] == output_rows(mapped_lines)[0]
+
+        process.stdin.write(contents[query_starts[35]:])
+
+        process.stdin.close()
+
+        assert process.wait(60) == 0
+
+    finally:
+
+        if process.poll() is None:
+            process.kill()
+
+        reader.join()
+
+    while not lines.empty():
+        streamed_lines.append(lines.get())
+
+    assert output_rows(streamed_lines) == output_rows(mapped_lines)
+
+
+def test_glob_single_file(hmmscan_input, tmp_path):
+
+    in_file, mapped_lines = hmmscan_input
+
+    out_dir = str(tmp_path / "mapped")
+
+    # A glob pattern which matches a single file is mapped in batch mode, to the output directory
+    run_dommap(["-f", os.path.join(os.path.dirname(in_file), "sample.hmm.*"), "-o", out_dir])
+
+    with open(os.path.join(out_dir, "sample.mapped.out")) as mapped_file:
+        assert output_rows(mapped_file.readlines()) == output_rows(mapped_lines)
+
+    # As is a single file whose output path is an existing directory
+    os.remove(os.path.join(out_dir, "sample.mapped.out"))
+
+    run_dommap(["-f", in_file, "-o", out_dir])
+
+    assert os.listdir(out_dir) == ["sample.mapped.out"]
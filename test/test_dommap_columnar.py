@@ -0,0 +1,45 @@
+# test_dommap_columnar.py
+# This file contains the tests of the path of the columnar output, which is written next to the text output of `dommap --npz`
+#
+#   python -m pytest -q test/test_dommap_columnar.py
+
+import os
+
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper.dommap_engine import DomainMapperEngine, columnar_path
+
+
+@pytest.mark.parametrize("out_file, npz_file", [("name.mapped.out", "name.mapped.npz"), ("name.mapped.out.gz", "name.mapped.npz"), ("name", "name.npz"),
+                                                ("name.npz", "name.columnar.npz"), ("name.NPZ", "name.columnar.npz"), ("name.npz.xz", "name.columnar.npz")])
+def test_columnar_path(out_file, npz_file):
+
+    assert columnar_path(out_file) == npz_file
+
+
+def test_npz_output(tmp_path):
+
+    dommap_columnar = pytest.importorskip("DomainMapper.dommap_columnar")
+
+    in_file, out_file = str(tmp_path / "sample.hmm.out"), str(tmp_path / "sample.npz")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 10, families = families)
+
+    DomainMapperEngine(ecod_domain_dict).map_file(in_file, out_file, npz = True)
+
+    # The text output is not overwritten by the columnar output
+    with open(out_file) as mapped_file:
+        assert mapped_file.readline().startswith("#====")
+
+    assert dommap_columnar.load(columnar_path(out_file)).attributes["output"] == out_file
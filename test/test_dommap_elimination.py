@@ -0,0 +1,257 @@
+# test_dommap_elimination.py
+# This file contains the randomized equivalence tests of the sparse overlap graph of DomainMap against the dense all-pairs overlap matrix,
+# and of DomainMap.eliminate_overlapping_domains against the recursive elimination it replaced
+#
+#   python -m pytest -q test/test_dommap_elimination.py
+
+import os
+
+import sys
+
+import re
+
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from DomainMapper.dommap_parser import HSP
+
+from DomainMapper.dommap_data_structures import Domain, DomainMap, DomainParams
+
+
+# A few E-values are shared by many domains, so that ties are broken the same way as the recursive elimination
+__e_vals = (0.0, 1e-30, 1e-20, 1e-12, 1e-8)
+
+
+def recursive_elimination(overlap_matrix: list, e_vals: list):
+    """
+    Recursive elimination of DomainMapper v3.0.2 on a dense logical overlap matrix, returns the logical deletion array
+    """
+
+    deletion_matrix = [0]*len(e_vals)
+
+    def _recursive_elimination(overlap_map, i):
+
+        # If this domain has already been eliminated, skip
+        if deletion_matrix[i]:
+            return
+
+        # Temporarily save all index and E-value for domains that overlap
+        tmp_idx = [i]
+        tmp_eval = [e_vals[i]]
+        for j, overlap in enumerate(overlap_map):
+            if overlap and not deletion_matrix[j] and j != i:
+                tmp_idx.append(j)
+                tmp_eval.append(e_vals[j])
+
+        # If the reference domain has the lowest E-value eliminate all overlapping domains
+        min_eval_idx = tmp_idx[tmp_eval.index(min(tmp_eval))]
+        if min_eval_idx == i:
+            for j in tmp_idx:
+                if j != i:
+                    deletion_matrix[j] = 1
+            return
+        # else recursively check the overlapping domains of the lowest E-value domain
+        else:
+            _recursive_elimination(overlap_matrix[min_eval_idx], min_eval_idx)
+
+    for i, overlap_row in enumerate(overlap_matrix):
+        _recursive_elimination(overlap_row, i)
+
+    return deletion_matrix
+
+
+def dense_overlap_matrix(domain_map: DomainMap):
+    """
+    Overlap matrix of DomainMapper v3.0.2, every pair of domains is compared through the sets of their residue indices
+    """
+
+    # Residue indices of each domain are listed once
+    map_ranges = {id(dom): dom.map_range for dom in domain_map}
+
+    def map_intersection(dom_A, dom_B, start = 0, end = None):
+        return len(set(map_ranges[id(dom_A)]).intersection(set(map_ranges[id(dom_B)][start:end])))
+
+    overlap_matrix = [[0]*len(domain_map) for _ in domain_map]
+
+    for a, dom_A in enumerate(domain_map[:-1]):
+        for b, dom_B in enumerate(domain_map[a+1:]):
+            if map_intersection(dom_A, dom_B) > dom_A.overlap:
+
+                if map_intersection(dom_A, dom_B) <= 2*dom_A.overlap and (dom_A.map_len >= 2*dom_A.overlap or dom_B.map_len >= 2*dom_B.overlap):
+                    mid_rng_idx_B = len(map_ranges[id(dom_A)])//2
+
+                    if map_intersection(dom_A, dom_B, end = mid_rng_idx_B) >= dom_A.overlap or map_intersection(dom_A, dom_B, start = mid_rng_idx_B) >= dom_A.overlap:
+                        overlap_matrix[a][b+a+1] = 1
+                        overlap_matrix[b+a+1][a] = 1
+
+                else:
+                    overlap_matrix[a][b+a+1] = 1
+                    overlap_matrix[b+a+1][a] = 1
+
+            if map_intersection(dom_A, dom_B)/float(dom_A.map_len) > dom_A.fol or map_intersection(dom_A, dom_B)/float(dom_B.map_len) > dom_A.fol:
+                overlap_matrix[a][b+a+1] = 1
+                overlap_matrix[b+a+1][a] = 1
+
+    return overlap_matrix
+
+
+def random_domain_map(rng, n_domains: int, query_len: int, params: DomainParams, gap_rate: float = 0.0):
+    """
+    Returns a DomainMap of domains packed onto a single query, so that most domains overlap several others.
+    Domains are ungapped, unless runs of unaligned residues (insertions) start at each residue with probability `gap_rate`
+    """
+
+    domain_map = DomainMap()
+
+    for _ in range(n_domains):
+
+        length = rng.randint(15, query_len//2)
+
+        query_start = rng.randint(0, query_len - length)
+
+        e_val = rng.choice(__e_vals) if rng.random() < 0.6 else 10**-rng.uniform(5, 40)
+
+        hsp = HSP("SynFam{}".format(rng.randint(0, 9)), (query_start, query_start + length), (0, length), e_val)
+
+        hsp.query_aln = hsp.hit_aln = "A"*length
+
+        if gap_rate:
+
+            hsp.hit_aln = "".join("." if 0 < x < length - 1 and rng.random() < gap_rate else "a" for x in range(length))
+
+            hsp.hit_aln = re.sub(r"\.+", lambda gap: "."*len(gap.group())*rng.randint(1, 8), hsp.hit_aln)[:length - 1] + "a"
+
+            hsp.hit_range = (0, length - hsp.hit_aln.count("."))
+
+        domain_map.append(Domain(hsp, params))
+
+    return domain_map
+
+
+def kept_domains(domain_map: DomainMap):
+
+    return [domain is not None for domain in domain_map]
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_overlap_graph(seed):
+
+    rng = random.Random(2000 + seed)
+
+    params = DomainParams(rng.choice((1, 5, 30)), 30, rng.choice((0, 5, 10, 40)), rng.choice((0.1, 0.3, 0.7)))
+
+    # From dense clusters on a short query to domains spread over a long query, of which few overlap
+    domain_map = random_domain_map(rng, rng.randint(1, 60), rng.choice((150, 600, 3000)), params, gap_rate = rng.choice((0.0, 0.02, 0.1)))
+
+    dense_matrix = dense_overlap_matrix(domain_map)
+
+    assert domain_map.update_overlap_matrix() == [[j for j, overlap in enumerate(overlap_row) if overlap] for overlap_row in dense_matrix]
+
+
+def test_overlap_candidates(monkeypatch):
+
+    # Domains in a row along a long query only overlap their neighbours, and domains that are far apart are never compared
+    domain_map = DomainMap()
+
+    for i in range(300):
+
+        hsp = HSP("SynFam0", (60*i, 60*i + 80), (0, 80), 1e-10)
+
+        hsp.query_aln = hsp.hit_aln = "A"*80
+
+        domain_map.append(Domain(hsp, DomainParams(30, 30, 10, 0.1)))
+
+    compared = list()
+
+    map_intersection = Domain.map_intersection
+
+    def counted_intersection(dom_A, dom_B, start = 0, end = None):
+
+        if start == 0 and end is None:
+            compared.append((dom_A, dom_B))
+
+        return map_intersection(dom_A, dom_B, start, end)
+
+    monkeypatch.setattr(Domain, "map_intersection", counted_intersection)
+
+    assert domain_map.update_overlap_matrix() == [[j for j in (i - 1, i + 1) if 0 <= j < 300] for i in range(300)]
+
+    assert len(compared) == 299
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_dense_clusters(seed):
+
+    rng = random.Random(seed)
+
+    params = DomainParams(30, 30, rng.choice((5, 10, 40)), rng.choice((0.1, 0.3, 0.7)))
+
+    domain_map = random_domain_map(rng, rng.randint(2, 120), rng.randint(150, 600), params)
+
+    e_vals = [domain.e_val for domain in domain_map]
+
+    overlap_rows = domain_map.overlap_matrix()
+
+    dense_matrix = [[int(j in overlap_row) for j in range(len(domain_map))] for overlap_row in overlap_rows]
+
+    deletion_matrix = recursive_elimination(dense_matrix, e_vals)
+
+    domain_map.eliminate_overlapping_domains()
+
+    assert kept_domains(domain_map) == [not deleted for deleted in deletion_matrix]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_overlap_graphs(seed):
+
+    rng = random.Random(1000 + seed)
+
+    n_domains = rng.randint(2, 150)
+
+    domain_map = random_domain_map(rng, n_domains, 600, DomainParams(30, 30, 40, 0.7))
+
+    # Overlaps are drawn at random instead of from the residue ranges, from sparse graphs to nearly complete ones
+    density = rng.choice((0.02, 0.1, 0.5, 0.9))
+
+    dense_matrix = [[0]*n_domains for _ in range(n_domains)]
+
+    for a in range(n_domains):
+        for b in range(a + 1, n_domains):
+            if rng.random() < density:
+                dense_matrix[a][b] = dense_matrix[b][a] = 1
+
+    domain_map.update_overlap_matrix()
+
+    domain_map._overlap_matrix = [[j for j, overlap in enumerate(overlap_row) if overlap] for overlap_row in dense_matrix]
+
+    deletion_matrix = recursive_elimination(dense_matrix, [domain.e_val for domain in domain_map])
+
+    domain_map.eliminate_overlapping_domains()
+
+    assert kept_domains(domain_map) == [not deleted for deleted in deletion_matrix]
+
+
+def test_decreasing_chain():
+
+    # Each domain overlaps the next, and each has a lower E-value than the one before, the longest descent of the elimination
+    n_domains = 400
+
+    domain_map = random_domain_map(random.Random(0), n_domains, 600, DomainParams(30, 30, 40, 0.7))
+
+    for i, domain in enumerate(domain_map):
+        domain.e_val = 10.0**-i
+
+    domain_map.update_overlap_matrix()
+
+    domain_map._overlap_matrix = [[j for j in (i - 1, i + 1) if 0 <= j < n_domains] for i in range(n_domains)]
+
+    dense_matrix = [[int(j in overlap_row) for j in range(n_domains)] for overlap_row in domain_map._overlap_matrix]
+
+    deletion_matrix = recursive_elimination(dense_matrix, [domain.e_val for domain in domain_map])
+
+    domain_map.eliminate_overlapping_domains()
+
+    assert kept_domains(domain_map) == [not deleted for deleted in deletion_matrix]
@@ -0,0 +1,182 @@
+# test_dommap_engine.py
+# This file contains the tests of the importable mapping engine, DomainMapperEngine and map_domains, against the output files it writes
+#
+#   python -m pytest -q test/test_dommap_engine.py
+
+import os
+
+import sys
+
+import gzip
+
+import bz2
+
+import lzma
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_io, dommap_parser, dommap_engine
+
+from DomainMapper.dommap_engine import DomainMapperEngine, DomainRecord
+
+
+def mapped_rows(out_file: str):
+
+    with dommap_io.open_input(out_file, "r") as mapped_file:
+        return [row for row in mapped_file if not row.startswith("#") and row != "\n"]
+
+
+def record_row(record: DomainRecord):
+    """
+    Returns a domain record as a row of the output file
+    """
+
+    return ("{}\t"*9).format(record.accession, f"{record.e_val:3.2e}", record.res_str, " ".join(record.topology), record.arch, record.x_group, record.t_group, record.f_group, record.f_id) + "\n"
+
+
+@pytest.fixture(scope = "module")
+def hmmscan_input(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("engine")
+
+    in_file = str(tmp_dir / "sample.hmm.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 60, families = families)
+
+    return ecod_domain_dict, in_file
+
+
+def test_records(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    engine = DomainMapperEngine(ecod_domain_dict)
+
+    out_file = str(tmp_path / "sample.mapped.out")
+
+    counts = engine.map_file(in_file, out_file)
+
+    records = list(engine.map_domains(in_file))
+
+    assert [record_row(record) for record in records] == mapped_rows(out_file)
+
+    assert (counts.proteins, counts.domains) == (60, len(records))
+
+    assert [counts.NC, counts.CP, counts.IS] == [sum(top in record.topology for record in records) for top in ("NC", "CP", "IS")]
+
+    # Residue segments are 0-based and end exclusive, the residue string is their 1-based, inclusive form
+    for record in records:
+        assert record.res_str == ",".join("{}-{}".format(start + 1, end) for start, end in record.segments)
+
+    # Families missing from the domain definitions are mapped with "N/A"
+    assert any(record.f_id == "N/A" and record.f_group.startswith("UnknownFam") for record in records)
+
+
+def test_parsed_proteins(hmmscan_input):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    engine = DomainMapperEngine(ecod_domain_dict)
+
+    records = list(engine.map_domains(in_file))
+
+    # Proteins already parsed are mapped the same as the file they were parsed from, and one at a time with map_protein
+    assert list(engine.map_domains(dommap_parser.parse(in_file))) == records
+
+    assert [record for protein in dommap_parser.parse(in_file) for record in engine.map_protein(protein)] == records
+
+    assert list(dommap_engine.map_domains(in_file, ecod_domain_dict = ecod_domain_dict)) == records
+
+
+def test_lazy_records(hmmscan_input):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    parsed = list()
+
+    def proteins():
+        for protein in dommap_parser.parse(in_file):
+            parsed.append(protein.id)
+            yield protein
+
+    records = DomainMapperEngine(ecod_domain_dict).map_domains(proteins())
+
+    assert parsed == []
+
+    first_record = next(records)
+
+    # Proteins are only parsed up to the first protein with a mapped domain
+    assert parsed[-1] == first_record.accession
+
+    assert len(parsed) < 60
+
+
+def test_options(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    # One engine maps any number of files with the same options
+    engine = DomainMapperEngine(ecod_domain_dict, intra_gap = 5, inter_gap = 50, overlap = 10, frac_overlap = 0.3, eval_cutoff = 1e-8)
+
+    for out_name in ("first.mapped.out", "second.mapped.out"):
+
+        engine.map_file(in_file, str(tmp_path / out_name))
+
+        assert [record_row(record) for record in engine.map_domains(in_file)] == mapped_rows(str(tmp_path / out_name))
+
+    assert list(engine.map_domains(in_file)) != list(DomainMapperEngine(ecod_domain_dict).map_domains(in_file))
+
+    assert all(record.e_val < 1e-8 for record in engine.map_domains(in_file))
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, bz2.compress, lzma.compress])
+def test_compressed_input(hmmscan_input, tmp_path, compress):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    engine = DomainMapperEngine(ecod_domain_dict)
+
+    # Compressed inputs are detected from their contents whatever their name
+    compressed_file = str(tmp_path / "sample.hmm.out")
+
+    with open(in_file, "rb") as hmmscan_file, open(compressed_file, "wb") as compressed:
+        compressed.write(compress(hmmscan_file.read()))
+
+    assert list(engine.map_domains(compressed_file)) == list(engine.map_domains(in_file))
+
+    for out_name in ("sample.mapped.out", "sample.mapped.out.gz", "sample.mapped.out.xz"):
+
+        out_file = str(tmp_path / out_name)
+
+        engine.map_file(compressed_file, out_file)
+
+        assert [record_row(record) for record in engine.map_domains(in_file)] == mapped_rows(out_file)
+
+
+@pytest.mark.parametrize("option", ["intra_gap", "inter_gap", "overlap", "frac_overlap", "eval_cutoff", "workers"])
+def test_invalid_options(option):
+
+    with pytest.raises(ValueError, match = "Non-positive option"):
+        DomainMapperEngine(dict(), **{option: -1})
+
+
+def test_unreadable_input(tmp_path):
+
+    in_file = str(tmp_path / "domtblout.txt")
+
+    with open(in_file, "w") as hmmscan_file:
+        hmmscan_file.write("# target name        accession   tlen query name\n")
+
+    with pytest.raises(ValueError, match = "could not be read"):
+        DomainMapperEngine(dict()).map_file(in_file, str(tmp_path / "out.mapped.out"))
+
+    assert not os.path.exists(str(tmp_path / "out.mapped.out"))
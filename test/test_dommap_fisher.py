@@ -0,0 +1,87 @@
+# test_dommap_fisher.py
+# This file contains the tests of the closed form Fisher combiner against scipy.stats.combine_pvalues, down to the E-values where scipy underflows to 0
+#
+#   python -m pytest -q test/test_dommap_fisher.py
+
+import os
+
+import sys
+
+import math
+
+import random
+
+import warnings
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from DomainMapper.dommap_data_structures import fisher_combine
+
+scipy_stats = pytest.importorskip("scipy.stats")
+
+
+def scipy_combine(e_vals: list):
+
+    # scipy warns about results which underflow
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return float(scipy_stats.combine_pvalues(e_vals, "fisher")[1])
+
+
+def random_e_vals(rng, n_e_vals: int, min_exponent: float, max_exponent: float):
+    """
+    Returns E-values whose product is 10^-x for x drawn between `min_exponent` and `max_exponent`, split at random between the E-values
+    """
+
+    total = rng.uniform(min_exponent, max_exponent)
+
+    cuts = sorted(rng.uniform(0, total) for _ in range(n_e_vals - 1))
+
+    return [10**-(end - start) for start, end in zip([0] + cuts, cuts + [total])]
+
+
+@pytest.mark.parametrize("n_e_vals", [2, 3, 4, 5, 10])
+def test_matches_scipy(n_e_vals):
+
+    rng = random.Random(n_e_vals)
+
+    for _ in range(5000):
+
+        # Most combinations are close to where scipy underflows to 0, with products of 1e-290 to 1e-340
+        e_vals = random_e_vals(rng, n_e_vals, 290, 340) if rng.random() < 0.8 else random_e_vals(rng, n_e_vals, 0, 340)
+
+        if min(e_vals) == 0:
+            continue
+
+        combined, expected = fisher_combine(e_vals), scipy_combine(e_vals)
+
+        # Results are written as "{:3.2e}", and results which underflow are 0 in both
+        assert "{:3.2e}".format(combined) == "{:3.2e}".format(expected), e_vals
+
+        assert (combined == 0) == (expected == 0), e_vals
+
+        if expected >= sys.float_info.min:
+            assert math.isclose(combined, expected, rel_tol = 1e-9), e_vals
+
+
+def test_pairs_of_small_e_values():
+
+    # Pairs as combined when domains are merged, E-values of 0 are read as 1e-99, and merged domains are merged again
+    for exponent_A in range(0, 320, 3):
+        for exponent_B in range(0, 320, 7):
+
+            e_vals = [10.0**-exponent_A, 10.0**-exponent_B]
+
+            if min(e_vals) == 0:
+                continue
+
+            assert "{:3.2e}".format(fisher_combine(e_vals)) == "{:3.2e}".format(scipy_combine(e_vals)), e_vals
+
+
+def test_no_evidence():
+
+    assert fisher_combine([1.0, 1.0]) == 1.0
+
+    assert fisher_combine([2.0, 0.9]) == 1.0
@@ -0,0 +1,138 @@
+# test_dommap_index.py
+# This file contains the round trip tests of the index of a mapped output and of `dommap query`, against a linear scan of the output
+#
+#   python -m pytest -q test/test_dommap_index.py
+
+import os
+
+import sys
+
+import subprocess
+
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+sys.path.insert(0, src_dir)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_index
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+
+def linear_scan(out_file: str, column: int, name: str):
+    """
+    Returns the rows of an output whose `column` is `name`, in output order
+    """
+
+    return [row for row in linear_scan_rows(out_file) if row.split("\t")[column] == name]
+
+
+def linear_scan_rows(out_file: str):
+
+    with open(out_file) as mapped_file:
+        return [row for row in mapped_file if not row.startswith("#") and row != "\n"]
+
+
+def output_names(out_file: str, column: int):
+    """
+    Returns the sorted names in a column of an output
+    """
+
+    return sorted(set(row.split("\t")[column] for row in linear_scan_rows(out_file)))
+
+
+@pytest.fixture(scope = "module")
+def mapped_output(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("index")
+
+    in_file, out_file = str(tmp_dir / "sample.hmm.out"), str(tmp_dir / "sample.mapped.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 120, families = families)
+
+    DomainMapperEngine(ecod_domain_dict).map_file(in_file, out_file)
+
+    return out_file
+
+
+def assert_round_trip(out_file: str, index_file: str):
+
+    assert dommap_index.OutputIndex.build(out_file, index_file) == len(linear_scan_rows(out_file))
+
+    index = dommap_index.OutputIndex(out_file, index_file)
+
+    # Accessions which are not in the output have no rows
+    for accession in output_names(out_file, 0) + ["missing_protein", output_names(out_file, 0)[0][:-1]]:
+        assert index.accession_rows(accession) == linear_scan(out_file, 0, accession), accession
+
+    for column, field in dommap_index.group_columns.items():
+
+        assert index.group_names(column) == output_names(out_file, field)
+
+        for name in index.group_names(column) + ["missing_group"]:
+            assert index.group_rows(column, name) == linear_scan(out_file, field, name), (column, name)
+
+
+def test_round_trip(mapped_output, tmp_path):
+
+    assert_round_trip(mapped_output, str(tmp_path / "sample.mapped.out.idx"))
+
+    assert dommap_index.is_current(mapped_output, str(tmp_path / "sample.mapped.out.idx"))
+
+
+def test_key_collisions(mapped_output, tmp_path, monkeypatch):
+
+    # Every accession shares one key, or one of two, so rows are told apart by their accession alone
+    for collisions in (lambda accession: 0, lambda accession: len(accession) % 2):
+
+        monkeypatch.setattr(dommap_index, "accession_hash", collisions)
+
+        assert_round_trip(mapped_output, str(tmp_path / "collisions.idx"))
+
+
+def test_out_of_date(mapped_output, tmp_path):
+
+    out_file, index_file = str(tmp_path / "copy.mapped.out"), str(tmp_path / "copy.mapped.out.idx")
+
+    with open(mapped_output) as mapped_file, open(out_file, "w") as copy_file:
+        copy_file.write(mapped_file.read())
+
+    dommap_index.OutputIndex.build(out_file, index_file)
+
+    with open(out_file, "a") as copy_file:
+        copy_file.write("\n")
+
+    assert not dommap_index.is_current(out_file, index_file)
+
+    with pytest.raises(ValueError, match = "out of date"):
+        dommap_index.OutputIndex(out_file, index_file)
+
+
+def test_query(mapped_output, tmp_path):
+
+    out_file = str(tmp_path / "query.mapped.out")
+
+    with open(mapped_output) as mapped_file, open(out_file, "w") as copy_file:
+        copy_file.write(mapped_file.read())
+
+    accessions, f_groups, x_groups = output_names(out_file, 0)[:3], output_names(out_file, 7)[:2], output_names(out_file, 5)[-1:]
+
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join([src_dir] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])))
+
+    # The index is built by the query, as the output has none
+    result = subprocess.run([sys.executable, "-m", "DomainMapper.dommap", "query", "-f", out_file, "-a"] + accessions + ["--f_group"] + f_groups + ["--x_group"] + x_groups,
+                            env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, check = True)
+
+    expected = [row for accession in accessions for row in linear_scan(out_file, 0, accession)] + [row for name in f_groups for row in linear_scan(out_file, 7, name)] + [row for name in x_groups for row in linear_scan(out_file, 5, name)]
+
+    assert result.stdout.splitlines(keepends = True) == expected
+
+    assert dommap_index.is_current(out_file)
@@ -0,0 +1,243 @@
+# test_dommap_io.py
+# This file contains the tests of the input and output helpers of dommap_io
+#
+#   python -m pytest -q test/test_dommap_io.py
+
+import os
+
+import sys
+
+import io
+
+import struct
+
+import gzip
+
+import bz2
+
+import lzma
+
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from DomainMapper import dommap_io
+
+
+@pytest.mark.parametrize("fmt, values", [("Q", [0, 1, 2**40 + 3, 2**64 - 1]), ("I", [0, 7, 2**31, 2**32 - 1]), ("d", [0.0, 1e-300, -2.5, 1e300])])
+def test_little_endian_column(fmt, values):
+
+    column = struct.pack("<{}{}".format(len(values), fmt), *values)
+
+    # Columns start at any offset of the buffer
+    assert list(dommap_io.little_endian_column(b"magic" + column, 5, fmt, len(values))) == values
+
+
+@pytest.mark.skipif(sys.byteorder != "little", reason = "the byte swapped read is simulated on a little-endian machine")
+@pytest.mark.parametrize("fmt, values", [("Q", [0, 1, 2**40 + 3, 2**64 - 1]), ("I", [0, 7, 2**31, 2**32 - 1]), ("d", [0.0, 1e-300, -2.5, 1e300])])
+def test_byte_swapped_column(monkeypatch, fmt, values):
+
+    # A little-endian column read on a big-endian machine is as a big-endian column read here with the byte order swapped
+    monkeypatch.setattr(sys, "byteorder", "big")
+
+    column = struct.pack(">{}{}".format(len(values), fmt), *values)
+
+    assert list(dommap_io.little_endian_column(column, 0, fmt, len(values))) == values
+
+
+def test_header_lines():
+
+    # Downstream readers skip the first 31 lines of an output, the options and domain counts are kept within them
+    header = dommap_io.file_header("time", "in.hmm.out", "out.mapped.out", 30, 30, 40, 0.7, 1e-5, 10, 20, 1, 2, 3)
+
+    assert header.count("\n") == 31
+
+    assert header.splitlines()[-1].startswith("# Accession\t")
+
+    assert "#               overlap = 40, Fractional overlap = 0.7" in header.splitlines()
+
+
+# Rows of three proteins, the second of which has no domains
+__rows = [[("P1\t1.00e-10\t1-50\tNC\tArch\tX\tT\tF\t1.1.1.1\t\n", ["NC"]), ("P1\t1.00e-08\t60-90\t\tArch\tX\tT\tF2\t1.1.1.2\t\n", [])],
+          [],
+          [("P3\t1.00e-20\t1-99\tCP IS\tArch\tX\tT\tF\t1.1.1.1\t\n", ["CP", "IS"])]]
+
+__options = (30, 30, 40, 0.7, 1e-5)
+
+
+def write_output(out_file: str, rows: list = __rows, **kwargs):
+
+    writer = dommap_io.DomainMapWriter("time", "in.hmm.out", out_file, *__options, **kwargs)
+
+    for protein_rows in rows:
+        writer.write_rows(protein_rows)
+
+    writer.close()
+
+    return writer
+
+
+def expected_output(out_file: str):
+
+    return dommap_io.file_header("time", "in.hmm.out", out_file, *__options, 3, 3, 1, 1, 1) + "".join(row for protein_rows in __rows for row, _ in protein_rows)
+
+
+def test_header_width():
+
+    # The domain count lines are padded to the width of the banner, so that the header reserved with no counts is the size of the final header
+    headers = [dommap_io.file_header("time", "in.hmm.out", "out", *__options, *counts) for counts in ((0, 0, 0, 0, 0), (3, 3, 1, 1, 1), (10**6 - 1, 10**6 - 1, 10**5, 10**6 - 1, 7))]
+
+    assert len(set(len(header) for header in headers)) == 1
+
+    lines = headers[1].splitlines()
+
+    counts_start = lines.index("#  Domain Counts:") + 1
+
+    assert [len(line) for line in lines[counts_start:counts_start + 4]] == [len(lines[0])]*4
+
+
+def test_rewritten_header(tmp_path):
+
+    out_file = str(tmp_path / "out.mapped.out")
+
+    write_output(out_file)
+
+    with open(out_file) as mapped_file:
+        assert mapped_file.read() == expected_output(out_file)
+
+
+@pytest.mark.parametrize("extension", [".gz", ".bz2", ".xz"])
+def test_compressed_output(tmp_path, extension):
+
+    out_file = str(tmp_path / ("out.mapped.out" + extension))
+
+    write_output(out_file)
+
+    assert not os.path.exists(out_file + ".rows.tmp")
+
+    with dommap_io.open_input(out_file, "r") as mapped_file:
+        assert mapped_file.read() == expected_output(out_file)
+
+    # Compressed inputs are detected from their contents, and read back through the background reader
+    with dommap_io.open_input(out_file, "rb") as mapped_file:
+        assert mapped_file.read().decode() == expected_output(out_file)
+
+
+def test_streamed_output(monkeypatch):
+
+    stdout = io.StringIO()
+
+    monkeypatch.setattr(sys, "stdout", stdout)
+
+    write_output("-", flush_interval = 0.0)
+
+    header = dommap_io.file_header("time", "in.hmm.out", "-", *__options, None, None, None, None, None)
+
+    rows = "".join(row for protein_rows in __rows for row, _ in protein_rows)
+
+    # The domain counts can not be rewritten once the header is written, and follow the rows instead
+    assert stdout.getvalue() == header + rows + dommap_io.file_trailer(3, 3, 1, 1, 1)
+
+    assert "Listed at the end of the output" in header
+
+
+@pytest.mark.parametrize("out_name", ["out.mapped.out", "out.mapped.out.gz"])
+def test_counts_do_not_fit(tmp_path, out_name):
+
+    out_file = str(tmp_path / out_name)
+
+    writer = dommap_io.DomainMapWriter("time", "in.hmm.out", out_file, *__options)
+
+    writer.write_rows(__rows[0])
+
+    # A count wider than the reserved header
+    writer.Tot_prot_cnt = 10**90
+
+    with pytest.raises(ValueError, match = "do not fit in the reserved file header"):
+        writer.close()
+
+    assert writer.handle.closed
+
+    assert not os.path.exists(out_file + ".rows.tmp")
+
+
+# Compression modules of each compressed input, written with a name which does not tell how it is compressed
+__compressors = {"gzip": gzip.compress, "bz2": bz2.compress, "lzma": lzma.compress}
+
+
+def hmmscan_text(n_lines: int = 20000):
+
+    return "".join("Query:       protein_{}  [L={}]\n".format(i, i % 997) for i in range(n_lines)).encode()
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "lzma"])
+def test_compressed_input(tmp_path, compression):
+
+    in_file = str(tmp_path / "sample.hmm.out")
+
+    contents = hmmscan_text()
+
+    with open(in_file, "wb") as compressed_file:
+        compressed_file.write(__compressors[compression](contents))
+
+    assert dommap_io.input_compression(in_file) == compression
+
+    with dommap_io.open_input(in_file) as input_file:
+
+        assert input_file.read() == contents
+
+        # Offsets are given in the compressed file, all of which has been read
+        assert dommap_io.input_offset(input_file) == os.path.getsize(in_file)
+
+    with dommap_io.open_input(in_file, "r") as input_file:
+        assert input_file.readlines() == contents.decode().splitlines(keepends = True)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "lzma"])
+def test_concatenated_streams(tmp_path, compression):
+
+    in_file = str(tmp_path / "sample.hmm.out")
+
+    parts = [hmmscan_text(n_lines) for n_lines in (3, 5000, 1)]
+
+    # Streams compressed one after the other (e.g. `cat a.gz b.gz`), and padded with zeros as tape archives are
+    with open(in_file, "wb") as compressed_file:
+        compressed_file.write(__compressors[compression](parts[0]) + __compressors[compression](parts[1]) + bytes(512) + __compressors[compression](parts[2]) + bytes(64))
+
+    with dommap_io.open_input(in_file) as input_file:
+        assert input_file.read() == b"".join(parts)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "lzma"])
+def test_truncated_input(tmp_path, compression):
+
+    in_file = str(tmp_path / "sample.hmm.out")
+
+    with open(in_file, "wb") as compressed_file:
+        compressed_file.write(__compressors[compression](hmmscan_text())[:-20])
+
+    with dommap_io.open_input(in_file) as input_file:
+        with pytest.raises(OSError, match = "could not be decompressed"):
+            input_file.read()
+
+
+def test_closed_early(tmp_path):
+
+    in_file = str(tmp_path / "sample.hmm.out.gz")
+
+    with open(in_file, "wb") as compressed_file:
+        compressed_file.write(gzip.compress(hmmscan_text(400000), 1))
+
+    start = time.monotonic()
+
+    # The background thread stops once the reader is closed, instead of decompressing the rest of the file
+    with dommap_io.open_input(in_file) as input_file:
+        assert input_file.readline() == b"Query:       protein_0  [L=0]\n"
+
+        thread = input_file.raw.thread
+
+    assert not thread.is_alive()
+
+    assert time.monotonic() - start < 5.0
@@ -0,0 +1,87 @@
+# test_dommap_parallel.py
+# This file contains the tests of mapping with a pool of worker processes (`dommap --workers`), whose output must be the same as that of the serial path
+#
+#   python -m pytest -q test/test_dommap_parallel.py
+
+import os
+
+import sys
+
+import gzip
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+
+def comparable_lines(out_file: str):
+
+    # The time the output was executed on and its input and output paths differ
+    with open(out_file) as mapped_file:
+        return [line for i, line in enumerate(mapped_file) if i not in (10, 12, 14)]
+
+
+@pytest.fixture(scope = "module")
+def hmmscan_input(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("parallel")
+
+    in_file = str(tmp_dir / "sample.hmm.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    # Several blocks of queries (256 queries each) are mapped by each worker
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 700, hits = 5, families = families)
+
+    return ecod_domain_dict, in_file
+
+
+@pytest.mark.parametrize("options", [{}, {"intra_gap": 5, "inter_gap": 50, "overlap": 10, "frac_overlap": 0.3}])
+def test_same_as_serial(hmmscan_input, tmp_path, options):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    serial_file = str(tmp_path / "serial.mapped.out")
+
+    serial_counts = DomainMapperEngine(ecod_domain_dict, **options).map_file(in_file, serial_file)
+
+    for workers in (2, 3):
+
+        parallel_file = str(tmp_path / "parallel{}.mapped.out".format(workers))
+
+        assert DomainMapperEngine(ecod_domain_dict, workers = workers, **options).map_file(in_file, parallel_file) == serial_counts
+
+        assert comparable_lines(parallel_file) == comparable_lines(serial_file)
+
+
+def test_compressed_input(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    gz_file = str(tmp_path / "sample.hmm.out.gz")
+
+    with open(in_file, "rb") as hmmscan_file, gzip.open(gz_file, "wb") as compressed_file:
+        compressed_file.write(hmmscan_file.read())
+
+    serial_file, parallel_file = str(tmp_path / "serial.mapped.out"), str(tmp_path / "parallel.mapped.out")
+
+    DomainMapperEngine(ecod_domain_dict).map_file(in_file, serial_file)
+
+    # Blocks are split from the decompressed stream
+    DomainMapperEngine(ecod_domain_dict, workers = 2).map_file(gz_file, parallel_file)
+
+    assert comparable_lines(parallel_file) == comparable_lines(serial_file)
+
+
+def test_map_domains(hmmscan_input):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    assert list(DomainMapperEngine(ecod_domain_dict, workers = 2).map_domains(in_file)) == list(DomainMapperEngine(ecod_domain_dict).map_domains(in_file))
@@ -0,0 +1,140 @@
+# test_dommap_parser.py
+# This file contains the conformance tests of the native hmmer3-text parser against Bio.SearchIO, field by field on every high-scoring pair
+#
+#   python -m pytest -q test/test_dommap_parser.py
+
+import os
+
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from Bio import SearchIO
+
+from DomainMapper import dommap_parser
+
+import dommap_synthetic
+
+
+# Queries without hits, a hit without domains, RF/CS/PP annotation lines and a domain above the E-value cutoff
+edge_cases = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hmmscan_edge_cases.hmm.out")
+
+# Synthetic inputs, (proteins, hits, hsps, aln_len, gap_density, seed), the last of which has alignments wrapped over several blocks
+synthetic_inputs = [
+    (200, 2, 1, 150, 0.01, 11),
+    (100, 8, 4, 200, 0.03, 12),
+    (100, 4, 3, 250, 0.08, 13),
+    (10, 6, 6, 1500, 0.02, 14),
+]
+
+
+def hsp_fields(query_results, native: bool):
+    """
+    Returns the fields DomainMapper reads from each high-scoring pair, as (query id, hit id, hit_id, query_range, hit_range, evalue_cond, query alignment, hit alignment)
+    """
+
+    fields = list()
+
+    for query in query_results:
+
+        fields.append((query.id, None, None, None, None, None, None, None))
+
+        for hit in query.hits:
+
+            fields.append((query.id, hit.id, None, None, None, None, None, None))
+
+            for hsp in hit.hsps:
+
+                if native:
+                    query_aln, hit_aln = hsp.query_aln, hsp.hit_aln
+                else:
+                    query_aln, hit_aln = str(hsp.query.seq), str(hsp.hit.seq)
+
+                fields.append((query.id, hit.id, hsp.hit_id, tuple(hsp.query_range), tuple(hsp.hit_range), hsp.evalue_cond, query_aln, hit_aln))
+
+    return fields
+
+
+def assert_conforms(in_file: str):
+
+    native = hsp_fields(dommap_parser.parse(in_file), True)
+
+    biopython = hsp_fields(SearchIO.parse(in_file, "hmmer3-text"), False)
+
+    assert len(native) == len(biopython)
+
+    for native_fields, biopython_fields in zip(native, biopython):
+        assert native_fields == biopython_fields
+
+
+def test_edge_cases():
+
+    assert_conforms(edge_cases)
+
+    queries = list(dommap_parser.parse(edge_cases))
+
+    # The query without hits, and the hit without domains, are kept
+    assert [len(query.hits) for query in queries] == [0, 2]
+
+    assert [len(hit.hsps) for hit in queries[1].hits] == [2, 0]
+
+    # Insertions are read with the '.' of the HMM line, annotation lines are not part of the alignment
+    hsp = queries[1].hits[0].hsps[0]
+
+    assert hsp.hit_aln == "lkvlekLae...eLgvsleelkk"
+
+    assert hsp.query_aln == "LGIIEKIAErkpQLNVAIEEMKD"
+
+
+def test_eval_cutoff():
+
+    biopython = [hsp for query in SearchIO.parse(edge_cases, "hmmer3-text") for hit in query.hits for hsp in hit.hsps]
+
+    native = [hsp for query in dommap_parser.parse(edge_cases, 1e-5) for hit in query.hits for hsp in hit.hsps]
+
+    assert len(native) == len(biopython) == 2
+
+    # Every high-scoring pair is kept, only the alignments above the cutoff are not read
+    for native_hsp, biopython_hsp in zip(native, biopython):
+
+        assert (native_hsp.hit_id, tuple(native_hsp.query_range), tuple(native_hsp.hit_range), native_hsp.evalue_cond) == \
+               (biopython_hsp.hit_id, tuple(biopython_hsp.query_range), tuple(biopython_hsp.hit_range), biopython_hsp.evalue_cond)
+
+    assert (native[0].query_aln, native[0].hit_aln) == (str(biopython[0].query.seq), str(biopython[0].hit.seq))
+
+    assert (native[1].query_aln, native[1].hit_aln) == (None, None)
+
+
+@pytest.mark.parametrize("synthetic_input", synthetic_inputs)
+def test_synthetic(synthetic_input, tmp_path):
+
+    in_file = str(tmp_path / "synthetic.hmm.out")
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, *synthetic_input)
+
+    assert_conforms(in_file)
+
+
+def test_synthetic_eval_cutoff(tmp_path):
+
+    in_file = str(tmp_path / "synthetic.hmm.out")
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, *synthetic_inputs[1])
+
+    biopython = [hsp for query in SearchIO.parse(in_file, "hmmer3-text") for hit in query.hits for hsp in hit.hsps]
+
+    native = [hsp for query in dommap_parser.parse(in_file, 1e-20) for hit in query.hits for hsp in hit.hsps]
+
+    assert len(native) == len(biopython)
+
+    # E-values of 0 are always below the cutoff
+    for native_hsp, biopython_hsp in zip(native, biopython):
+
+        if biopython_hsp.evalue_cond <= 1e-20:
+            assert (native_hsp.query_aln, native_hsp.hit_aln) == (str(biopython_hsp.query.seq), str(biopython_hsp.hit.seq))
+        else:
+            assert (native_hsp.query_aln, native_hsp.hit_aln) == (None, None)
@@ -0,0 +1,196 @@
+# test_dommap_profile.py
+# This file contains the tests of the profile of a mapping run (`dommap --profile`), its stage times, counts and slowest proteins
+#
+#   python -m pytest -q test/test_dommap_profile.py
+
+import os
+
+import sys
+
+import json
+
+import random
+
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from test_dommap_cli import run_dommap
+
+from DomainMapper import dommap_parser, dommap_profile
+
+from DomainMapper.dommap_profile import MapProfile
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+
+def fake_protein(accession: str, n_hits: int, n_hsps: int):
+    """
+    Returns a protein with `n_hits` hits, the first of which holds all `n_hsps` high-scoring pairs
+    """
+
+    return SimpleNamespace(id = accession, hits = [SimpleNamespace(hsps = [None]*(n_hsps if i == 0 else 0)) for i in range(n_hits)])
+
+
+def output_rows(mapped_lines: list):
+
+    return [line for line in mapped_lines if not line.startswith("#") and line != "\n"]
+
+
+def mapped_rows(out_file: str):
+
+    with open(out_file) as mapped_file:
+        return output_rows(mapped_file)
+
+
+@pytest.fixture(scope = "module")
+def hmmscan_input(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("profile")
+
+    in_file = str(tmp_dir / "sample.hmm.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 300, families = families)
+
+    return ecod_domain_dict, in_file
+
+
+def test_laps(monkeypatch):
+
+    clock = iter([0.0, 1.0, 1.5, 4.0, 4.25])
+
+    monkeypatch.setattr(dommap_profile, "perf_counter", lambda: next(clock))
+
+    profile = MapProfile()
+
+    profile.lap("parse")
+
+    profile.lap("domains", 3)
+
+    # Time before a start is not counted in any stage
+    profile.start()
+
+    profile.lap("parse")
+
+    assert (profile.seconds["parse"], profile.seconds["domains"]) == (1.25, 0.5)
+
+    assert (profile.calls["parse"], profile.calls["domains"]) == (2, 3)
+
+    report = profile.report(input = "in.hmm.out")
+
+    assert report["input"] == "in.hmm.out"
+
+    assert list(report["stages"]) == list(MapProfile.stages)
+
+    assert report["stages"]["parse"] == {"seconds": 1.25, "calls": 2, "fraction": round(1.25/1.75, 4)}
+
+
+def test_slowest():
+
+    rng = random.Random(0)
+
+    proteins = [(fake_protein("protein_{}".format(i), rng.randint(0, 5), rng.randint(0, 9)), rng.randint(0, 3), rng.choice((0.5, rng.random()))) for i in range(200)]
+
+    single, merged = MapProfile(7), MapProfile(7)
+
+    for protein, n_domains, seconds in proteins:
+        single.protein(protein, n_domains, seconds)
+
+    # Profiles of worker processes are merged into the profile of the run
+    for block in (proteins[:50], proteins[50:51], proteins[51:]):
+
+        block_profile = MapProfile(7)
+
+        for protein, n_domains, seconds in block:
+            block_profile.protein(protein, n_domains, seconds)
+
+        merged.merge(block_profile)
+
+    # Proteins which took as long are listed from the last mapped
+    slowest = sorted(proteins, key = lambda protein: (protein[2], int(protein[0].id.split("_")[1])), reverse = True)[:7]
+
+    for profile in (single, merged):
+
+        report = profile.report()
+
+        assert (report["proteins"], report["hits"], report["hsps"], report["domains"]) == (200, sum(len(protein.hits) for protein, _, _ in proteins), sum(len(protein.hits[0].hsps) for protein, _, _ in proteins if protein.hits), sum(n_domains for _, n_domains, _ in proteins))
+
+        assert [(entry["accession"], entry["seconds"], entry["domains"]) for entry in report["slowest_proteins"]] == [(protein.id, round(seconds, 6), n_domains) for protein, n_domains, seconds in slowest]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_map_file(hmmscan_input, tmp_path, workers):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    engine = DomainMapperEngine(ecod_domain_dict, workers = workers)
+
+    profiled_file, out_file = str(tmp_path / "profiled.mapped.out"), str(tmp_path / "sample.mapped.out")
+
+    profile = MapProfile(3)
+
+    counts = engine.map_file(in_file, profiled_file, profile = profile)
+
+    engine.map_file(in_file, out_file)
+
+    # Profiling does not change the output
+    assert mapped_rows(profiled_file) == mapped_rows(out_file)
+
+    proteins = list(dommap_parser.parse(in_file))
+
+    report = profile.report()
+
+    assert (report["proteins"], report["hits"], report["hsps"], report["domains"]) == (counts.proteins, sum(len(protein.hits) for protein in proteins), sum(len(hit.hsps) for protein in proteins for hit in protein.hits), counts.domains)
+
+    assert report["stages"]["records"]["calls"] == report["stages"]["annotate"]["calls"] == counts.domains
+
+    assert report["stages"]["write"]["calls"] == counts.proteins
+
+    assert all(report["stages"][stage]["seconds"] > 0 for stage in ("parse", "domains", "eliminate", "records", "write"))
+
+    slowest = report["slowest_proteins"]
+
+    assert len(slowest) == 3
+
+    assert [entry["seconds"] for entry in slowest] == sorted([entry["seconds"] for entry in slowest], reverse = True)
+
+    hsps = {protein.id: sum(len(hit.hsps) for hit in protein.hits) for protein in proteins}
+
+    assert all(entry["hsps"] == hsps[entry["accession"]] for entry in slowest)
+
+
+def test_cli_report(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    out_file = str(tmp_path / "sample.mapped.out")
+
+    # The report is written next to the output by default
+    run_dommap(["-f", in_file, "-o", out_file, "--profile", "--profile_slowest", "4"])
+
+    with open(out_file + ".profile.json") as report_file:
+        report = json.load(report_file)
+
+    assert (report["input"], report["output"], report["parser"], report["workers"], report["proteins"]) == (in_file, out_file, "native", 1, 300)
+
+    assert report["options"] == {"intra_gap": 30, "inter_gap": 30, "overlap": 40, "frac_overlap": 0.7, "eval_cutoff": 1e-5}
+
+    assert len(report["slowest_proteins"]) == 4
+
+    assert 0 < sum(stage["seconds"] for stage in report["stages"].values()) <= report["elapsed_seconds"]
+
+    # The report of a streamed output is written to standard error, apart from the mapped domains
+    result = run_dommap(["-f", in_file, "-o", "-", "--profile"], universal_newlines = True)
+
+    assert json.loads(result.stderr)["proteins"] == 300
+
+    assert output_rows(result.stdout.splitlines(keepends = True)) == mapped_rows(out_file)
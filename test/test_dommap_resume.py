@@ -0,0 +1,208 @@
+# test_dommap_resume.py
+# This file contains the tests of resuming interrupted runs (`dommap --resume`) from the checkpoints of their journal, against uninterrupted runs
+#
+#   python -m pytest -q test/test_dommap_resume.py
+
+import os
+
+import sys
+
+import re
+
+import gzip
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_io
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+
+class Interrupted(Exception):
+    pass
+
+
+def no_hit_query(i: int):
+    """
+    Returns a query without any hits, as written by hmmscan
+    """
+
+    return ("Query:       no_hit_{}  [L=120]\n"
+            "Scores for complete sequence (score includes all domains):\n"
+            "   --- full sequence ---   --- best 1 domain ---    -#dom-\n"
+            "    E-value  score  bias    E-value  score  bias    exp  N  Model    Description\n"
+            "    ------- ------ -----    ------- ------ -----   ---- --  -------- -----------\n"
+            "\n"
+            "   [No hits detected that satisfy reporting thresholds]\n"
+            "\n"
+            "\n"
+            "Domain annotation for each model (and alignments):\n"
+            "\n"
+            "   [No targets detected that satisfy reporting thresholds]\n"
+            "\n"
+            "\n"
+            "Internal pipeline statistics summary:\n"
+            "-------------------------------------\n"
+            "Query sequence(s):                         1  (120 residues searched)\n"
+            "//\n").format(i)
+
+
+def comparable_lines(out_file: str):
+
+    # The time the output was executed on and the output path differ
+    with open(out_file) as mapped_file:
+        return [line for i, line in enumerate(mapped_file) if i not in (10, 14)]
+
+
+@pytest.fixture(scope = "module", params = ["complete", "truncated"])
+def hmmscan_input(request, tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("resume")
+
+    in_file = str(tmp_dir / "sample.hmm.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 30, families = families)
+
+    with open(in_file) as hmmscan_file:
+        contents = hmmscan_file.read()
+
+    query_starts = [match.start() for match in re.finditer(r"^Query:", contents, re.M)]
+
+    # Queries without hits first, between queries and last, next to each other
+    contents = contents[:query_starts[0]] + no_hit_query(0) + contents[query_starts[0]:query_starts[10]] + no_hit_query(1) + no_hit_query(2) + contents[query_starts[10]:] + no_hit_query(3)
+
+    # An input whose last query was cut off, as by a hmmscan run which did not finish
+    if request.param == "truncated":
+        contents = contents[:contents.rfind("Domain annotation for each model")]
+
+    with open(in_file, "w") as hmmscan_file:
+        hmmscan_file.write(contents)
+
+    return ecod_domain_dict, in_file
+
+
+def interrupted_run(engine: DomainMapperEngine, in_file: str, out_file: str, monkeypatch, protein: int, rows_written: bool):
+    """
+    Maps a file with a checkpoint after every protein, and interrupts the run at the `protein`-th protein, before or after its rows are written.
+    Returns the checkpoints written
+    """
+
+    checkpoints = list()
+
+    journal_write = dommap_io.MapJournal.write
+
+    def recorded_write(journal, checkpoint):
+        checkpoints.append(checkpoint)
+        journal_write(journal, checkpoint)
+
+    write_records = dommap_io.DomainMapWriter.write_records
+
+    def interrupted_write(writer, records):
+
+        if writer.Tot_prot_cnt + 1 == protein:
+
+            if rows_written:
+                write_records(writer, records)
+
+            raise Interrupted()
+
+        write_records(writer, records)
+
+    with monkeypatch.context() as patch:
+
+        patch.setattr(dommap_io.MapJournal, "write", recorded_write)
+
+        patch.setattr(dommap_io.DomainMapWriter, "write_records", interrupted_write)
+
+        with pytest.raises(Interrupted):
+            engine.map_file(in_file, out_file, checkpoint_interval = 0.0)
+
+    return checkpoints
+
+
+@pytest.mark.parametrize("parser, workers", [("native", 1), ("native", 2), ("biopython", 1)])
+def test_resume(hmmscan_input, tmp_path, monkeypatch, parser, workers):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    engine = DomainMapperEngine(ecod_domain_dict, parser = parser, workers = workers)
+
+    full_file = str(tmp_path / "full.mapped.out")
+
+    n_proteins = engine.map_file(in_file, full_file).proteins
+
+    with open(in_file, "rb") as hmmscan_file:
+        query_ends = [match.end() for match in re.finditer(rb"^//\n", hmmscan_file.read(), re.M)]
+
+    # Interrupted on the first protein, on and around the queries without hits, and on the last protein
+    for protein in (1, 2, 11, 12, 13, 14, n_proteins - 1, n_proteins):
+
+        for rows_written in (False, True):
+
+            out_file = str(tmp_path / "resumed.mapped.out")
+
+            checkpoints = interrupted_run(engine, in_file, out_file, monkeypatch, protein, rows_written)
+
+            # Every checkpoint is at the end of its last mapped query
+            assert [checkpoint["in_offset"] for checkpoint in checkpoints] == query_ends[:len(checkpoints)]
+
+            assert [checkpoint["proteins"] for checkpoint in checkpoints] == list(range(1, len(checkpoints) + 1))
+
+            engine.map_file(in_file, out_file, resume = True, checkpoint_interval = 0.0)
+
+            assert comparable_lines(out_file) == comparable_lines(full_file), (protein, rows_written)
+
+            assert not os.path.exists(out_file + ".journal")
+
+
+def test_resume_compressed(hmmscan_input, tmp_path, monkeypatch):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    gz_file = str(tmp_path / "sample.hmm.out.gz")
+
+    with open(in_file, "rb") as hmmscan_file, gzip.open(gz_file, "wb") as compressed_file:
+        compressed_file.write(hmmscan_file.read())
+
+    engine = DomainMapperEngine(ecod_domain_dict)
+
+    full_file, out_file = str(tmp_path / "full.mapped.out"), str(tmp_path / "resumed.mapped.out")
+
+    engine.map_file(gz_file, full_file)
+
+    # Compressed inputs skip the queries already mapped instead of starting from an offset
+    interrupted_run(engine, gz_file, out_file, monkeypatch, 13, True)
+
+    engine.map_file(gz_file, out_file, resume = True)
+
+    assert comparable_lines(out_file) == comparable_lines(full_file)
+
+
+def test_changed_input(hmmscan_input, tmp_path, monkeypatch):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    copy_file, out_file = str(tmp_path / "copy.hmm.out"), str(tmp_path / "resumed.mapped.out")
+
+    with open(in_file) as hmmscan_file, open(copy_file, "w") as copy:
+        copy.write(hmmscan_file.read())
+
+    engine = DomainMapperEngine(ecod_domain_dict)
+
+    interrupted_run(engine, copy_file, out_file, monkeypatch, 5, False)
+
+    # An input which grew since the run was interrupted is not resumed from the offsets of the journal
+    with open(copy_file, "a") as copy:
+        copy.write(no_hit_query(4))
+
+    with pytest.raises(ValueError, match = "different input file"):
+        engine.map_file(copy_file, out_file, resume = True)
@@ -0,0 +1,309 @@
+# test_dommap_segments.py
+# This file contains the randomized tests of the residue segments of a Domain, and of the insertional (IS) domains found from them,
+# against the lists of residue indices of DomainMapper v3.0.2
+#
+#   python -m pytest -q test/test_dommap_segments.py
+
+import os
+
+import sys
+
+import re
+
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_parser
+
+from DomainMapper.dommap_parser import HSP
+
+from DomainMapper.dommap_engine import map_protein
+
+from DomainMapper.dommap_data_structures import *
+
+
+def random_residues(rng, query_len: int = 200):
+    """
+    Returns a sorted list of residue indices made of a few runs, some of which touch or overlap
+    """
+
+    residues = set()
+
+    for _ in range(rng.randint(0, 6)):
+
+        start = rng.randint(0, query_len - 1)
+
+        residues.update(range(start, min(query_len, start + rng.randint(1, 40))))
+
+    return sorted(residues)
+
+
+def residue_segments(residues: list):
+    """
+    Returns the segments of a sorted list of residue indices
+    """
+
+    segs = list()
+
+    for x in residues:
+
+        if segs and segs[-1][1] == x:
+            segs[-1] = (segs[-1][0], x + 1)
+        else:
+            segs.append((x, x + 1))
+
+    return segs
+
+
+def random_hsp(rng, hit_id: str = "SynFam0"):
+    """
+    Returns a high-scoring pair with a random alignment of insertions ('.' in the HMM line) and deletions ('-' in the query line)
+    """
+
+    query_aln, hmm_aln = ["A"], ["a"]
+
+    for _ in range(rng.randint(5, 300)):
+
+        draw = rng.random()
+
+        if draw < 0.05:
+            run = rng.choice((1, 2, 5, rng.randint(1, 60)))
+            query_aln.append("a"*run)
+            hmm_aln.append("."*run)
+
+        elif draw < 0.08:
+            run = rng.randint(1, 6)
+            query_aln.append("-"*run)
+            hmm_aln.append("a"*run)
+
+        else:
+            query_aln.append("A")
+            hmm_aln.append("a")
+
+    query_aln.append("A")
+    hmm_aln.append("a")
+
+    query_aln, hmm_aln = "".join(query_aln), "".join(hmm_aln)
+
+    query_start, hmm_start = rng.randint(0, 500), rng.randint(0, 50)
+
+    hsp = HSP(hit_id, (query_start, query_start + len(query_aln) - query_aln.count("-")), (hmm_start, hmm_start + len(hmm_aln) - hmm_aln.count(".")), 10**-rng.uniform(3, 30))
+
+    hsp.query_aln, hsp.hit_aln = query_aln, hmm_aln
+
+    return hsp
+
+
+def baseline_map_range(hsp: HSP, intra_gap: int):
+    """
+    Residue indices of a high-scoring pair as found by Domain.__map_range_finder in DomainMapper v3.0.2
+    """
+
+    gap_ranges = list()
+
+    query_start, query_end = hsp.query_range
+    hmm_start, hmm_end = hsp.hit_range
+
+    if (query_end - query_start) - (hmm_end - hmm_start) >= intra_gap:
+        for gap in re.finditer(r'\.{'+str(intra_gap)+',}', hsp.hit_aln):
+            gap_start = gap.start()
+            gap_end = gap.end()
+
+            gap_start_query_idx = gap_start + query_start - len(re.findall('-', hsp.query_aln[:gap_start]))
+            gap_end_query_idx = gap_end + query_start - len(re.findall('-', hsp.query_aln[:gap_start]))
+
+            gap_ranges += list(range(gap_start_query_idx, gap_end_query_idx))
+
+    return sorted([x for x in range(query_start, query_end) if x not in gap_ranges])
+
+
+def baseline_merged_range(map_rng_A: list, map_rng_B: list, inter_gap: int):
+    """
+    Residue indices of domain A once domain B is merged into it, as found by Domain.__map_range_filler in DomainMapper v3.0.2
+    """
+
+    if map_rng_A[-1] < map_rng_B[0] and (map_rng_B[0] - map_rng_A[-1]) < inter_gap:
+        return sorted(set(map_rng_A + list(range(map_rng_A[-1], map_rng_B[0]))))
+
+    return sorted(set(map_rng_A + map_rng_B))
+
+
+def baseline_res_str(map_range: list):
+    """
+    Residue range string of a domain as formatted by DomainMapper v3.0.2
+    """
+
+    residue_range_as_string = str(map_range[0]+1)
+
+    for i, mr in enumerate(map_range[:-1]):
+        if mr + 1 != map_range[i+1]:
+            residue_range_as_string += ("-{},{}").format(str(mr+1), str(map_range[i+1]+1))
+
+    return residue_range_as_string + ("-{}").format(str(map_range[-1]+1))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_segment_operations(seed):
+
+    rng = random.Random(seed)
+
+    residues_A, residues_B = random_residues(rng), random_residues(rng)
+
+    segs_A, segs_B = residue_segments(residues_A), residue_segments(residues_B)
+
+    assert segments_len(segs_A) == len(residues_A)
+
+    # Segments are given in any order, and may overlap or be empty
+    shuffled_B = segs_B + [(x, x) for x in residues_A[:2]] + segs_B[:1]
+
+    rng.shuffle(shuffled_B)
+
+    assert segments_union(segs_A, shuffled_B) == residue_segments(sorted(set(residues_A) | set(residues_B)))
+
+    assert segments_difference(segs_A, shuffled_B) == residue_segments(sorted(set(residues_A) - set(residues_B)))
+
+    assert segments_intersection(segs_A, segs_B) == len(set(residues_A) & set(residues_B))
+
+    for start, end in ((0, None), (rng.randint(0, 50), None), (0, rng.randint(0, 50)), (rng.randint(0, 30), rng.randint(20, 80)), (-rng.randint(1, 30), None)):
+        assert segments_slice(segs_A, start, end) == residue_segments(residues_A[start:end]), (start, end)
+
+    if residues_A:
+        assert segments_gaps(segs_A) == residue_segments([x for x in range(residues_A[0], residues_A[-1]) if x not in residues_A])
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_map_range(seed):
+
+    rng = random.Random(seed)
+
+    hsp = random_hsp(rng)
+
+    for intra_gap in (1, 2, 5, 30):
+
+        domain = Domain(hsp, DomainParams(intra_gap, 30, 40, 0.7))
+
+        map_range = baseline_map_range(hsp, intra_gap)
+
+        assert domain.map_range == map_range, intra_gap
+
+        assert (domain.map_len, domain.map_start, domain.map_end) == (len(map_range), map_range[0], map_range[-1])
+
+        assert domain.format_map_range() == baseline_res_str(map_range)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_intersection_and_merge(seed):
+
+    rng = random.Random(seed)
+
+    params = DomainParams(rng.choice((2, 5, 30)), rng.choice((5, 30, 100)), 40, 0.7)
+
+    domain_A, domain_B = Domain(random_hsp(rng), params), Domain(random_hsp(rng), params)
+
+    map_rng_A, map_rng_B = domain_A.map_range, domain_B.map_range
+
+    assert domain_A.map_intersection(domain_B) == len(set(map_rng_A) & set(map_rng_B))
+
+    mid_rng_idx_B = len(map_rng_A)//2
+
+    for start, end in ((0, mid_rng_idx_B), (mid_rng_idx_B, None)):
+        assert domain_A.map_intersection(domain_B, start, end) == len(set(map_rng_A) & set(map_rng_B[start:end]))
+
+    domain_A.merge(domain_B)
+
+    merged_range = baseline_merged_range(map_rng_A, map_rng_B, params.inter_gap)
+
+    assert domain_A.map_range == merged_range
+
+    assert domain_A.format_map_range() == baseline_res_str(merged_range)
+
+    # Further residues are added with their gaps kept
+    residues = random_residues(rng, 800)
+
+    domain_A.update_map_range(residue_segments(residues))
+
+    assert domain_A.map_range == sorted(set(merged_range + residues))
+
+
+def baseline_insertional(mapped_domains: list, overlap: int):
+    """
+    Indices of the insertional (IS) domains of a protein as labelled by DomainMapper v3.0.2, every domain B is checked against the residues missing from every domain A
+    """
+
+    insertional = set()
+
+    for a,domain_A in enumerate(mapped_domains):
+
+        for b,domain_B in enumerate(mapped_domains):
+
+            alignment_gap_A = [x for x in range(domain_A.map_range[0],domain_A.map_range[-1]) if x not in domain_A.map_range]
+
+            num_res_B_in_aln_gap_A = len(set(alignment_gap_A).intersection(set(domain_B.map_range)))
+
+            if num_res_B_in_aln_gap_A > (domain_B.map_len - overlap) and (domain_B.map_len - overlap) > 0:
+
+                insertional.add(b)
+
+    return insertional
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_segments_in_gaps(seed):
+
+    rng = random.Random(seed)
+
+    segs_list = [residue_segments(random_residues(rng, rng.choice((100, 400)))) for _ in range(rng.randint(1, 12))]
+
+    res_in_gaps = dict()
+
+    for a, segs_A in enumerate(segs_list):
+
+        gap_residues_A = set(x for start, end in segments_gaps(segs_A) for x in range(start, end))
+
+        for b, segs_B in enumerate(segs_list):
+
+            num_res = len(gap_residues_A & set(x for start, end in segs_B for x in range(start, end)))
+
+            if num_res:
+                res_in_gaps[(a, b)] = num_res
+
+    assert segments_in_gaps(segs_list) == res_in_gaps
+
+
+def test_insertional_domain():
+
+    # A domain split by a gap of 100 residues, with a domain in the gap, one which sticks out of it and one past its last residue
+    segs_list = [[(0, 50), (150, 200)], [(60, 140)], [(120, 180)], [(210, 260)]]
+
+    assert segments_in_gaps(segs_list) == {(0, 1): 80, (0, 2): 30}
+
+
+@pytest.mark.parametrize("overlap", [0, 15, 40])
+def test_insertional_proteins(tmp_path, overlap):
+
+    in_file = str(tmp_path / "sample.hmm.out")
+
+    # Long insertions and many hits per protein so that some domains lie within the gaps of others
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 150, hits = 8, hsps = 3, gap_density = 0.02, max_insert = 150, seed = overlap)
+
+    n_insertional = 0
+
+    for protein in dommap_parser.parse(in_file):
+
+        mapped_domains = map_protein(protein, dict(), 5, 30, overlap, 0.7, 1e-5)
+
+        insertional = set(b for b, domain in enumerate(mapped_domains) if "IS" in domain.topology)
+
+        assert insertional == baseline_insertional(mapped_domains, overlap), protein.id
+
+        n_insertional += len(insertional)
+
+    assert n_insertional
@@ -0,0 +1,239 @@
+# test_dommap_serve.py
+# This file contains the tests of the server mode, served on a temporary Unix socket and called by a local client
+#
+#   python -m pytest -q test/test_dommap_serve.py
+
+import os
+
+import sys
+
+import json
+
+import socket
+
+import threading
+
+import http.client
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_serve
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix socket
+    """
+
+    def __init__(self, socket_path: str):
+
+        super().__init__("localhost")
+
+        self.socket_path = socket_path
+
+    def connect(self):
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        self.sock.connect(self.socket_path)
+
+
+def request(socket_path: str, method: str, url: str, body: bytes = None):
+    """
+    Returns the status and body of a request to the server
+    """
+
+    connection = UnixHTTPConnection(socket_path)
+
+    try:
+
+        connection.request(method, url, body = body)
+
+        response = connection.getresponse()
+
+        return response.status, response.read()
+
+    finally:
+        connection.close()
+
+
+def mapped_rows(out_file: str):
+
+    with open(out_file) as mapped_file:
+        return "".join(row for row in mapped_file if not row.startswith("#") and row != "\n")
+
+
+@pytest.fixture(scope = "module")
+def hmmscan_input(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("serve")
+
+    in_file, out_file = str(tmp_dir / "sample.hmm.out"), str(tmp_dir / "sample.mapped.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 40, families = families)
+
+    DomainMapperEngine(ecod_domain_dict).map_file(in_file, out_file)
+
+    return ecod_domain_dict, in_file, mapped_rows(out_file)
+
+
+@pytest.fixture
+def server(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file, rows = hmmscan_input
+
+    socket_path = str(tmp_path / "dommap.sock")
+
+    http_server = dommap_serve.make_server(DomainMapperEngine(ecod_domain_dict, workers = 2), socket_path = socket_path, map_root = os.path.dirname(in_file))
+
+    thread = threading.Thread(target = http_server.serve_forever)
+
+    thread.start()
+
+    yield socket_path
+
+    http_server.shutdown()
+
+    thread.join()
+
+    dommap_serve.close_server(http_server)
+
+
+def test_post_map(hmmscan_input, server):
+
+    ecod_domain_dict, in_file, rows = hmmscan_input
+
+    with open(in_file, "rb") as hmmscan_file:
+        status, body = request(server, "POST", "/map", hmmscan_file.read())
+
+    assert status == 200
+
+    assert body.decode() == rows
+
+
+def test_path_map(hmmscan_input, server):
+
+    ecod_domain_dict, in_file, rows = hmmscan_input
+
+    # Paths are absolute or relative to the directory files are mapped from
+    for path in (in_file, os.path.basename(in_file)):
+
+        status, body = request(server, "GET", "/map?path=" + path)
+
+        assert status == 200
+
+        assert body.decode() == rows
+
+    assert request(server, "GET", "/map?path=missing.hmm.out")[0] == 404
+
+
+def test_path_outside_root(hmmscan_input, server, tmp_path):
+
+    ecod_domain_dict, in_file, rows = hmmscan_input
+
+    outside_file = str(tmp_path / "outside.hmm.out")
+
+    with open(in_file) as hmmscan_file, open(outside_file, "w") as outside:
+        outside.write(hmmscan_file.read())
+
+    # A link within the directory which points out of it is not followed either
+    link = os.path.join(os.path.dirname(in_file), "link.hmm.out")
+
+    os.symlink(outside_file, link)
+
+    try:
+        for path in (outside_file, os.path.relpath(outside_file, os.path.dirname(in_file)), "/etc/passwd", "link.hmm.out"):
+            assert request(server, "GET", "/map?path=" + path)[0] == 403, path
+
+    finally:
+        os.remove(link)
+
+
+def test_no_map_root(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file, rows = hmmscan_input
+
+    socket_path = str(tmp_path / "dommap.sock")
+
+    http_server = dommap_serve.make_server(DomainMapperEngine(ecod_domain_dict), socket_path = socket_path)
+
+    thread = threading.Thread(target = http_server.serve_forever)
+
+    thread.start()
+
+    try:
+        assert request(socket_path, "GET", "/map?path=" + in_file)[0] == 403
+
+    finally:
+
+        http_server.shutdown()
+
+        thread.join()
+
+        dommap_serve.close_server(http_server)
+
+    assert not os.path.exists(socket_path)
+
+
+def test_stats(hmmscan_input, server):
+
+    ecod_domain_dict, in_file, rows = hmmscan_input
+
+    request(server, "GET", "/map?path=" + in_file)
+
+    request(server, "GET", "/map?path=missing.hmm.out")
+
+    status, body = request(server, "GET", "/stats")
+
+    assert status == 200
+
+    stats = json.loads(body)
+
+    assert (stats["workers"], stats["requests"], stats["failed"], stats["active_requests"], stats["queue_depth"]) == (2, 2, 1, 0, 0)
+
+    assert (stats["proteins"], stats["domains"]) == (40, len(rows.splitlines()))
+
+    assert set(stats["latency_ms"]) == {"mean", "p50", "p95", "max"}
+
+
+def test_socket_path(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file, rows = hmmscan_input
+
+    # Any file at the socket path which is not a socket is left as it is
+    socket_path = str(tmp_path / "not_a_socket")
+
+    with open(socket_path, "w") as regular_file:
+        regular_file.write("user data\n")
+
+    with pytest.raises(ValueError, match = "is not a socket"):
+        dommap_serve.make_server(DomainMapperEngine(ecod_domain_dict), socket_path = socket_path)
+
+    with open(socket_path) as regular_file:
+        assert regular_file.read() == "user data\n"
+
+    # A socket left by a server which was not shut down is replaced
+    stale_path = str(tmp_path / "stale.sock")
+
+    stale_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    stale_socket.bind(stale_path)
+
+    stale_socket.close()
+
+    http_server = dommap_serve.make_server(DomainMapperEngine(ecod_domain_dict), socket_path = stale_path)
+
+    dommap_serve.close_server(http_server)
+
+    assert not os.path.exists(stale_path)
@@ -0,0 +1,108 @@
+# test_dommap_shard.py
+# This file contains the tests of merging the mapped outputs of shards, against mapping the whole hmmscan output at once
+#
+#   python -m pytest -q test/test_dommap_shard.py
+
+import os
+
+import re
+
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+from DomainMapper.dommap_shard import split_file, merge_outputs
+
+
+__options = {"intra_gap": 30, "inter_gap": 30, "overlap": 40, "frac_overlap": 0.7, "eval_cutoff": 1e-5}
+
+
+def comparable_lines(out_file: str):
+
+    # The time the output was executed on and its input and output paths differ
+    with open(out_file) as mapped_file:
+        return [line for i, line in enumerate(mapped_file) if i not in (10, 12, 14)]
+
+
+@pytest.fixture
+def shards(tmp_path):
+
+    in_file = str(tmp_path / "sample.hmm.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 60, families = families)
+
+    return ecod_domain_dict, in_file, [path for path, queries, size in split_file(in_file, 3, str(tmp_path / "shards"))]
+
+
+def map_shards(ecod_domain_dict: dict, shard_files: list, shard_options: dict = None):
+    """
+    Maps each shard with the default options, updated with its `shard_options` if it has any, and returns the paths of the mapped outputs
+    """
+
+    out_files = list()
+
+    for shard_file in shard_files:
+
+        out_file = shard_file.replace(".hmm.out", ".mapped.out")
+
+        DomainMapperEngine(ecod_domain_dict, **dict(__options, **(shard_options or {}).get(shard_file, {}))).map_file(shard_file, out_file)
+
+        out_files.append(out_file)
+
+    return out_files
+
+
+def test_merge(shards, tmp_path):
+
+    ecod_domain_dict, in_file, shard_files = shards
+
+    whole_file, merged_file = str(tmp_path / "whole.mapped.out"), str(tmp_path / "merged.mapped.out")
+
+    DomainMapperEngine(ecod_domain_dict, **__options).map_file(in_file, whole_file)
+
+    merge_outputs(map_shards(ecod_domain_dict, shard_files), merged_file)
+
+    assert comparable_lines(merged_file) == comparable_lines(whole_file)
+
+
+@pytest.mark.parametrize("option, value, name", [("frac_overlap", 0.2, "fractional overlap"), ("overlap", 10, "overlap"), ("eval_cutoff", 1e-6, "E-value cutoff")])
+def test_different_options(shards, tmp_path, option, value, name):
+
+    ecod_domain_dict, in_file, shard_files = shards
+
+    out_files = map_shards(ecod_domain_dict, shard_files, {shard_files[1]: {option: value}})
+
+    merged_file = str(tmp_path / "merged.mapped.out")
+
+    with pytest.raises(ValueError, match = "mapped with a {} of".format(name)):
+        merge_outputs(out_files, merged_file)
+
+    assert not os.path.exists(merged_file)
+
+
+def test_missing_frac_overlap(shards, tmp_path):
+
+    ecod_domain_dict, in_file, shard_files = shards
+
+    out_files = map_shards(ecod_domain_dict, shard_files)
+
+    # Outputs of earlier versions have no fractional overlap in their header
+    with open(out_files[2]) as mapped_file:
+        lines = [re.sub(r", Fractional overlap = \S+", "", line) if line.startswith("#") else line for line in mapped_file]
+
+    with open(out_files[2], "w") as mapped_file:
+        mapped_file.writelines(lines)
+
+    with pytest.raises(ValueError, match = "does not list the fractional overlap"):
+        merge_outputs(out_files, str(tmp_path / "merged.mapped.out"))
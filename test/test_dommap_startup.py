@@ -0,0 +1,92 @@
+# test_dommap_startup.py
+# This file contains the startup time budget of the dommap command line and of dommap_data_structures, and checks that heavy dependencies are only imported when they are used
+#
+#   python -m pytest -q test/test_dommap_startup.py
+#
+# Times are the best of `repeat` runs in a new interpreter. Measured on a single core: `dommap -h` 0.13 s and importing dommap_data_structures 0.09 s,
+# of which 0.07 s is starting Python itself, against 1.9 s and 1.8 s for DomainMapper v3.0.2 which imported scipy, numpy and Bio.SearchIO on startup.
+
+import os
+
+import sys
+
+import time
+
+import subprocess
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+# Startup budgets in seconds, well above the measured times so that a slow machine passes, and well below the time of importing scipy or Bio
+help_budget = 0.5
+
+import_budget = 0.3
+
+repeat = 5
+
+# Packages which are only imported for the Bio.SearchIO parser, the ECOD download and the columnar output
+heavy_packages = ("scipy", "numpy", "Bio", "requests")
+
+
+def run_python(args: list):
+
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join([src_dir] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])))
+
+    return subprocess.run([sys.executable] + args, env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, check = True)
+
+
+def best_time(args: list):
+
+    times = list()
+
+    for _ in range(repeat):
+
+        start = time.perf_counter()
+
+        run_python(args)
+
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def loaded_packages(code: str):
+    """
+    Returns the heavy packages imported by running `code` in a new interpreter
+    """
+
+    result = run_python(["-c", code + "\nimport sys\nprint(' '.join(sorted(set(name.split('.')[0] for name in sys.modules) & set(" + repr(heavy_packages) + "))))"])
+
+    return result.stdout.strip().splitlines()[-1].split() if result.stdout.strip() else []
+
+
+def test_help_time():
+
+    elapsed = best_time(["-m", "DomainMapper.dommap", "-h"])
+
+    assert elapsed <= help_budget, "`dommap -h` took {:.3f} s, over its budget of {} s".format(elapsed, help_budget)
+
+
+def test_import_time():
+
+    elapsed = best_time(["-c", "import DomainMapper.dommap_data_structures"])
+
+    assert elapsed <= import_budget, "Importing dommap_data_structures took {:.3f} s, over its budget of {} s".format(elapsed, import_budget)
+
+
+def test_help_imports():
+
+    # The help page is printed by argparse, which exits
+    code = "import io, sys, runpy, contextlib\nsys.argv = ['dommap', '-h']\nwith contextlib.redirect_stdout(io.StringIO()):\n    try:\n        runpy.run_module('DomainMapper.dommap', run_name = '__main__')\n    except SystemExit:\n        pass"
+
+    assert loaded_packages(code) == []
+
+
+def test_data_structures_imports():
+
+    assert loaded_packages("import DomainMapper.dommap_data_structures") == []
+
+
+def test_engine_imports():
+
+    # Mapping with the native parser needs none of them either
+    assert loaded_packages("import DomainMapper.dommap_engine, DomainMapper.dommap_io, DomainMapper.dommap_parser") == []
@@ -0,0 +1,74 @@
+# test_dommap_store.py
+# This file contains the tests of the byte order of the compiled HSP store, which is written little-endian on every machine
+#
+#   python -m pytest -q test/test_dommap_store.py
+
+import os
+
+import sys
+
+import struct
+
+from itertools import accumulate
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_store
+
+from DomainMapper.dommap_engine import hmmscan_proteins
+
+
+def protein_fields(store: dommap_store.HSPStore):
+
+    return [(protein.id, [(hit.id, [(hsp.query_range, hsp.hit_range, hsp.evalue_cond, hsp.gap_runs) for hsp in hit.hsps]) for hit in protein.hits]) for protein in store]
+
+
+def compile_store(in_file: str, store_path: str):
+
+    proteins = (protein for protein, _ in hmmscan_proteins(in_file, "native", None))
+
+    dommap_store.HSPStore.compile(proteins, dommap_store.source_hash(in_file), store_path)
+
+    return store_path
+
+
+@pytest.fixture(scope = "module")
+def hmmscan_file(tmp_path_factory):
+
+    in_file = str(tmp_path_factory.mktemp("store") / "sample.hmm.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 30, families = families)
+
+    return in_file
+
+
+def test_little_endian_layout(hmmscan_file, tmp_path):
+
+    store = dommap_store.HSPStore(compile_store(hmmscan_file, str(tmp_path / "sample.hmm.store")))
+
+    # The first hit of each query is the first column after the magic number and the counts
+    with open(store.file_path, "rb") as store_file:
+        query_hits = struct.unpack_from("<{}Q".format(store.n_queries + 1), store_file.read(), len(store.magic) + struct.calcsize("<32s5Q"))
+
+    assert list(query_hits) == [0] + list(accumulate(len(protein.hits) for protein in store))
+
+
+def test_byte_swapped_read(hmmscan_file, tmp_path, monkeypatch):
+
+    native_fields = protein_fields(dommap_store.HSPStore(compile_store(hmmscan_file, str(tmp_path / "native.hmm.store"))))
+
+    # Columns are byte swapped when written and again when read on a big-endian machine
+    monkeypatch.setattr(sys, "byteorder", "big" if sys.byteorder == "little" else "little")
+
+    swapped_fields = protein_fields(dommap_store.HSPStore(compile_store(hmmscan_file, str(tmp_path / "swapped.hmm.store"))))
+
+    assert swapped_fields == native_fields
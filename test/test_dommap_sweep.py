@@ -0,0 +1,93 @@
+# test_dommap_sweep.py
+# This file contains the tests of the grid of options of sweep mode, whose outputs are named after the options of each combination
+#
+#   python -m pytest -q test/test_dommap_sweep.py
+
+import os
+
+import sys
+
+import resource
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+from DomainMapper.dommap_sweep import sweep_engines, sweep_file, options_name
+
+
+def test_duplicate_values():
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    # Values as parsed from `--frac_overlap 0.7 0.70 0.3 --eval_cutoff 1e-5 0.00001`
+    engines = sweep_engines(ecod_domain_dict, [30], [30, 30], [40], [0.7, 0.70, 0.3], [1e-5, 0.00001])
+
+    assert [options_name(engine) for engine in engines] == ["intra30_inter30_overlap40_frac0.7_eval1e-05", "intra30_inter30_overlap40_frac0.3_eval1e-05"]
+
+
+def test_duplicate_engines(tmp_path):
+
+    in_file, out_dir = str(tmp_path / "sample.hmm.out"), str(tmp_path / "sweep")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 10, families = families)
+
+    engines = [DomainMapperEngine(ecod_domain_dict, frac_overlap = frac_overlap) for frac_overlap in (0.7, 0.3, 0.70)]
+
+    # Nothing is written, as the first and last outputs would have the same name
+    with pytest.raises(ValueError, match = "same mapping options"):
+        sweep_file(engines, in_file, out_dir)
+
+    assert not os.path.exists(out_dir)
+
+
+def mapped_lines(out_file: str):
+
+    # The time the output was executed on and the output path differ
+    with open(out_file) as mapped_file:
+        return [line for i, line in enumerate(mapped_file) if i not in (10, 14)]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason = "open files are counted from /proc")
+@pytest.mark.parametrize("buffer_rows", [1, 150, 200000])
+def test_open_files(tmp_path, buffer_rows):
+
+    in_file, out_dir = str(tmp_path / "sample.hmm.out"), str(tmp_path / "sweep")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 40, families = families)
+
+    # 48 combinations, more than the files this process may open
+    engines = sweep_engines(ecod_domain_dict, [5, 30], [10, 30, 50], [10, 40], [0.3, 0.7], [1e-5, 1e-10])
+
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    resource.setrlimit(resource.RLIMIT_NOFILE, (len(os.listdir("/proc/self/fd")) + 16, hard_limit))
+
+    try:
+        summary_file, counts = sweep_file(engines, in_file, out_dir, buffer_rows = buffer_rows)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+
+    with open(summary_file) as summary:
+        assert len(summary.readlines()) == len(engines) + 1
+
+    for engine, engine_counts in zip(engines, counts):
+
+        out_file = str(tmp_path / "single.mapped.out")
+
+        # Outputs flushed any number of times are the same as mapping the file with the options of their combination
+        assert engine.map_file(in_file, out_file) == engine_counts
+
+        assert mapped_lines(os.path.join(out_dir, "sample.{}.mapped.out".format(options_name(engine)))) == mapped_lines(out_file)
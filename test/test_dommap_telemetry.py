@@ -0,0 +1,213 @@
+# test_dommap_telemetry.py
+# This file contains the tests of the throttled progress bar, and of the JSON-lines progress stream of a mapping run (`dommap --progress_json`)
+#
+#   python -m pytest -q test/test_dommap_telemetry.py
+
+import os
+
+import sys
+
+import io
+
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from test_dommap_cli import run_dommap
+
+from DomainMapper import dommap_io, dommap_parser, dommap_telemetry
+
+from DomainMapper.dommap_engine import DomainMapperEngine
+
+
+class Terminal(io.StringIO):
+    """
+    Text stream which is taken for a terminal
+    """
+
+    def isatty(self):
+        return True
+
+
+class Clock:
+    """
+    Monotonic clock which only moves when it is told to
+    """
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope = "module")
+def hmmscan_input(tmp_path_factory):
+
+    tmp_dir = tmp_path_factory.mktemp("telemetry")
+
+    in_file = str(tmp_dir / "sample.hmm.out")
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 80, families = families)
+
+    return ecod_domain_dict, in_file
+
+
+def test_throttled_progress_bar(monkeypatch):
+
+    clock = Clock()
+
+    monkeypatch.setattr(dommap_io, "monotonic", clock)
+
+    terminal = Terminal()
+
+    progress_bar = dommap_io.ProgressBar(10000, prefix = "Mapping:", file = terminal, interval = 0.1)
+
+    # 10000 updates over a second are drawn 10 times, the first is drawn at once
+    for iteration in range(10000):
+
+        clock.now += 0.0001
+
+        progress_bar.update(iteration)
+
+    assert terminal.getvalue().count("%") == 10
+
+    # The completed bar is drawn however soon it follows the last draw, and only once
+    progress_bar.update(10000)
+
+    progress_bar.finish()
+
+    assert terminal.getvalue().count("%") == 11
+
+    assert terminal.getvalue().endswith("| 100.0% \r\n")
+
+
+def test_finished_progress_bar(monkeypatch):
+
+    clock = Clock()
+
+    monkeypatch.setattr(dommap_io, "monotonic", clock)
+
+    terminal = Terminal()
+
+    progress_bar = dommap_io.ProgressBar(500, file = terminal)
+
+    progress_bar.update(10)
+
+    progress_bar.update(490)
+
+    # Input after the last query was not updated, the bar is completed by `finish`
+    progress_bar.finish()
+
+    assert terminal.getvalue().count("%") == 2
+
+    assert terminal.getvalue().endswith("| 100.0% \r\n")
+
+
+@pytest.mark.parametrize("total", [500, 0])
+def test_no_terminal(total):
+
+    not_a_terminal = io.StringIO()
+
+    progress_bar = dommap_io.ProgressBar(total, file = not_a_terminal)
+
+    for iteration in range(total):
+        progress_bar.update(iteration)
+
+    progress_bar.finish()
+
+    assert not_a_terminal.getvalue() == ""
+
+
+def test_progress_lines(monkeypatch):
+
+    clock = Clock()
+
+    monkeypatch.setattr(dommap_telemetry, "monotonic", clock)
+
+    stream = io.StringIO()
+
+    telemetry = dommap_telemetry.ProgressTelemetry(stream, interval = 5.0)
+
+    # A resumed run starts from 100 proteins and 1000 bytes of a 11000 byte input
+    telemetry.start("in.hmm.out", 11000, proteins = 100, domains = 150, in_bytes = 1000)
+
+    for second in range(1, 13):
+
+        clock.now += 1.0
+
+        telemetry.hsps += 30
+
+        telemetry.update(100 + 10*second, 150 + 20*second, 1000 + 500*second)
+
+    telemetry.finish(230, 410)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    # Progress lines are written every 5 seconds
+    assert [(line["event"], line["proteins"]) for line in lines] == [("start", 100), ("progress", 150), ("progress", 200), ("done", 230)]
+
+    assert all(set(line) >= {"event", "time", "elapsed", "pid", "in_file", "in_size", "proteins", "hsps", "domains", "in_bytes", "rss_bytes", "max_rss_bytes"} for line in lines)
+
+    assert all(line["pid"] == os.getpid() and line["in_file"] == "in.hmm.out" and line["in_size"] == 11000 and 0 < line["rss_bytes"] <= line["max_rss_bytes"] for line in lines)
+
+    progress = lines[2]
+
+    assert (progress["elapsed"], progress["hsps"], progress["domains"], progress["in_bytes"]) == (10.0, 300, 350, 6000)
+
+    # Rates are measured from the start of the resumed run, and since the previous line
+    assert (progress["proteins_per_second"], progress["hsps_per_second"], progress["recent_proteins_per_second"], progress["recent_hsps_per_second"]) == (10.0, 30.0, 10.0, 30.0)
+
+    assert progress["eta_seconds"] == 10.0
+
+    assert (lines[-1]["in_bytes"], lines[-1]["eta_seconds"]) == (11000, 0.0)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_map_file(hmmscan_input, tmp_path, workers):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    stream = io.StringIO()
+
+    # Every protein is followed by a progress line
+    telemetry = dommap_telemetry.ProgressTelemetry(stream, interval = 0.0)
+
+    counts = DomainMapperEngine(ecod_domain_dict, workers = workers).map_file(in_file, str(tmp_path / "sample.mapped.out"), telemetry = telemetry)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    assert (lines[0]["event"], lines[-1]["event"]) == ("start", "done")
+
+    assert [line["proteins"] for line in lines[1:-1]] == list(range(1, counts.proteins + 1))
+
+    assert all(earlier["in_bytes"] <= later["in_bytes"] and earlier["domains"] <= later["domains"] for earlier, later in zip(lines[1:-1], lines[2:-1]))
+
+    hsps = sum(len(hit.hsps) for protein in dommap_parser.parse(in_file) for hit in protein.hits)
+
+    assert (lines[-1]["proteins"], lines[-1]["hsps"], lines[-1]["domains"], lines[-1]["in_bytes"]) == (counts.proteins, hsps, counts.domains, os.path.getsize(in_file))
+
+
+def test_cli_progress(hmmscan_input, tmp_path):
+
+    ecod_domain_dict, in_file = hmmscan_input
+
+    out_file = str(tmp_path / "sample.mapped.out")
+
+    result = run_dommap(["-f", in_file, "-o", out_file, "--progress_json", "-", "--progress_interval", "0.5"], universal_newlines = True)
+
+    # The progress bar is not drawn to a pipe, the progress stream is written to standard error
+    assert "Mapping:" not in result.stdout
+
+    lines = [json.loads(line) for line in result.stderr.splitlines() if line.startswith("{")]
+
+    assert (lines[0]["event"], lines[-1]["event"], lines[-1]["proteins"]) == ("start", "done", 80)
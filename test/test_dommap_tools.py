@@ -0,0 +1,103 @@
+# test_dommap_tools.py
+# This file contains the tests of loading the user's own ECOD domain definitions (`dommap --dom_def`), which are compiled into a cache and never modified
+#
+#   python -m pytest -q test/test_dommap_tools.py
+
+import os
+
+import sys
+
+import subprocess
+
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+sys.path.insert(0, src_dir)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dommap_synthetic
+
+from DomainMapper import dommap_tools
+
+
+def write_ecod_domains(file_path: str, ecod_domain_dict: dict):
+    """
+    Writes domain definitions in the layout of ECOD 'Latest Domains', of which only the F-id, architecture, X-, H-, T- and F-group columns are read
+    """
+
+    with open(file_path, "w") as ecod_file:
+
+        ecod_file.write("#uid\tecod_domain_id\tmanual_rep\tf_id\tpdb\tchain\tpdb_range\tseqid_range\tunp_acc\tarch_name\tx_name\th_name\tt_name\tf_name\tasm_status\tligand\n")
+
+        for i, (f_group, (f_id, arch, x_group, t_group)) in enumerate(ecod_domain_dict.items()):
+            ecod_file.write("\t".join([str(i), "e{}".format(i), "AUTO", f_id, "1abc", "A", "A:1-100", "A:1-100", "P00000", '"{}"'.format(arch), '"{}"'.format(x_group), '"NO_H_NAME"', '"{}"'.format(t_group), '"{}"'.format(f_group), "NOT_DOMAIN_ASSEMBLY", "NO_LIGANDS"]) + "\n")
+
+
+@pytest.fixture
+def user_definitions(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("DOMMAP_CACHE", str(tmp_path / "cache"))
+
+    families, ecod_domain_dict = dommap_synthetic.domain_definitions()
+
+    data_dir = tmp_path / "data"
+
+    data_dir.mkdir()
+
+    dom_def = str(data_dir / "my.txt")
+
+    write_ecod_domains(dom_def, ecod_domain_dict)
+
+    return families, ecod_domain_dict, dom_def
+
+
+def test_load(user_definitions, tmp_path):
+
+    families, ecod_domain_dict, dom_def = user_definitions
+
+    with open(dom_def, "rb") as ecod_file:
+        contents = ecod_file.read()
+
+    ecod_domains = dommap_tools.load(dom_def)
+
+    assert dict(ecod_domains) == {f_group: list(record) for f_group, record in ecod_domain_dict.items()}
+
+    # The user's file is left as it was, and is only compiled once while it is unchanged
+    with open(dom_def, "rb") as ecod_file:
+        assert ecod_file.read() == contents
+
+    assert os.path.dirname(ecod_domains.file_path) == str(tmp_path / "cache")
+
+    assert dommap_tools.load(dom_def).file_path == ecod_domains.file_path
+
+    write_ecod_domains(dom_def, dict(list(ecod_domain_dict.items())[:10]))
+
+    assert len(dommap_tools.load(dom_def)) == 10
+
+
+def test_dom_def_run(user_definitions, tmp_path):
+
+    families, ecod_domain_dict, dom_def = user_definitions
+
+    in_file, out_file = str(tmp_path / "data" / "sample.hmm.out"), str(tmp_path / "data" / "sample.mapped.out")
+
+    with open(in_file, "w") as hmmscan_file:
+        dommap_synthetic.write_hmmscan(hmmscan_file, proteins = 20, families = families)
+
+    work_dir = tmp_path / "work"
+
+    work_dir.mkdir()
+
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join([src_dir] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])))
+
+    subprocess.run([sys.executable, "-m", "DomainMapper.dommap", "-f", in_file, "-o", out_file, "--dom_def", dom_def], cwd = str(work_dir), env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE, check = True)
+
+    # The definitions file still exists, and nothing is written to the working directory
+    assert os.path.exists(dom_def)
+
+    assert os.listdir(str(work_dir)) == []
+
+    with open(out_file) as mapped_file:
+        assert any("XGroup" in line for line in mapped_file if not line.startswith("#"))